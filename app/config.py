@@ -1,4 +1,5 @@
 import os
+from typing import Literal, Optional
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from dotenv import load_dotenv
 
@@ -7,10 +8,155 @@ load_dotenv()
 class Settings(BaseSettings):
     OPENAI_API_KEY: str = os.getenv("OPENAI_API_KEY", "")
     OPENAI_MODEL: str = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+    OPENAI_BASE_URL: Optional[str] = os.getenv("OPENAI_BASE_URL") or None
     MONGO_URI: str = os.getenv("MONGO_URI")
     MONOGO_DB_NAME: str = os.getenv("MONGO_DB_NAME", "")
 
+    # MongoDB client: connection pool, timeouts (seconds, 0 = driver default),
+    # read preference and write concern ("" = server default)
+    MONGO_MAX_POOL_SIZE: int = int(os.getenv("MONGO_MAX_POOL_SIZE", "100"))
+    MONGO_MIN_POOL_SIZE: int = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+    MONGO_MAX_IDLE_TIME: float = float(os.getenv("MONGO_MAX_IDLE_TIME", "0"))
+    MONGO_CONNECT_TIMEOUT: float = float(os.getenv("MONGO_CONNECT_TIMEOUT", "5"))
+    MONGO_SERVER_SELECTION_TIMEOUT: float = float(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT", "10"))
+    MONGO_SOCKET_TIMEOUT: float = float(os.getenv("MONGO_SOCKET_TIMEOUT", "0"))
+    MONGO_WAIT_QUEUE_TIMEOUT: float = float(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT", "0"))
+    MONGO_READ_PREFERENCE: Literal[
+        "primary", "primaryPreferred", "secondary", "secondaryPreferred", "nearest"
+    ] = os.getenv("MONGO_READ_PREFERENCE", "primary")
+    # "majority", or a number of nodes
+    MONGO_WRITE_CONCERN: str = os.getenv("MONGO_WRITE_CONCERN", "")
+    MONGO_WRITE_TIMEOUT: float = float(os.getenv("MONGO_WRITE_TIMEOUT", "0"))
+    # Create collection indexes at startup. Off by default so a fleet of
+    # workers starting at once doesn't send the same createIndexes; enable it
+    # on one instance or run `python -m app.database` once per deploy instead
+    MONGO_CREATE_INDEXES: bool = os.getenv("MONGO_CREATE_INDEXES", "false").lower() in ("1", "true", "yes")
+
+    # LLM HTTP client: shared connection pool, keep-alive, timeouts and retries
+    LLM_TIMEOUT: float = float(os.getenv("LLM_TIMEOUT", "60"))
+    LLM_CONNECT_TIMEOUT: float = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+    # Client-level retries; the LLM scheduler already retries 429/5xx with backoff
+    LLM_MAX_RETRIES: int = int(os.getenv("LLM_MAX_RETRIES", "0"))
+    LLM_MAX_CONNECTIONS: int = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+    LLM_MAX_KEEPALIVE_CONNECTIONS: int = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "20"))
+    LLM_KEEPALIVE_EXPIRY: float = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "30"))
+
+    # LLM providers besides "openai" (configured above): "name=base_url,..." for
+    # OpenAI-compatible servers, or "name=fake" for the in-process fake.
+    # Routes are "provider/model"; a bare model name uses LLM_DEFAULT_PROVIDER
+    LLM_PROVIDERS: str = os.getenv("LLM_PROVIDERS", "")
+    LLM_DEFAULT_PROVIDER: str = os.getenv("LLM_DEFAULT_PROVIDER", "openai")
+    # "max_context_tokens=route,...": the smallest threshold covering the context wins
+    LLM_ROUTES: str = os.getenv("LLM_ROUTES", "")
+    # Calls slower than LLM_HEDGE_DELAY seconds, or failing, are also sent to LLM_HEDGE_ROUTE (empty = off)
+    LLM_HEDGE_ROUTE: str = os.getenv("LLM_HEDGE_ROUTE", "")
+    LLM_HEDGE_DELAY: float = float(os.getenv("LLM_HEDGE_DELAY", "2"))
+
+    # LLM scheduler: concurrency cap, provider rate limits (0 = unlimited),
+    # bounded fair queue, and retries of 429/5xx with jittered backoff
+    LLM_MAX_CONCURRENCY: int = int(os.getenv("LLM_MAX_CONCURRENCY", "32"))
+    LLM_REQUESTS_PER_MINUTE: float = float(os.getenv("LLM_REQUESTS_PER_MINUTE", "0"))
+    LLM_TOKENS_PER_MINUTE: float = float(os.getenv("LLM_TOKENS_PER_MINUTE", "0"))
+    LLM_MAX_QUEUE: int = int(os.getenv("LLM_MAX_QUEUE", "1000"))
+    LLM_QUEUE_TIMEOUT: float = float(os.getenv("LLM_QUEUE_TIMEOUT", "30"))
+    LLM_RETRY_ATTEMPTS: int = int(os.getenv("LLM_RETRY_ATTEMPTS", "3"))
+    LLM_RETRY_BACKOFF: float = float(os.getenv("LLM_RETRY_BACKOFF", "0.5"))
+
+    # Message storage: "embedded" keeps messages on the conversation document,
+    # "bucketed" stores them in fixed-size buckets in a separate collection
+    MESSAGE_STORAGE: Literal["embedded", "bucketed"] = os.getenv("MESSAGE_STORAGE", "embedded")
+    MESSAGE_BUCKET_SIZE: int = int(os.getenv("MESSAGE_BUCKET_SIZE", "100"))
+    MESSAGE_PAGE_SIZE: int = int(os.getenv("MESSAGE_PAGE_SIZE", "50"))
+
+    # Background audit writer: bounded queue drained in batches by a worker
+    AUDIT_QUEUE_SIZE: int = int(os.getenv("AUDIT_QUEUE_SIZE", "10000"))
+    AUDIT_BATCH_SIZE: int = int(os.getenv("AUDIT_BATCH_SIZE", "100"))
+    AUDIT_FLUSH_INTERVAL: float = float(os.getenv("AUDIT_FLUSH_INTERVAL", "1.0"))
+    AUDIT_OVERFLOW: Literal["block", "drop", "spill"] = os.getenv("AUDIT_OVERFLOW", "block")
+    # Each process spills to "<AUDIT_SPILL_PATH>.<pid>"
+    AUDIT_SPILL_PATH: str = os.getenv("AUDIT_SPILL_PATH", "audit_spill.jsonl")
+    AUDIT_MASK_EXECUTOR: Literal["thread", "process"] = os.getenv("AUDIT_MASK_EXECUTOR", "thread")
+    AUDIT_MASK_WORKERS: int = int(os.getenv("AUDIT_MASK_WORKERS", "2"))
+    # Stored audit fields are capped: the prompt keeps its tail, the response its head
+    AUDIT_PROMPT_CHARS: int = int(os.getenv("AUDIT_PROMPT_CHARS", "2000"))
+    AUDIT_RESPONSE_CHARS: int = int(os.getenv("AUDIT_RESPONSE_CHARS", "2000"))
+
+    # Audit retention: a TTL backstop on raw records (0 = keep forever), and a
+    # background job moving records older than AUDIT_ARCHIVE_AFTER_DAYS into
+    # per-day rollups and gzip JSONL segments under AUDIT_ARCHIVE_DIR
+    AUDIT_RETENTION_DAYS: float = float(os.getenv("AUDIT_RETENTION_DAYS", "0"))
+    AUDIT_ARCHIVE_ENABLED: bool = os.getenv("AUDIT_ARCHIVE_ENABLED", "false").lower() in ("1", "true", "yes")
+    AUDIT_ARCHIVE_AFTER_DAYS: int = int(os.getenv("AUDIT_ARCHIVE_AFTER_DAYS", "30"))
+    AUDIT_ARCHIVE_DIR: str = os.getenv("AUDIT_ARCHIVE_DIR", "audit_archive")
+    AUDIT_ARCHIVE_INTERVAL: float = float(os.getenv("AUDIT_ARCHIVE_INTERVAL", "3600"))
+
+    # LLM context: history is fitted into a per-model token budget.
+    # CONTEXT_TOKEN_BUDGETS is "model=tokens,..."; models not listed get their
+    # context window minus CONTEXT_RESPONSE_TOKENS
+    CONTEXT_TOKEN_BUDGETS: str = os.getenv("CONTEXT_TOKEN_BUDGETS", "")
+    CONTEXT_RESPONSE_TOKENS: int = int(os.getenv("CONTEXT_RESPONSE_TOKENS", "1024"))
+    CONTEXT_STRATEGY: Literal["last_n", "head_tail"] = os.getenv("CONTEXT_STRATEGY", "last_n")
+    CONTEXT_MAX_MESSAGES: int = int(os.getenv("CONTEXT_MAX_MESSAGES", "0"))  # 0 = no limit
+    CONTEXT_HEAD_MESSAGES: int = int(os.getenv("CONTEXT_HEAD_MESSAGES", "2"))
+    CONTEXT_TOKEN_CACHE_SIZE: int = int(os.getenv("CONTEXT_TOKEN_CACHE_SIZE", "65536"))
+    # Pinned system prompt sent ahead of every context (empty = none)
+    SYSTEM_PROMPT: str = os.getenv("SYSTEM_PROMPT", "")
+
+    # Rolling summarization: once more than SUMMARY_TRIGGER_MESSAGES messages are
+    # not summarized yet, older ones are folded into a stored running summary
+    SUMMARY_ENABLED: bool = os.getenv("SUMMARY_ENABLED", "false").lower() in ("1", "true", "yes")
+    SUMMARY_MODEL: str = os.getenv("SUMMARY_MODEL", "")  # a route; empty = the default route
+    SUMMARY_TRIGGER_MESSAGES: int = int(os.getenv("SUMMARY_TRIGGER_MESSAGES", "40"))
+    SUMMARY_KEEP_RECENT: int = int(os.getenv("SUMMARY_KEEP_RECENT", "10"))
+    SUMMARY_CHUNK_MESSAGES: int = int(os.getenv("SUMMARY_CHUNK_MESSAGES", "50"))
+
+    # Completion cache for byte-identical contexts: an in-process LRU, plus an
+    # optional MongoDB tier shared by all instances
+    COMPLETION_CACHE_ENABLED: bool = os.getenv("COMPLETION_CACHE_ENABLED", "false").lower() in ("1", "true", "yes")
+    COMPLETION_CACHE_TTL: float = float(os.getenv("COMPLETION_CACHE_TTL", "3600"))
+    COMPLETION_CACHE_MAX_ENTRIES: int = int(os.getenv("COMPLETION_CACHE_MAX_ENTRIES", "1000"))
+    COMPLETION_CACHE_MAX_BYTES: int = int(os.getenv("COMPLETION_CACHE_MAX_BYTES", str(10 * 1024 * 1024)))
+    COMPLETION_CACHE_SHARED: bool = os.getenv("COMPLETION_CACHE_SHARED", "false").lower() in ("1", "true", "yes")
+
+    # In-process cache of conversation documents, checked against the stored version on every read
+    CONVERSATION_CACHE_ENABLED: bool = os.getenv("CONVERSATION_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+    CONVERSATION_CACHE_MAX_ENTRIES: int = int(os.getenv("CONVERSATION_CACHE_MAX_ENTRIES", "1000"))
+    CONVERSATION_CACHE_MAX_BYTES: int = int(os.getenv("CONVERSATION_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+    # Identical prompts to a conversation within this many seconds share one result
+    PROMPT_DEDUP_WINDOW: float = float(os.getenv("PROMPT_DEDUP_WINDOW", "2"))
+    # How long responses to requests with an Idempotency-Key are kept
+    IDEMPOTENCY_TTL: float = float(os.getenv("IDEMPOTENCY_TTL", "86400"))
+
+    # Batch prompts: items processed at once, and how completed turns are flushed in bulk
+    BATCH_MAX_ITEMS: int = int(os.getenv("BATCH_MAX_ITEMS", "1000"))
+    BATCH_MAX_PARALLEL: int = int(os.getenv("BATCH_MAX_PARALLEL", "8"))
+    BATCH_WRITE_SIZE: int = int(os.getenv("BATCH_WRITE_SIZE", "50"))
+    BATCH_FLUSH_INTERVAL: float = float(os.getenv("BATCH_FLUSH_INTERVAL", "1.0"))
+
+    # Search: MongoDB text indexes on message content (each append re-indexes the
+    # conversation's, or in bucketed storage the bucket's, messages), and an
+    # optional local embedding index, which needs numpy
+    SEARCH_TEXT_ENABLED: bool = os.getenv("SEARCH_TEXT_ENABLED", "true").lower() in ("1", "true", "yes")
+    SEARCH_EMBEDDINGS_ENABLED: bool = os.getenv("SEARCH_EMBEDDINGS_ENABLED", "false").lower() in ("1", "true", "yes")
+    # "openai" calls the embeddings API with the OPENAI_* client; "hashing" is local and lexical
+    SEARCH_EMBEDDER: Literal["openai", "hashing"] = os.getenv("SEARCH_EMBEDDER", "openai")
+    SEARCH_EMBEDDING_MODEL: str = os.getenv("SEARCH_EMBEDDING_MODEL", "text-embedding-3-small")
+    SEARCH_HASHING_DIM: int = int(os.getenv("SEARCH_HASHING_DIM", "512"))
+    SEARCH_INDEX_DIR: str = os.getenv("SEARCH_INDEX_DIR", "search_index")
+    SEARCH_INDEX_BATCH: int = int(os.getenv("SEARCH_INDEX_BATCH", "64"))
+    SEARCH_INDEX_QUEUE: int = int(os.getenv("SEARCH_INDEX_QUEUE", "10000"))
+    # Seconds a semantic search may scan before returning what it found so far
+    SEARCH_BUDGET: float = float(os.getenv("SEARCH_BUDGET", "0.5"))
+
+    # Metrics: GET /metrics (exporter "prometheus") and/or periodic JSON log lines ("log")
+    METRICS_ENABLED: bool = os.getenv("METRICS_ENABLED", "false").lower() in ("1", "true", "yes")
+    METRICS_EXPORTERS: str = os.getenv("METRICS_EXPORTERS", "prometheus")
+    METRICS_LOG_INTERVAL: float = float(os.getenv("METRICS_LOG_INTERVAL", "60"))
+
+    # Comma-separated PII masking rule sets, applied in order (see app/services/masking.py)
+    MASKING_RULE_SETS: str = os.getenv("MASKING_RULE_SETS", "sg")
+
     model_config = SettingsConfigDict(env_file=".env", extra="ignore")
 
 settings = Settings()
-print(settings.OPENAI_API_KEY)
\ No newline at end of file
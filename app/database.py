@@ -1,13 +1,85 @@
-import os
+import asyncio
 import motor.motor_asyncio
 from beanie import init_beanie
+from typing import Any, Dict, Optional
 from app.config import settings
-from app.models import Conversation, AuditLog
+from app.metrics import MongoCommandMetrics, metrics
+from app.models import Conversation, AuditLog, AuditRollup, CompletionCacheEntry, IdempotencyRecord, MessageBucket
 
 MONGO_DETAILS = settings.MONGO_URI
 
-async def init_db():
-    client = motor.motor_asyncio.AsyncIOMotorClient(MONGO_DETAILS)
+DOCUMENT_MODELS = [Conversation, AuditLog, AuditRollup, MessageBucket, CompletionCacheEntry, IdempotencyRecord]
+
+# The process-wide client, set by init_db and released by close_db
+_client: Optional[motor.motor_asyncio.AsyncIOMotorClient] = None
+
+
+def client_options() -> Dict[str, Any]:
+    """
+    Driver options from settings. Unset values are left out, so options in
+    the connection string (or the driver's defaults) still apply.
+    """
+    options: Dict[str, Any] = {
+        "maxPoolSize": settings.MONGO_MAX_POOL_SIZE,
+        "minPoolSize": settings.MONGO_MIN_POOL_SIZE,
+        "readPreference": settings.MONGO_READ_PREFERENCE,
+    }
+    for option, seconds in (
+        ("maxIdleTimeMS", settings.MONGO_MAX_IDLE_TIME),
+        ("connectTimeoutMS", settings.MONGO_CONNECT_TIMEOUT),
+        ("serverSelectionTimeoutMS", settings.MONGO_SERVER_SELECTION_TIMEOUT),
+        ("socketTimeoutMS", settings.MONGO_SOCKET_TIMEOUT),
+        ("waitQueueTimeoutMS", settings.MONGO_WAIT_QUEUE_TIMEOUT),
+        ("wTimeoutMS", settings.MONGO_WRITE_TIMEOUT),
+    ):
+        if seconds > 0:
+            options[option] = int(seconds * 1000)
+    if settings.MONGO_WRITE_CONCERN:
+        w = settings.MONGO_WRITE_CONCERN
+        options["w"] = int(w) if w.isdigit() else w
+    # The command listener is only attached while metrics are enabled
+    if metrics.enabled:
+        options["event_listeners"] = [MongoCommandMetrics()]
+    return options
+
+
+def get_client() -> motor.motor_asyncio.AsyncIOMotorClient:
+    if _client is None:
+        raise RuntimeError("The database is not initialized; call init_db() first")
+    return _client
+
+
+async def init_db(create_indexes: Optional[bool] = None):
+    """
+    Connects and registers the document models. Indexes are only created
+    when `create_indexes` (default: MONGO_CREATE_INDEXES) is true. Calling
+    it again reuses the open client.
+    """
+    global _client
+    if create_indexes is None:
+        create_indexes = settings.MONGO_CREATE_INDEXES
+    if _client is None:
+        _client = motor.motor_asyncio.AsyncIOMotorClient(MONGO_DETAILS, **client_options())
     # Using the default database from the connection string
-    db = client[settings.MONOGO_DB_NAME]
-    await init_beanie(database=db, document_models=[Conversation, AuditLog])
+    db = _client[settings.MONOGO_DB_NAME]
+    await init_beanie(database=db, document_models=DOCUMENT_MODELS, skip_indexes=not create_indexes)
+
+
+async def close_db():
+    """
+    Closes the client and its pooled connections.
+    """
+    global _client
+    if _client is not None:
+        _client.close()
+        _client = None
+
+
+async def main():
+    await init_db(create_indexes=True)
+    await close_db()
+    print(f"Indexes are up to date for {len(DOCUMENT_MODELS)} collections.")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,20 +1,44 @@
 from fastapi import FastAPI
 from contextlib import asynccontextmanager
-from app.database import init_db
+from app.database import close_db, init_db
+from app.metrics import MetricsMiddleware, PrometheusExporter, exporters, metrics
+from app.services import llm_services
+from app.services.llm_services import (
+    audit_archiver, audit_writer, embedding_indexer, init_llm_client, close_llm_client, summarizer
+)
 from .config import settings
-from app.routers import audit, conversation
+from app.responses import ORJSONResponse
+from app.routers import audit, conversation, search
+from app.routers import metrics as metrics_router
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Startup: Initialize the database
+    # Startup: Initialize the database, the shared LLM client, the audit
+    # writer, audit retention and the search indexer
     await init_db()
+    await init_llm_client()
+    await audit_writer.start()
+    await audit_archiver.start()
+    await embedding_indexer.start()
+    for exporter in exporters:
+        await exporter.start(metrics)
     yield
-    # Shutdown: Clean up code here
+    # Shutdown: Finish running summaries, index queued messages and flush
+    # pending audit logs, then release pooled LLM and MongoDB connections
+    for exporter in exporters:
+        await exporter.stop()
+    await audit_archiver.stop()
+    await summarizer.stop()
+    await embedding_indexer.stop()
+    await audit_writer.stop()
+    await close_llm_client()
+    await close_db()
 
 app = FastAPI(
     title="LLM Conversations API",
     version="1.0.0",
     description="MVP Backend to manage LLM-based conversations",
+    default_response_class=ORJSONResponse,
     lifespan=lifespan
 )
 
@@ -22,6 +46,41 @@ app = FastAPI(
 async def root():
     return {"message": "Hello World"}
 
+
+def register_stats_metrics():
+    """
+    Reports the counters the services already keep. Read at scrape time
+    through the modules, so replaced singletons (e.g. in tests) are picked up.
+    """
+    metrics.register_stats("audit_writer", lambda: llm_services.audit_writer.stats, "Audit writer")
+    metrics.register_value("audit_queue_depth", "Audit entries waiting to be written",
+                           lambda: llm_services.audit_writer.queue_depth)
+    metrics.register_stats("audit_archive", lambda: llm_services.audit_archiver.stats, "Audit archive")
+    metrics.register_stats("llm_scheduler", lambda: llm_services.llm_scheduler.stats, "LLM scheduler")
+    metrics.register_value("llm_scheduler_active", "LLM calls holding a slot",
+                           lambda: llm_services.llm_scheduler.active)
+    metrics.register_value("llm_scheduler_waiting", "LLM calls waiting for a slot",
+                           lambda: llm_services.llm_scheduler.waiting)
+    metrics.register_stats("search_indexer", lambda: llm_services.embedding_indexer.stats, "Search indexer")
+    metrics.register_stats("llm_router", lambda: llm_services.llm_router.stats, "LLM router")
+    metrics.register_stats("completion_cache", lambda: llm_services.completion_cache.stats, "Completion cache")
+    metrics.register_stats("conversation_cache", lambda: llm_services.conversation_cache.stats, "Conversation cache")
+    metrics.register_value("conversation_cache_bytes", "Estimated size of cached conversations",
+                           lambda: llm_services.conversation_cache.size_bytes)
+    metrics.register_value("prompt_dedup_shared_total", "Prompts answered by an identical in-flight prompt",
+                           lambda: conversation.prompt_flights.shared, type="counter")
+    metrics.register_value("idempotency_replayed_total", "Prompts answered from a stored Idempotency-Key result",
+                           lambda: conversation.idempotency_store.replayed, type="counter")
+
+
 # print(f"DEBUG: MONGO_URI = {settings.MONGO_URI}")
 app.include_router(conversation.router)
 app.include_router(audit.router)
+app.include_router(search.router)
+
+# Nothing is installed while metrics are disabled, so they cost nothing
+if metrics.enabled:
+    register_stats_metrics()
+    app.add_middleware(MetricsMiddleware)
+    if any(isinstance(e, PrometheusExporter) for e in exporters):
+        app.include_router(metrics_router.router)
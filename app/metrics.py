@@ -0,0 +1,363 @@
+import asyncio
+import bisect
+import dataclasses
+import json
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Protocol, Sequence, Tuple
+
+from pymongo import monitoring
+
+from app.config import settings
+
+# Default latency buckets, in seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# (name, labels, value) samples of one metric family
+Sample = Tuple[str, Dict[str, str], float]
+
+
+@dataclasses.dataclass
+class MetricFamily:
+    name: str
+    type: str
+    help: str
+    samples: List[Sample]
+
+
+class Metric:
+    """
+    Base for labelled metrics. Label values are passed positionally, in
+    `labelnames` order. Updates may come from worker threads (e.g. MongoDB
+    command events), so they take a lock.
+    """
+
+    type = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def collect(self) -> MetricFamily:
+        raise NotImplementedError
+
+    def _labels(self, values: Tuple[str, ...]) -> Dict[str, str]:
+        return dict(zip(self.labelnames, values))
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, *labels: str):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def collect(self) -> MetricFamily:
+        with self._lock:
+            values = list(self._values.items())
+        return MetricFamily(self.name, self.type, self.help, [(self.name, self._labels(k), v) for k, v in values])
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(
+        self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS
+    ):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: non-cumulative bucket counts (last one is +Inf), sum
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, *labels: str):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = ([0] * (len(self.buckets) + 1), [0.0])
+            entry[0][index] += 1
+            entry[1][0] += value
+
+    def collect(self) -> MetricFamily:
+        with self._lock:
+            values = [(k, list(counts), total[0]) for k, (counts, total) in self._values.items()]
+        samples = []
+        for key, counts, total in values:
+            labels = self._labels(key)
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                samples.append((f"{self.name}_bucket", {**labels, "le": _format_bound(bound)}, cumulative))
+            samples.append((f"{self.name}_sum", labels, total))
+            samples.append((f"{self.name}_count", labels, cumulative))
+        return MetricFamily(self.name, self.type, self.help, samples)
+
+
+def _format_bound(bound: float) -> str:
+    return "+Inf" if bound == float("inf") else repr(float(bound))
+
+
+class MetricsRegistry:
+    """
+    Holds the app's metrics and the collectors that report existing stats
+    objects at scrape time.
+
+    When disabled, nothing is recorded: the middleware and the MongoDB
+    command listener are not installed, and hot paths skip their timing
+    behind a single `metrics.enabled` check.
+    """
+
+    def __init__(self, enabled: bool = True, prefix: str = "app"):
+        self.enabled = enabled
+        self.prefix = prefix
+        self._metrics: List[Metric] = []
+        self._collectors: List[Callable[[], Iterable[MetricFamily]]] = []
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._add(Counter(f"{self.prefix}_{name}", help, labelnames))
+
+    def histogram(
+        self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS
+    ) -> Histogram:
+        return self._add(Histogram(f"{self.prefix}_{name}", help, labelnames, buckets))
+
+    def register_collector(self, collector: Callable[[], Iterable[MetricFamily]]):
+        self._collectors.append(collector)
+
+    def register_stats(self, subsystem: str, get_stats: Callable[[], Any], help: str):
+        """
+        Reports the numeric fields of a stats dataclass. Running totals
+        become counters; `*_max` and `last_*` fields become gauges.
+        """
+        def collect():
+            stats = get_stats()
+            for field in dataclasses.fields(stats):
+                value = getattr(stats, field.name)
+                if not isinstance(value, (int, float)):
+                    continue
+                name = f"{self.prefix}_{subsystem}_{field.name}"
+                if field.name.endswith("_max") or field.name.startswith("last_"):
+                    yield MetricFamily(name, "gauge", f"{help}: {field.name}", [(name, {}, value)])
+                else:
+                    name = name if name.endswith("_total") else f"{name}_total"
+                    yield MetricFamily(name, "counter", f"{help}: {field.name}", [(name, {}, value)])
+        self.register_collector(collect)
+
+    def register_value(self, name: str, help: str, get_value: Callable[[], float], type: str = "gauge"):
+        """
+        Reports a single value read at scrape time, e.g. a queue depth or a
+        counter kept by another object.
+        """
+        full_name = f"{self.prefix}_{name}"
+        self.register_collector(lambda: [MetricFamily(full_name, type, help, [(full_name, {}, get_value())])])
+
+    def collect(self) -> List[MetricFamily]:
+        families = [m.collect() for m in self._metrics]
+        for collector in self._collectors:
+            try:
+                families.extend(collector())
+            except Exception as e:
+                # A broken collector must not take the whole scrape down
+                print(e)
+        return families
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+
+class Exporter(Protocol):
+    """
+    Publishes the registry somewhere. Pull exporters only render on demand;
+    push exporters also run between start() and stop().
+    """
+
+    async def start(self, registry: MetricsRegistry) -> None:
+        ...
+
+    async def stop(self) -> None:
+        ...
+
+
+class PrometheusExporter:
+    """
+    Serves the registry in the Prometheus text format on GET /metrics.
+    """
+
+    async def start(self, registry: MetricsRegistry) -> None:
+        pass
+
+    async def stop(self) -> None:
+        pass
+
+    @staticmethod
+    def render(registry: MetricsRegistry) -> str:
+        lines = []
+        for family in registry.collect():
+            lines.append(f"# HELP {family.name} {_escape_help(family.help)}")
+            lines.append(f"# TYPE {family.name} {family.type}")
+            for name, labels, value in family.samples:
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+class LogExporter:
+    """
+    Prints a JSON snapshot of every sample each `interval` seconds, for
+    deployments that scrape logs rather than endpoints.
+    """
+
+    def __init__(self, interval: float = 60.0):
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self, registry: MetricsRegistry) -> None:
+        self._task = asyncio.create_task(self._run(registry))
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self, registry: MetricsRegistry):
+        while True:
+            await asyncio.sleep(self.interval)
+            print(json.dumps(self.snapshot(registry)))
+
+    @staticmethod
+    def snapshot(registry: MetricsRegistry) -> Dict[str, Any]:
+        return {
+            "metrics": [
+                {"name": name, "labels": labels, "value": value}
+                for family in registry.collect()
+                for name, labels, value in family.samples
+            ]
+        }
+
+
+EXPORTERS: Dict[str, Callable[[], Exporter]] = {
+    "prometheus": PrometheusExporter,
+    "log": lambda: LogExporter(settings.METRICS_LOG_INTERVAL),
+}
+
+
+def build_exporters(names: str) -> List[Exporter]:
+    exporters = []
+    for name in (n.strip() for n in names.split(",")):
+        if not name:
+            continue
+        if name not in EXPORTERS:
+            raise ValueError(f"Unknown metrics exporter: {name}")
+        exporters.append(EXPORTERS[name]())
+    return exporters
+
+
+def _escape_help(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("\n", "\\n")
+
+
+def _escape_label(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape_label(v)}"' for k, v in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, bool):
+        return str(int(value))
+    if isinstance(value, int) or float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware timing every HTTP request by method, route template
+    (not the raw path, to keep label sets bounded) and status code. Streamed
+    responses are timed until their last chunk is sent.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            HTTP_REQUEST_SECONDS.observe(time.perf_counter() - start, scope["method"], path, str(status))
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """
+    Times every MongoDB command the driver sends, by command name.
+    """
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        MONGO_COMMAND_SECONDS.observe(event.duration_micros / 1e6, event.command_name, "ok")
+
+    def failed(self, event):
+        MONGO_COMMAND_SECONDS.observe(event.duration_micros / 1e6, event.command_name, "error")
+
+
+metrics = MetricsRegistry(enabled=settings.METRICS_ENABLED)
+exporters = build_exporters(settings.METRICS_EXPORTERS) if metrics.enabled else []
+
+HTTP_REQUEST_SECONDS = metrics.histogram(
+    "http_request_duration_seconds", "HTTP request latency", ("method", "route", "status")
+)
+LLM_REQUEST_SECONDS = metrics.histogram(
+    "llm_request_duration_seconds",
+    "LLM call latency, including scheduler queueing and retries",
+    ("model", "mode", "outcome"),
+)
+LLM_TOKENS = metrics.counter("llm_tokens_total", "Tokens reported by the LLM API", ("model", "kind"))
+MONGO_COMMAND_SECONDS = metrics.histogram(
+    "mongo_command_duration_seconds", "MongoDB command latency", ("command", "outcome")
+)
+AUDIT_MASK_SECONDS = metrics.histogram("audit_mask_duration_seconds", "Time to mask one audit batch")
+AUDIT_WRITE_SECONDS = metrics.histogram("audit_write_duration_seconds", "Time to write one audit batch")
+
+
+def record_llm_usage(model: str, usage: Any):
+    """
+    Counts tokens from a completion's `usage`, when the API reported it.
+    """
+    if usage is None:
+        return
+    for kind in ("prompt_tokens", "completion_tokens"):
+        value = getattr(usage, kind, None)
+        if isinstance(value, int):
+            LLM_TOKENS.inc(value, model, kind.replace("_tokens", ""))
@@ -1,32 +1,241 @@
 from enum import Enum
-from beanie import Document
+from beanie import Document, PydanticObjectId
+from beanie.odm.utils.encoder import Encoder
 from datetime import datetime, timezone
-from pydantic import BaseModel, Field
-from typing import List, Optional
+from pydantic import BaseModel, Field, PrivateAttr
+from typing import Any, Dict, List, Optional
+from pymongo import ASCENDING, DESCENDING, TEXT, IndexModel, ReturnDocument
+from pymongo.errors import DuplicateKeyError
 from uuid import uuid4
+from app.config import settings
+
+# Characters of the latest message kept on the conversation for list views
+LAST_MESSAGE_PREVIEW_CHARS = 200
+
+# Text indexes for GET /search. MongoDB re-indexes a document's whole message
+# array on every append, so they are optional
+SEARCH_TEXT_INDEXES = settings.SEARCH_TEXT_ENABLED
 
 class RoleEnum(str, Enum):
     user = "user"
     assistant = "assistant"
 
+class StorageMode(str, Enum):
+    embedded = "embedded"
+    bucketed = "bucketed"
+
 class Message(BaseModel):
     role: RoleEnum
     content: str
     timestamp: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
+class StoredMessage(Message):
+    seq: int
+
+class MessageBucket(Document):
+    """
+    A fixed-size slice of a conversation's messages, used in bucketed storage.
+    Message `seq` lives in bucket `seq // bucket_size`.
+    """
+    conversation_id: PydanticObjectId
+    bucket: int
+    messages: List[StoredMessage] = []
+
+    class Settings:
+        name = "message_buckets"
+        indexes = [
+            IndexModel([("conversation_id", ASCENDING), ("bucket", ASCENDING)], unique=True),
+        ] + ([IndexModel([("messages.content", TEXT)], name="search_text")] if SEARCH_TEXT_INDEXES else [])
+
+    @classmethod
+    async def push(cls, conversation_id: PydanticObjectId, bucket: int, messages: List[StoredMessage]):
+        query = {"conversation_id": conversation_id, "bucket": bucket}
+        update = {"$push": {"messages": {"$each": [Encoder().encode(m) for m in messages]}}}
+        try:
+            await cls.get_motor_collection().update_one(query, update, upsert=True)
+        except DuplicateKeyError:
+            # Lost the race to create this bucket; it exists now, so push into it
+            await cls.get_motor_collection().update_one(query, update)
+
 class Conversation(Document):
     conversation_id: str = Field(default_factory=lambda: str(uuid4()))
     title: str
     messages: List[Message] = []
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    version: int = 0
+    storage: StorageMode = StorageMode.embedded
+    bucket_size: int = Field(default_factory=lambda: settings.MESSAGE_BUCKET_SIZE)
+    # Only maintained in bucketed storage; embedded conversations use len(messages)
+    message_count: int = 0
+    # Truncated copy of the latest message, so listings never read `messages`
+    last_message: Optional[Message] = None
+    # Running summary of messages [0, summary_upto), maintained by the summarizer
+    summary: Optional[str] = None
+    summary_upto: int = 0
+    # LLM route for this conversation ("provider/model" or a model name); None = routing rules
+    model: Optional[str] = None
+    # False once a write shows another writer changed the document since it was read
+    _in_sync: bool = PrivateAttr(default=True)
 
     class Settings:
         name = "conversations"
+        indexes = [
+            # Keyset pagination for GET /conversations
+            IndexModel([("updated_at", DESCENDING), ("_id", DESCENDING)]),
+        ] + ([IndexModel([("title", TEXT), ("messages.content", TEXT)], name="search_text")] if SEARCH_TEXT_INDEXES else [])
+
+    @property
+    def in_sync(self) -> bool:
+        """
+        True while this object mirrors the stored document at `version`:
+        it was loaded (or created) here and only changed by its own writes.
+        """
+        return self._in_sync
+
+    def snapshot(self) -> "Conversation":
+        """
+        Returns a copy whose message list can be appended to independently.
+        Messages themselves are shared; they are never modified in place.
+        """
+        return self.model_copy(update={"messages": list(self.messages)})
+
+    def total_messages(self) -> int:
+        if self.storage == StorageMode.bucketed:
+            return self.message_count
+        return len(self.messages)
+
+    async def append_messages(
+        self, message: Message, *more: Message, expected_version: Optional[int] = None
+    ) -> bool:
+        """
+        Atomically appends messages with a single `$push` (plus `updated_at`
+        and `version` bumps) instead of rewriting the whole document, so each
+        turn writes O(1) bytes and concurrent appends never drop messages.
+        In bucketed storage the conversation only reserves sequence numbers
+        and the messages are pushed into their buckets.
+
+        When `expected_version` is given the append only applies if nobody
+        else has written since that version (optimistic concurrency).
+        Returns False on a version conflict, True otherwise.
+        """
+        messages = (message, *more)
+        now = datetime.now(timezone.utc)
+        last = messages[-1]
+        preview = Message(role=last.role, content=last.content[:LAST_MESSAGE_PREVIEW_CHARS], timestamp=last.timestamp)
+
+        read_version = self.version
+
+        # The storage mode is part of the filter so an append prepared against a
+        # stale mode (e.g. the conversation was migrated meanwhile) never lands
+        # in the wrong place. On a mismatch, reload and retry in the new mode.
+        for _ in range(2):
+            query = {"_id": self.id}
+            if self.storage == StorageMode.bucketed:
+                query["storage"] = StorageMode.bucketed.value
+                update = {"$inc": {"message_count": len(messages), "version": 1}}
+            else:
+                # Documents written before storage modes existed have no `storage` field
+                query["storage"] = {"$in": [StorageMode.embedded.value, None]}
+                update = {
+                    "$push": {"messages": {"$each": [Encoder().encode(m) for m in messages]}},
+                    "$inc": {"version": 1},
+                }
+            update["$set"] = {"updated_at": now, "last_message": Encoder().encode(preview)}
+            if expected_version is not None:
+                # Documents written before versioning have no `version` field yet
+                query["version"] = expected_version if expected_version else {"$in": [0, None]}
+
+            result = await self.get_motor_collection().find_one_and_update(
+                query,
+                update,
+                projection={"version": 1, "message_count": 1},
+                return_document=ReturnDocument.AFTER,
+            )
+            if result is not None or expected_version is not None:
+                break
+            fresh = await Conversation.get(self.id)
+            if fresh is None or fresh.storage == self.storage:
+                break
+            self.storage = fresh.storage
+            self.bucket_size = fresh.bucket_size
+            self.message_count = fresh.message_count
+            self.messages = fresh.messages
+            self.version = fresh.version
+            self._in_sync = False
+
+        if result is None:
+            return False
 
-    def add_message(self, message: Message):
-        self.messages.append(message)
-        self.updated_at=datetime.now(timezone.utc)
+        if self.storage == StorageMode.bucketed:
+            first_seq = result["message_count"] - len(messages)
+            by_bucket: Dict[int, List[StoredMessage]] = {}
+            for offset, m in enumerate(messages):
+                seq = first_seq + offset
+                by_bucket.setdefault(seq // self.bucket_size, []).append(
+                    StoredMessage(role=m.role, content=m.content, timestamp=m.timestamp, seq=seq)
+                )
+            for bucket, stored in by_bucket.items():
+                await MessageBucket.push(self.id, bucket, stored)
+            self.message_count = result["message_count"]
+        else:
+            self.messages.extend(messages)
+
+        self.updated_at = now
+        self.last_message = preview
+        self.version = result["version"]
+        if self.version != read_version + 1:
+            self._in_sync = False
+        return True
+
+    async def set_fields(self, changes: Dict[str, Any]):
+        """
+        `$set`s only the given fields (plus a `version` bump), so concurrent
+        message appends are kept and the messages are not read back.
+        """
+        read_version = self.version
+        result = await self.get_motor_collection().find_one_and_update(
+            {"_id": self.id},
+            {"$set": changes, "$inc": {"version": 1}},
+            projection={"version": 1},
+            return_document=ReturnDocument.AFTER,
+        )
+        if result is None:
+            return
+        for field, value in changes.items():
+            setattr(self, field, value)
+        self.version = result["version"]
+        if self.version != read_version + 1:
+            self._in_sync = False
+
+    async def read_messages(self, start: int = 0, end: Optional[int] = None) -> List[Message]:
+        """
+        Returns messages with sequence numbers in [start, end).
+        In bucketed storage only the buckets covering the range are fetched.
+        """
+        if self.storage == StorageMode.embedded:
+            return self.messages[start:end]
+
+        end = self.message_count if end is None else min(end, self.message_count)
+        if start >= end:
+            return []
+        first_bucket, last_bucket = start // self.bucket_size, (end - 1) // self.bucket_size
+        buckets = await MessageBucket.find(
+            MessageBucket.conversation_id == self.id,
+            MessageBucket.bucket >= first_bucket,
+            MessageBucket.bucket <= last_bucket,
+        ).to_list()
+        # Concurrent appenders may push out of order, so order by seq on read
+        stored = sorted((m for b in buckets for m in b.messages), key=lambda m: m.seq)
+        return [m for m in stored if start <= m.seq < end]
+
+    async def last_messages(self, k: int) -> List[Message]:
+        total = self.total_messages()
+        return await self.read_messages(max(0, total - k), total)
+
+    async def delete_messages(self):
+        if self.storage == StorageMode.bucketed:
+            await MessageBucket.find(MessageBucket.conversation_id == self.id).delete()
 
 class AuditLog(Document):
     og_id: str = Field(default_factory=lambda: str(uuid4()))
@@ -37,3 +246,66 @@ class AuditLog(Document):
 
     class Settings:
         name = "audit_logs"
+        indexes = [
+            # Per-conversation and time-range queries, paginated on (timestamp, _id)
+            IndexModel([("conversation_id", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)]),
+            IndexModel([("timestamp", DESCENDING), ("_id", DESCENDING)]),
+        ]
+
+class AuditRollup(Document):
+    """
+    Per-conversation, per-day totals of archived audit logs (see
+    app/services/audit_archive.py). Tokens are estimated from the stored,
+    masked and truncated text.
+    """
+    conversation_id: Optional[str]
+    day: datetime
+    records: int = 0
+    prompt_bytes: int = 0
+    response_bytes: int = 0
+    prompt_tokens: int = 0
+    response_tokens: int = 0
+    first_timestamp: Optional[datetime] = None
+    last_timestamp: Optional[datetime] = None
+
+    class Settings:
+        name = "audit_rollups"
+        indexes = [
+            IndexModel([("conversation_id", ASCENDING), ("day", DESCENDING)], unique=True),
+            IndexModel([("day", DESCENDING)]),
+        ]
+
+class CompletionCacheEntry(Document):
+    """
+    Shared tier of the completion cache. MongoDB's TTL monitor removes
+    entries once `expires_at` has passed.
+    """
+    key: str
+    value: str
+    expires_at: datetime
+
+    class Settings:
+        name = "completion_cache"
+        indexes = [
+            IndexModel([("key", ASCENDING)], unique=True),
+            IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0),
+        ]
+
+class IdempotencyRecord(Document):
+    """
+    Outcome of a request sent with an Idempotency-Key, so retries get the
+    stored response instead of being processed again. Expired by a TTL index.
+    """
+    key: str
+    scope: str
+    request_hash: str
+    completed: bool = False
+    response: Optional[Dict] = None
+    expires_at: datetime
+
+    class Settings:
+        name = "idempotency_keys"
+        indexes = [
+            IndexModel([("scope", ASCENDING), ("key", ASCENDING)], unique=True),
+            IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0),
+        ]
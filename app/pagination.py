@@ -0,0 +1,39 @@
+import base64
+import json
+from datetime import datetime
+from typing import Any, Dict, Tuple
+
+from beanie import PydanticObjectId
+from fastapi import HTTPException
+
+# Response header carrying the cursor for the next page, absent on the last page
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(sort_value: datetime, obj_id: PydanticObjectId) -> str:
+    """
+    Encodes the (sort field, _id) position of the last item on a page.
+    """
+    raw = json.dumps({"t": sort_value.isoformat(), "id": str(obj_id)})
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, PydanticObjectId]:
+    try:
+        raw = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(raw["t"]), PydanticObjectId(raw["id"])
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def keyset_after(field: str, cursor: str) -> Dict[str, Any]:
+    """
+    Query matching items strictly after `cursor` in (field DESC, _id DESC) order.
+    """
+    sort_value, obj_id = decode_cursor(cursor)
+    return {
+        "$or": [
+            {field: {"$lt": sort_value}},
+            {field: sort_value, "_id": {"$lt": obj_id}},
+        ]
+    }
@@ -0,0 +1,45 @@
+from typing import Any, Iterable, Optional, Set
+
+import orjson
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+
+# UTC datetimes end in "Z", matching what pydantic produces for response models
+ORJSON_OPTIONS = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS
+
+
+def dumps(content: Any) -> bytes:
+    return orjson.dumps(content, option=ORJSON_OPTIONS)
+
+
+def to_jsonable(content: Any) -> Any:
+    """
+    Converts a payload to plain JSON types (datetimes become strings), e.g.
+    before storing it to be replayed later.
+    """
+    return orjson.loads(dumps(content))
+
+
+class ORJSONResponse(JSONResponse):
+    """
+    Default response class. Endpoints that build their payload from stored
+    documents return it directly, which skips response-model validation;
+    the payload is encoded straight to bytes.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def parse_fields(fields: Optional[str], allowed: Iterable[str]) -> Optional[Set[str]]:
+    """
+    Parses a `fields=title,updated_at` query parameter. Returns None when
+    every field is wanted. `id` is always included.
+    """
+    if not fields:
+        return None
+    wanted = {f.strip() for f in fields.split(",") if f.strip()}
+    unknown = wanted - set(allowed)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+    return wanted | {"id"}
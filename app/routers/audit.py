@@ -1,10 +1,116 @@
-from fastapi import APIRouter
-from typing import List
-from app.models import AuditLog
+from datetime import datetime
+from fastapi import APIRouter, Query, Response
+from fastapi.responses import StreamingResponse
+from typing import Any, Dict, List, Optional
+from app.models import AuditLog, AuditRollup
+from app.pagination import NEXT_CURSOR_HEADER, encode_cursor, keyset_after
+from app.services import llm_services
 
 router = APIRouter(prefix="/audits", tags=["audits"])
 
+# Documents fetched per round-trip while exporting
+EXPORT_BATCH_SIZE = 500
+
+def _audit_filter(
+    conversation_id: Optional[str],
+    since: Optional[datetime],
+    until: Optional[datetime]
+) -> Dict[str, Any]:
+    query: Dict[str, Any] = {}
+    if conversation_id is not None:
+        query["conversation_id"] = conversation_id
+    if since is not None or until is not None:
+        query["timestamp"] = {}
+        if since is not None:
+            query["timestamp"]["$gte"] = since
+        if until is not None:
+            query["timestamp"]["$lt"] = until
+    return query
+
 @router.get("/", response_model=List[AuditLog])
-async def list_audits():
-    audits = await AuditLog.find().to_list()
+async def list_audits(
+    response: Response,
+    conversation_id: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None
+):
+    """
+    Lists audit logs, newest first, optionally filtered by conversation and
+    time range [since, until). Keyset-paginated on (timestamp, _id): the next
+    page's cursor is returned in the X-Next-Cursor header.
+    """
+    query = _audit_filter(conversation_id, since, until)
+    if cursor:
+        query = {"$and": [query, keyset_after("timestamp", cursor)]}
+
+    audits = await AuditLog.find(query).sort(
+        [("timestamp", -1), ("_id", -1)]
+    ).limit(limit + 1).to_list()
+
+    if len(audits) > limit:
+        audits = audits[:limit]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(audits[-1].timestamp, audits[-1].id)
     return audits
+
+@router.get("/export")
+async def export_audits(
+    conversation_id: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None
+):
+    """
+    Streams every matching audit log as NDJSON, oldest first, straight from
+    a MongoDB cursor so memory use stays constant regardless of volume.
+    """
+    query = _audit_filter(conversation_id, since, until)
+
+    async def ndjson_lines():
+        cursor = AuditLog.get_motor_collection().find(query).sort(
+            [("timestamp", 1), ("_id", 1)]
+        ).batch_size(EXPORT_BATCH_SIZE)
+        try:
+            async for doc in cursor:
+                yield AuditLog.model_validate(doc).model_dump_json() + "\n"
+        finally:
+            await cursor.close()
+
+    return StreamingResponse(ndjson_lines(), media_type="application/x-ndjson")
+
+@router.get("/archive")
+async def read_archived_audits(
+    conversation_id: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None
+):
+    """
+    Streams archived audit logs as NDJSON, in the export format, day by day.
+    Only the archive segments of matching days are read, and for a
+    conversation only its own part of each segment.
+    """
+    lines = llm_services.audit_archiver.read(conversation_id, since, until)
+    # A plain iterator: Starlette reads the files in its thread pool
+    return StreamingResponse(lines, media_type="application/x-ndjson")
+
+@router.get("/rollups", response_model=List[AuditRollup])
+async def list_audit_rollups(
+    conversation_id: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    limit: int = Query(100, ge=1, le=1000)
+):
+    """
+    Lists per-conversation, per-day totals of archived audit logs, newest
+    day first, for days in [since, until).
+    """
+    query: Dict[str, Any] = {}
+    if conversation_id is not None:
+        query["conversation_id"] = conversation_id
+    if since is not None or until is not None:
+        query["day"] = {}
+        if since is not None:
+            query["day"]["$gte"] = since
+        if until is not None:
+            query["day"]["$lt"] = until
+    return await AuditRollup.find(query).sort([("day", -1), ("_id", 1)]).limit(limit).to_list()
@@ -1,43 +1,152 @@
+import json
+import anyio
 from datetime import datetime, timezone
 from beanie import PydanticObjectId
-from fastapi import APIRouter, HTTPException, status
-from typing import List
+from fastapi import APIRouter, Header, HTTPException, Query, status
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+from typing import Any, Dict, List, Optional, Set
 
-from app.models import Conversation, Message
+from app.config import settings
+from app.models import LAST_MESSAGE_PREVIEW_CHARS, Conversation, Message, StorageMode
+from app.pagination import NEXT_CURSOR_HEADER, encode_cursor, keyset_after
+from app.responses import ORJSONResponse, dumps, parse_fields, to_jsonable
 from app.schemas import (
+    BatchPromptRequest,
     ConversationCreate,
     ConversationResponse,
+    ConversationSummary,
     ConversationUpdate,
     MessageCreate
 )
-from app.services.llm_services import get_llm_response
+from app.services.batch_prompts import batch_runner
+from app.services.idempotency import IdempotencyStore, request_hash
+from app.services.llm_services import (
+    context_builder,
+    conversation_cache,
+    embedding_indexer,
+    get_llm_response,
+    iter_llm_deltas,
+    open_llm_stream,
+    record_audit,
+    summarizer
+)
+from app.services.single_flight import SingleFlight
 
 router = APIRouter(prefix="/conversations", tags=["conversations"])
 
+# Concurrent identical prompts share one LLM call and one appended turn
+prompt_flights = SingleFlight(window=settings.PROMPT_DEDUP_WINDOW)
+idempotency_store = IdempotencyStore(ttl=settings.IDEMPOTENCY_TTL)
+
+FIELDS_DESCRIPTION = "Comma-separated fields to return, e.g. title,updated_at (id is always included)"
+
 @router.post("/", response_model=ConversationResponse, status_code=status.HTTP_201_CREATED)
 async def create_conversation(conv_data: ConversationCreate):
-    new_conv = Conversation(title=conv_data.title)
+    new_conv = Conversation(
+        title=conv_data.title, model=conv_data.model or None, storage=StorageMode(settings.MESSAGE_STORAGE)
+    )
     await new_conv.insert()
-    return await _build_conversation_response(new_conv)
+    conversation_cache.store(new_conv)
+    return ORJSONResponse(await _build_conversation_response(new_conv), status_code=status.HTTP_201_CREATED)
 
 
-@router.get("/", response_model=List[ConversationResponse])
-async def list_conversations():
-    conversations = await Conversation.find().to_list()
-    return [await _build_conversation_response(conv) for conv in conversations]
+@router.get("/", response_model=List[ConversationSummary])
+async def list_conversations(
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION)
+):
+    """
+    Lists conversation summaries, most recently updated first.
+    Pages are keyset-paginated on (updated_at, _id): when more results exist
+    the next page's cursor is returned in the X-Next-Cursor header.
+    Messages are never loaded; the projection runs inside MongoDB.
+    """
+    wanted = parse_fields(fields, ConversationSummary.model_fields)
+    projection = {
+        "title": 1,
+        "created_at": 1,
+        # Always projected: the next page's cursor is built from it
+        "updated_at": 1,
+        "message_count": {"$cond": [
+            {"$eq": ["$storage", StorageMode.bucketed.value]},
+            "$message_count",
+            {"$size": {"$ifNull": ["$messages", []]}},
+        ]},
+        # Conversations written before previews existed fall back to the last embedded message
+        "last_message": {"$ifNull": ["$last_message", {"$arrayElemAt": ["$messages", -1]}]},
+    }
+    if wanted is not None:
+        projection = {k: v for k, v in projection.items() if k in wanted or k == "updated_at"}
+
+    match = keyset_after("updated_at", cursor) if cursor else {}
+    pipeline = [
+        {"$match": match},
+        {"$sort": {"updated_at": -1, "_id": -1}},
+        {"$limit": limit + 1},
+        {"$project": projection},
+    ]
+    docs = await Conversation.get_motor_collection().aggregate(pipeline).to_list(length=None)
+
+    headers = {}
+    if len(docs) > limit:
+        docs = docs[:limit]
+        headers[NEXT_CURSOR_HEADER] = encode_cursor(docs[-1]["updated_at"], docs[-1]["_id"])
+
+    return ORJSONResponse([_summary_payload(doc, wanted) for doc in docs], headers=headers)
+
+
+@router.post("/batch/prompts")
+async def batch_prompts(batch: BatchPromptRequest):
+    """
+    Sends many prompts in one call, for offline and bulk jobs. Each item is
+    a (conversation_id, message) pair; items run with bounded parallelism
+    and results stream back as NDJSON lines as soon as each turn is saved:
+    {"type": "result", "index": ..., "status": "ok", "reply": ...} or
+    {"type": "result", "index": ..., "status": "error", "detail": ...},
+    followed by {"type": "done", "succeeded": ..., "failed": ...}.
+    """
+    if len(batch.items) > settings.BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"At most {settings.BATCH_MAX_ITEMS} items per batch")
+
+    runner = batch_runner(batch.items, batch.max_parallel)
+
+    async def result_lines():
+        async for result in runner.run():
+            yield json.dumps(result) + "\n"
+
+    return StreamingResponse(result_lines(), media_type="application/x-ndjson")
 
 
 @router.get("/{conversation_id}", response_model=ConversationResponse)
-async def get_conversation(conversation_id: str):
+async def get_conversation(
+    conversation_id: str,
+    limit: int = Query(settings.MESSAGE_PAGE_SIZE, ge=1, le=1000),
+    before: Optional[int] = Query(None, ge=0),
+    fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION)
+):
+    """
+    Returns the conversation with a window of at most `limit` messages,
+    newest first by default. To page back through older history, pass the
+    previous response's `message_offset` as `before`.
+    Messages are only read when `fields` includes them (or is not given).
+    """
+    wanted = parse_fields(fields, ConversationResponse.model_fields)
     try:
         obj_id = PydanticObjectId(conversation_id)
     except:
         raise HTTPException(status_code=404, detail="Conversation not found")
 
-    conv = await Conversation.get(obj_id)
+    conv = await conversation_cache.get(obj_id)
     if not conv:
         raise HTTPException(status_code=404, detail="Conversation not found")
-    return await _build_conversation_response(conv)
+
+    total = conv.total_messages()
+    end = total if before is None else min(before, total)
+    start = max(0, end - limit)
+    messages = await conv.read_messages(start, end) if wanted is None or "messages" in wanted else []
+    return ORJSONResponse(await _build_conversation_response(conv, messages, start, wanted))
 
 @router.put("/{conversation_id}", response_model=ConversationResponse)
 async def update_conversation(conversation_id: str, conv_update: ConversationUpdate):
@@ -46,16 +155,19 @@ async def update_conversation(conversation_id: str, conv_update: ConversationUpd
     except:
         raise HTTPException(status_code=404, detail="Conversation not found")
 
-    conv = await Conversation.get(obj_id)
+    conv = await conversation_cache.get(obj_id)
     if not conv:
         raise HTTPException(status_code=404, detail="Conversation not found")
 
+    changes = {"updated_at": datetime.now(timezone.utc)}
     if conv_update.title is not None:
-        conv.title = conv_update.title
+        changes["title"] = conv_update.title
+    if conv_update.model is not None:
+        changes["model"] = conv_update.model or None
 
-    conv.updated_at = datetime.now(timezone.utc)
-    await conv.save()
-    return await _build_conversation_response(conv)
+    await conv.set_fields(changes)
+    conversation_cache.store(conv)
+    return ORJSONResponse(await _build_conversation_response(conv))
 
 
 @router.delete("/{conversation_id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -65,58 +177,183 @@ async def delete_conversation(conversation_id: str):
     except:
         raise HTTPException(status_code=404, detail="Conversation not found")
 
-    conv = await Conversation.get(obj_id)
+    conv = await conversation_cache.get(obj_id)
     if not conv:
         raise HTTPException(status_code=404, detail="Conversation not found")
     await conv.delete()
+    conversation_cache.invalidate(conv.id)
+    await conv.delete_messages()
     return
 
 @router.post("/{conversation_id}/prompt", response_model=ConversationResponse)
-async def send_prompt(conversation_id: str, message: MessageCreate):
+async def send_prompt(
+    conversation_id: str,
+    message: MessageCreate,
+    cache_control: Optional[str] = Header(None),
+    idempotency_key: Optional[str] = Header(None)
+):
     """
     Send a user's prompt, use the conversation history as context,
     and append the LLM's response to the conversation.
+    A `Cache-Control: no-cache` (or `no-store`) header bypasses the completion cache.
+
+    Identical prompts to the same conversation that arrive while one is
+    running (or within PROMPT_DEDUP_WINDOW seconds after) share its result
+    instead of appending a duplicate turn. With an `Idempotency-Key` header,
+    retries return the stored result of the first request.
     """
     try:
         obj_id = PydanticObjectId(conversation_id)
     except:
         raise HTTPException(status_code=404, detail="Conversation not found")
 
-    conv = await Conversation.get(obj_id)
+    conv = await conversation_cache.get(obj_id)
     if not conv:
         raise HTTPException(status_code=404, detail="Conversation not found")
 
+    use_cache = not (cache_control and ("no-cache" in cache_control or "no-store" in cache_control))
+
+    async def run() -> dict:
+        # Plain JSON types, so the result can be stored and replayed as is
+        return to_jsonable(await _run_prompt(conv, message, use_cache))
+
+    if idempotency_key:
+        body_hash = request_hash(message.model_dump(mode="json"))
+        return ORJSONResponse(await idempotency_store.run(f"prompt:{conv.id}", idempotency_key, body_hash, run))
+    return ORJSONResponse(await prompt_flights.do((str(conv.id), message.role, message.content), run))
+
+async def _run_prompt(conv: Conversation, message: MessageCreate, use_cache: bool) -> Dict[str, Any]:
     # 1. Append user's message
     user_msg = Message(role=message.role, content=message.content)
-    conv.add_message(user_msg)
-    await conv.save()
+    await conv.append_messages(user_msg)
+    user_seq = conv.total_messages() - 1
 
-    # 2. Build context from conversation messages
-    context_messages = [{"role": m.role, "content": m.content} for m in conv.messages]
+    # 2. Build context from as much recent history as fits the token budget
+    context_messages = await context_builder.build(conv)
 
     # 3. Call LLM to get a response
-    llm_answer = await get_llm_response(context_messages, str(conv.id))
+    llm_answer = await get_llm_response(context_messages, str(conv.id), use_cache=use_cache, model=conv.model)
 
     # 4. Append LLM's response
     assistant_msg = Message(role="assistant", content=llm_answer)
-    conv.add_message(assistant_msg)
-    await conv.save()
+    await conv.append_messages(assistant_msg)
+    conversation_cache.store(conv)
+    embedding_indexer.add(conv.id, user_seq, [user_msg])
+    embedding_indexer.add(conv.id, conv.total_messages() - 1, [assistant_msg])
+    if settings.SUMMARY_ENABLED:
+        summarizer.schedule(conv)
 
     return await _build_conversation_response(conv)
 
-async def _build_conversation_response(conv: Conversation) -> ConversationResponse:
-    return ConversationResponse(
-        id=str(conv.id),
-        title=conv.title,
-        messages=[
-            # Convert each message into the response schema
+@router.post("/{conversation_id}/prompt/stream")
+async def stream_prompt(conversation_id: str, message: MessageCreate):
+    """
+    Streaming variant of `send_prompt`. Tokens are forwarded as NDJSON lines
+    ({"type": "delta", "content": ...}) as the LLM emits them, followed by a
+    final {"type": "done", "conversation": ...} line.
+
+    Both messages and the audit record are written once, after the stream
+    completes. If the client disconnects mid-stream the upstream call is
+    cancelled and the conversation is left untouched.
+    """
+    try:
+        obj_id = PydanticObjectId(conversation_id)
+    except:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+
+    conv = await conversation_cache.get(obj_id)
+    if not conv:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+
+    user_msg = Message(role=message.role, content=message.content)
+    context_messages = await context_builder.build(conv, pending=[user_msg])
+
+    # Open the upstream stream before responding so failures are still a 502
+    upstream = await open_llm_stream(context_messages, str(conv.id), model=conv.model)
+
+    async def event_stream():
+        chunks = []
+        try:
+            async for delta in iter_llm_deltas(upstream):
+                chunks.append(delta)
+                yield json.dumps({"type": "delta", "content": delta}) + "\n"
+        except Exception as e:
+            print(e)
+            yield json.dumps({"type": "error", "detail": "LLM service error."}) + "\n"
+            return
+
+        llm_answer = "".join(chunks)
+        # Persist the completed turn even if the client goes away right now
+        assistant_msg = Message(role="assistant", content=llm_answer)
+        with anyio.CancelScope(shield=True):
+            await conv.append_messages(user_msg, assistant_msg)
+            await record_audit(context_messages, llm_answer, str(conv.id))
+        conversation_cache.store(conv)
+        embedding_indexer.add(conv.id, conv.total_messages() - 2, [user_msg, assistant_msg])
+        if settings.SUMMARY_ENABLED:
+            summarizer.schedule(conv)
+
+        # Reload so the snapshot includes turns appended concurrently by other requests
+        conv_response = await _build_conversation_response(await conversation_cache.get(conv.id) or conv)
+        yield dumps({"type": "done", "conversation": conv_response}) + b"\n"
+
+    # The background task runs even if the client disconnects before the body
+    # is iterated, so the upstream connection is always returned to the pool
+    return StreamingResponse(
+        event_stream(),
+        media_type="application/x-ndjson",
+        background=BackgroundTask(upstream.close)
+    )
+
+def _summary_payload(doc: Dict[str, Any], fields: Optional[Set[str]] = None) -> Dict[str, Any]:
+    """
+    Builds a `ConversationSummary` payload from a projected document.
+    """
+    summary = {"id": str(doc["_id"])}
+    for field in ("title", "message_count", "last_message", "created_at", "updated_at"):
+        if fields is None or field in fields:
+            summary[field] = doc.get(field)
+    last = summary.get("last_message")
+    if last:
+        summary["last_message"] = {
+            "role": last["role"],
+            "content": last["content"][:LAST_MESSAGE_PREVIEW_CHARS],
+            "timestamp": last["timestamp"],
+        }
+    return summary
+
+async def _build_conversation_response(
+    conv: Conversation,
+    messages: Optional[List[Message]] = None,
+    offset: int = 0,
+    fields: Optional[Set[str]] = None
+) -> Dict[str, Any]:
+    """
+    Builds the `ConversationResponse` payload as plain data for
+    ORJSONResponse, skipping response-model validation. With `fields`,
+    only those keys are returned.
+    """
+    if messages is None:
+        # Default to the latest page so responses stay bounded for long histories
+        messages = await conv.last_messages(settings.MESSAGE_PAGE_SIZE)
+        offset = conv.total_messages() - len(messages)
+    payload = {
+        "id": str(conv.id),
+        "title": conv.title,
+        "messages": [
             {
                 "role": m.role,
                 "content": m.content,
                 "timestamp": m.timestamp
             }
-            for m in conv.messages
+            for m in messages
         ],
-        created_at=conv.created_at,
-        updated_at=conv.updated_at
-    )
+        "message_count": conv.total_messages(),
+        "message_offset": offset,
+        "model": conv.model,
+        "created_at": conv.created_at,
+        "updated_at": conv.updated_at
+    }
+    if fields is not None:
+        payload = {k: v for k, v in payload.items() if k in fields}
+    return payload
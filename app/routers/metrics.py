@@ -0,0 +1,14 @@
+from fastapi import APIRouter, Response
+
+from app.metrics import PROMETHEUS_CONTENT_TYPE, PrometheusExporter, metrics
+
+router = APIRouter(tags=["metrics"])
+
+
+@router.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """
+    Reports every metric in the Prometheus text exposition format.
+    Only mounted while metrics are enabled with the "prometheus" exporter.
+    """
+    return Response(PrometheusExporter.render(metrics), media_type=PROMETHEUS_CONTENT_TYPE)
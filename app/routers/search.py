@@ -0,0 +1,60 @@
+from enum import Enum
+from fastapi import APIRouter, HTTPException, Query
+from typing import List
+
+from app.config import settings
+from app.responses import ORJSONResponse
+from app.schemas import SearchResult
+from app.services import llm_services
+from app.services.search import attach_titles, semantic_search, text_search
+
+router = APIRouter(prefix="/search", tags=["search"])
+
+PARTIAL_HEADER = "X-Search-Partial"
+
+
+class SearchMode(str, Enum):
+    text = "text"
+    semantic = "semantic"
+
+
+@router.get("/", response_model=List[SearchResult])
+async def search(
+    q: str = Query(..., min_length=1, max_length=1000),
+    mode: SearchMode = SearchMode.text,
+    limit: int = Query(20, ge=1, le=100)
+):
+    """
+    Searches message content across conversations, best match first.
+    `text` ranks by MongoDB text score; `semantic` by embedding similarity.
+    Each result lists the offsets of its matching messages. A semantic
+    search that runs out of its latency budget returns what it found so far
+    with X-Search-Partial: true.
+    """
+    headers = {}
+    if mode is SearchMode.text:
+        if not settings.SEARCH_TEXT_ENABLED:
+            raise HTTPException(status_code=400, detail="Text search is disabled")
+        hits = await text_search(q, limit)
+    else:
+        indexer = llm_services.embedding_indexer
+        if not indexer.enabled:
+            raise HTTPException(status_code=400, detail="Semantic search is disabled")
+        try:
+            hits, partial = await semantic_search(indexer, q, limit, settings.SEARCH_BUDGET)
+        except Exception as e:
+            print(e)
+            raise HTTPException(status_code=503, detail="Search index unavailable.")
+        if partial:
+            headers[PARTIAL_HEADER] = "true"
+
+    hits = await attach_titles(hits)
+    return ORJSONResponse([
+        {
+            "conversation_id": str(hit.conversation_id),
+            "title": hit.title,
+            "score": hit.score,
+            "message_offsets": hit.message_offsets,
+        }
+        for hit in hits
+    ], headers=headers)
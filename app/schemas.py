@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import List, Optional
 from datetime import datetime
 from app.models import RoleEnum
@@ -9,9 +9,13 @@ class MessageCreate(BaseModel):
 
 class ConversationCreate(BaseModel):
     title: str
+    # LLM route, "provider/model" or a model name; omitted = routing rules
+    model: Optional[str] = None
 
 class ConversationUpdate(BaseModel):
     title: Optional[str] = None
+    # An empty string clears the conversation's model
+    model: Optional[str] = None
 
 class MessageResponse(BaseModel):
     role: RoleEnum
@@ -22,5 +26,33 @@ class ConversationResponse(BaseModel):
     id: str
     title: str
     messages: List[MessageResponse]
+    # Total number of messages and the offset of the first one in `messages`
+    message_count: int = 0
+    message_offset: int = 0
+    model: Optional[str] = None
     created_at: datetime
-    updated_at: datetime
\ No newline at end of file
+    updated_at: datetime
+
+class ConversationSummary(BaseModel):
+    id: str
+    title: str
+    message_count: int
+    last_message: Optional[MessageResponse] = None
+    created_at: datetime
+    updated_at: datetime
+
+class BatchPromptItem(BaseModel):
+    conversation_id: str
+    message: MessageCreate
+
+class BatchPromptRequest(BaseModel):
+    items: List[BatchPromptItem] = Field(..., min_length=1)
+    # Upper bound on items processed at once (capped by BATCH_MAX_PARALLEL)
+    max_parallel: Optional[int] = Field(None, ge=1)
+
+class SearchResult(BaseModel):
+    conversation_id: str
+    title: str
+    score: float
+    # Offsets of matching messages, usable as `before` on GET /conversations/{id}
+    message_offsets: List[int]
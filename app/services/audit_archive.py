@@ -0,0 +1,360 @@
+import asyncio
+import fcntl
+import gzip
+import json
+import os
+from dataclasses import dataclass
+from datetime import datetime, time, timedelta, timezone
+from typing import Any, Dict, Iterator, List, Optional
+
+from pymongo import ASCENDING, DESCENDING, UpdateOne
+from pymongo.errors import OperationFailure
+
+from app.config import settings
+from app.models import AuditLog, AuditRollup
+from app.services.context_builder import count_tokens
+
+SEGMENT_PREFIX = "audit-"
+SEGMENT_SUFFIX = ".jsonl.gz"
+INDEX_SUFFIX = ".idx.json"
+LOCK_FILE = ".lock"
+TTL_INDEX_NAME = "timestamp_ttl"
+# Index key of audit logs that belong to no conversation
+NO_CONVERSATION = ""
+
+# Documents fetched per round-trip while archiving, and ids per purge
+ARCHIVE_BATCH_SIZE = 500
+PURGE_CHUNK = 1000
+
+
+@dataclass
+class AuditArchiveStats:
+    runs: int = 0
+    skipped_runs: int = 0  # another process held the archive lock
+    days_archived: int = 0
+    records_archived: int = 0
+    records_purged: int = 0
+    errors: int = 0
+
+
+def _as_utc(value: datetime) -> datetime:
+    # MongoDB returns naive UTC datetimes
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value.astimezone(timezone.utc)
+
+
+def _day_start(value: datetime) -> datetime:
+    return datetime.combine(_as_utc(value).date(), time(), tzinfo=timezone.utc)
+
+
+class AuditArchiver:
+    """
+    Keeps `audit_logs` bounded.
+
+    Every `interval` seconds, records older than `archive_after_days` (whole
+    UTC days only) are moved out of MongoDB one day at a time:
+
+    1. they are written to a gzip JSONL segment, `audit-YYYY-MM-DD.N.jsonl.gz`,
+       grouped by conversation with each group in its own gzip member, and an
+       `.idx.json` sidecar records every group's byte range and totals, so
+       one conversation's day can be read without decompressing the rest;
+    2. the day's per-conversation totals (counts, sizes, estimated tokens)
+       are recomputed from the sidecars into `audit_rollups`;
+    3. the archived records are deleted by `_id`.
+
+    The sidecar is the commit point. A run that stops before step 3 leaves
+    records that are both archived and stored; the next run deletes those
+    first, so nothing is archived twice. Records stored for an already
+    archived day later (e.g. by an import) go into a new segment.
+
+    Runs hold an exclusive lock on the archive directory, so workers
+    sharing it take turns. `retention_days` additionally puts a TTL index
+    on `timestamp`, as a backstop that must outlive the archiving delay.
+    """
+
+    def __init__(
+        self,
+        archive_dir: str,
+        enabled: bool = False,
+        archive_after_days: int = 30,
+        retention_days: float = 0,
+        interval: float = 3600,
+        token_model: Optional[str] = None,
+    ):
+        if enabled and retention_days and retention_days <= archive_after_days + 1:
+            raise ValueError(
+                "AUDIT_RETENTION_DAYS must exceed AUDIT_ARCHIVE_AFTER_DAYS + 1, "
+                "or records expire before they are archived"
+            )
+        self.archive_dir = archive_dir
+        self.enabled = enabled
+        self.archive_after_days = archive_after_days
+        self.retention_days = retention_days
+        self.interval = interval
+        self.token_model = token_model or settings.OPENAI_MODEL
+        self.stats = AuditArchiveStats()
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        try:
+            await self.ensure_ttl_index()
+        except Exception as e:
+            print(e)
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                self.stats.errors += 1
+                print(e)
+            await asyncio.sleep(self.interval)
+
+    async def ensure_ttl_index(self):
+        """
+        Creates, updates or drops the TTL index to match `retention_days`.
+        """
+        collection = AuditLog.get_motor_collection()
+        if self.retention_days <= 0:
+            if TTL_INDEX_NAME in await collection.index_information():
+                await collection.drop_index(TTL_INDEX_NAME)
+            return
+        seconds = int(self.retention_days * 86400)
+        try:
+            await collection.create_index([("timestamp", ASCENDING)], name=TTL_INDEX_NAME, expireAfterSeconds=seconds)
+        except OperationFailure:
+            # The index exists with another expiry
+            await collection.database.command(
+                "collMod", collection.name, index={"name": TTL_INDEX_NAME, "expireAfterSeconds": seconds}
+            )
+
+    async def run_once(self, now: Optional[datetime] = None) -> int:
+        """
+        Archives every complete day older than the cutoff. Returns the number
+        of records archived, or 0 if another process holds the lock.
+        """
+        now = now or datetime.now(timezone.utc)
+        cutoff = _day_start(now - timedelta(days=self.archive_after_days))
+        os.makedirs(self.archive_dir, exist_ok=True)
+        with open(os.path.join(self.archive_dir, LOCK_FILE), "w") as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                self.stats.skipped_runs += 1
+                return 0
+            self.stats.runs += 1
+            archived = 0
+            previous = None
+            collection = AuditLog.get_motor_collection()
+            while True:
+                oldest = await collection.find_one(
+                    {"timestamp": {"$lt": cutoff}}, projection={"timestamp": 1}, sort=[("timestamp", ASCENDING)]
+                )
+                if oldest is None:
+                    return archived
+                day = _day_start(oldest["timestamp"])
+                if day == previous:
+                    raise RuntimeError(f"Audit logs of {day:%Y-%m-%d} were archived but could not be deleted")
+                archived += await self.archive_day(day)
+                previous = day
+
+    async def archive_day(self, day: datetime) -> int:
+        indexes = self.day_indexes(day)
+        # A previous run stopped between writing a segment and deleting its records
+        for index in indexes:
+            await self._purge(index)
+        index = await self._write_segment(day, len(indexes))
+        if index is not None:
+            indexes.append(index)
+        if indexes:
+            await self._store_rollups(day, indexes)
+        if index is None:
+            return 0
+        await self._purge(index)
+        self.stats.days_archived += 1
+        self.stats.records_archived += index["count"]
+        return index["count"]
+
+    async def _write_segment(self, day: datetime, seq: int) -> Optional[Dict[str, Any]]:
+        name = f"{SEGMENT_PREFIX}{day:%Y-%m-%d}.{seq}"
+        segment_path = os.path.join(self.archive_dir, name + SEGMENT_SUFFIX)
+        cursor = AuditLog.get_motor_collection().find(
+            {"timestamp": {"$gte": day, "$lt": day + timedelta(days=1)}}
+        ).sort(
+            # Walks the (conversation_id, timestamp, _id) index backwards
+            [("conversation_id", DESCENDING), ("timestamp", ASCENDING), ("_id", ASCENDING)]
+        ).batch_size(ARCHIVE_BATCH_SIZE)
+
+        conversations: Dict[str, Dict[str, Any]] = {}
+        count = 0
+        with open(segment_path + ".tmp", "wb") as f:
+            member = current = None
+            try:
+                async for doc in cursor:
+                    audit = AuditLog.model_validate(doc)
+                    key = audit.conversation_id or NO_CONVERSATION
+                    if key != current:
+                        if member is not None:
+                            member.close()
+                            conversations[current]["length"] = f.tell() - conversations[current]["offset"]
+                        current = key
+                        conversations[key] = {
+                            "offset": f.tell(), "length": 0, "count": 0,
+                            "prompt_bytes": 0, "response_bytes": 0, "prompt_tokens": 0, "response_tokens": 0,
+                            "first_timestamp": _as_utc(audit.timestamp).isoformat(),
+                        }
+                        member = gzip.GzipFile(fileobj=f, mode="wb", mtime=0)
+                    member.write(audit.model_dump_json().encode() + b"\n")
+                    totals = conversations[key]
+                    totals["count"] += 1
+                    totals["prompt_bytes"] += len(audit.prompt.encode())
+                    totals["response_bytes"] += len(audit.response.encode())
+                    totals["prompt_tokens"] += count_tokens(audit.prompt, self.token_model)
+                    totals["response_tokens"] += count_tokens(audit.response, self.token_model)
+                    totals["last_timestamp"] = _as_utc(audit.timestamp).isoformat()
+                    count += 1
+                if member is not None:
+                    member.close()
+                    conversations[current]["length"] = f.tell() - conversations[current]["offset"]
+            finally:
+                await cursor.close()
+            f.flush()
+            os.fsync(f.fileno())
+
+        if count == 0:
+            os.remove(segment_path + ".tmp")
+            return None
+        os.replace(segment_path + ".tmp", segment_path)
+        index = {
+            "day": f"{day:%Y-%m-%d}",
+            "segment": name + SEGMENT_SUFFIX,
+            "count": count,
+            "conversations": conversations,
+        }
+        index_path = os.path.join(self.archive_dir, name + INDEX_SUFFIX)
+        with open(index_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(index, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(index_path + ".tmp", index_path)
+        return index
+
+    async def _store_rollups(self, day: datetime, indexes: List[Dict[str, Any]]):
+        """
+        Sets the day's rollups to the sums over all of its segments, so
+        storing them again after an interrupted run changes nothing.
+        """
+        rollups: Dict[str, Dict[str, Any]] = {}
+        for index in indexes:
+            for key, totals in index["conversations"].items():
+                rollup = rollups.setdefault(key, {
+                    "records": 0, "prompt_bytes": 0, "response_bytes": 0, "prompt_tokens": 0, "response_tokens": 0,
+                    "first_timestamp": totals["first_timestamp"], "last_timestamp": totals["last_timestamp"],
+                })
+                rollup["records"] += totals["count"]
+                for field in ("prompt_bytes", "response_bytes", "prompt_tokens", "response_tokens"):
+                    rollup[field] += totals[field]
+                rollup["first_timestamp"] = min(rollup["first_timestamp"], totals["first_timestamp"])
+                rollup["last_timestamp"] = max(rollup["last_timestamp"], totals["last_timestamp"])
+
+        operations = []
+        for key, rollup in rollups.items():
+            rollup["first_timestamp"] = datetime.fromisoformat(rollup["first_timestamp"])
+            rollup["last_timestamp"] = datetime.fromisoformat(rollup["last_timestamp"])
+            conversation_id = key or None
+            operations.append(UpdateOne(
+                {"conversation_id": conversation_id, "day": day},
+                {"$set": rollup},
+                upsert=True,
+            ))
+        await AuditRollup.get_motor_collection().bulk_write(operations, ordered=False)
+
+    async def _purge(self, index: Dict[str, Any]):
+        collection = AuditLog.get_motor_collection()
+        ids = []
+        for line in self._segment_lines(index):
+            ids.append(AuditLog.model_validate_json(line).id)
+            if len(ids) == PURGE_CHUNK:
+                self.stats.records_purged += (await collection.delete_many({"_id": {"$in": ids}})).deleted_count
+                ids = []
+        if ids:
+            self.stats.records_purged += (await collection.delete_many({"_id": {"$in": ids}})).deleted_count
+
+    # --- Reading the archive ---
+
+    def day_indexes(self, day: datetime) -> List[Dict[str, Any]]:
+        """
+        Sidecar indexes of the day's segments, oldest segment first.
+        """
+        prefix = f"{SEGMENT_PREFIX}{day:%Y-%m-%d}."
+        try:
+            names = [n for n in os.listdir(self.archive_dir) if n.startswith(prefix) and n.endswith(INDEX_SUFFIX)]
+        except FileNotFoundError:
+            return []
+        names.sort(key=lambda n: int(n[len(prefix):-len(INDEX_SUFFIX)]))
+        indexes = []
+        for name in names:
+            with open(os.path.join(self.archive_dir, name), encoding="utf-8") as f:
+                indexes.append(json.load(f))
+        return indexes
+
+    def archived_days(self) -> List[datetime]:
+        try:
+            names = os.listdir(self.archive_dir)
+        except FileNotFoundError:
+            return []
+        days = {
+            n[len(SEGMENT_PREFIX):len(SEGMENT_PREFIX) + 10]
+            for n in names if n.startswith(SEGMENT_PREFIX) and n.endswith(INDEX_SUFFIX)
+        }
+        return [datetime.strptime(d, "%Y-%m-%d").replace(tzinfo=timezone.utc) for d in sorted(days)]
+
+    def read(
+        self,
+        conversation_id: Optional[str] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+    ) -> Iterator[bytes]:
+        """
+        Yields archived audit logs as JSON lines, day by day, optionally
+        filtered by conversation and time range [since, until). Only the
+        segments of matching days are opened, and for a conversation only
+        its own gzip member is read.
+        """
+        since = _as_utc(since) if since is not None else None
+        until = _as_utc(until) if until is not None else None
+        for day in self.archived_days():
+            next_day = day + timedelta(days=1)
+            if (since is not None and next_day <= since) or (until is not None and day >= until):
+                continue
+            # Only days cut by the range need their timestamps checked
+            partial = (since is not None and since > day) or (until is not None and until < next_day)
+            for index in self.day_indexes(day):
+                for line in self._segment_lines(index, conversation_id):
+                    if partial:
+                        timestamp = _as_utc(datetime.fromisoformat(json.loads(line)["timestamp"]))
+                        if (since is not None and timestamp < since) or (until is not None and timestamp >= until):
+                            continue
+                    yield line
+
+    def _segment_lines(self, index: Dict[str, Any], conversation_id: Optional[str] = None) -> Iterator[bytes]:
+        path = os.path.join(self.archive_dir, index["segment"])
+        with open(path, "rb") as f:
+            if conversation_id is None:
+                # Concatenated gzip members read back as one stream
+                with gzip.GzipFile(fileobj=f) as data:
+                    yield from data
+                return
+            entry = index["conversations"].get(conversation_id or NO_CONVERSATION)
+            if entry is None:
+                return
+            f.seek(entry["offset"])
+            for line in gzip.decompress(f.read(entry["length"])).splitlines(keepends=True):
+                yield line
@@ -0,0 +1,279 @@
+import asyncio
+import glob
+import json
+import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Union
+
+from app.metrics import AUDIT_MASK_SECONDS, AUDIT_WRITE_SECONDS, metrics
+from app.models import AuditLog
+
+# Overflow policies when the queue is full
+OVERFLOW_BLOCK = "block"
+OVERFLOW_DROP = "drop"
+OVERFLOW_SPILL = "spill"
+
+_STOP = object()
+
+
+@dataclass
+class AuditEntry:
+    """
+    A raw, not yet masked audit record waiting in the queue.
+    `prompt` is either the prompt text or its lines, oldest first.
+    """
+    conversation_id: Optional[str]
+    prompt: Union[str, List[str]]
+    response: str
+    timestamp: datetime
+
+
+@dataclass
+class AuditWriterStats:
+    enqueued: int = 0
+    written: int = 0
+    dropped: int = 0
+    spilled: int = 0
+    replayed: int = 0
+    failed: int = 0
+    flushes: int = 0
+    last_flush_seconds: float = 0.0
+    total_flush_seconds: float = 0.0
+
+
+async def insert_audit_logs(records: List[Dict[str, Any]]):
+    await AuditLog.insert_many([AuditLog(**r) for r in records])
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class AuditWriter:
+    """
+    Moves audit logging off the request path.
+
+    Entries go into a bounded asyncio queue. A background task drains it in
+    batches (up to `batch_size` entries or `flush_interval` seconds), masks
+    the batch in a thread or process pool using `prepare_batch`, and writes
+    it with `write_batch` (a single `insert_many` by default).
+
+    When the queue is full, `overflow` decides what happens: "block" waits
+    for room, "drop" discards the entry, and "spill" masks it inline and
+    appends it to a JSONL file. Batches whose write fails are spilled too
+    whenever `spill_path` is set. Each process spills to its own
+    `<spill_path>.<pid>` file; on start, files left behind by this or dead
+    processes are claimed and replayed.
+    """
+
+    def __init__(
+        self,
+        prepare_batch: Callable[[List[AuditEntry]], List[Dict[str, Any]]],
+        write_batch: Callable[[List[Dict[str, Any]]], Awaitable[None]] = insert_audit_logs,
+        max_queue: int = 10000,
+        batch_size: int = 100,
+        flush_interval: float = 1.0,
+        overflow: str = OVERFLOW_BLOCK,
+        spill_path: Optional[str] = None,
+        executor: str = "thread",
+        workers: int = 2,
+    ):
+        if overflow not in (OVERFLOW_BLOCK, OVERFLOW_DROP, OVERFLOW_SPILL):
+            raise ValueError(f"Unknown audit overflow policy: {overflow}")
+        if overflow == OVERFLOW_SPILL and not spill_path:
+            raise ValueError("The spill overflow policy needs a spill_path")
+        self.prepare_batch = prepare_batch
+        self.write_batch = write_batch
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overflow = overflow
+        self.spill_path = spill_path
+        self.executor_kind = executor
+        self.workers = workers
+        self.stats = AuditWriterStats()
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._executor: Optional[Executor] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    @property
+    def process_spill_path(self) -> Optional[str]:
+        return f"{self.spill_path}.{os.getpid()}" if self.spill_path else None
+
+    async def start(self):
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        if self.executor_kind == "process":
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        else:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="audit-mask")
+        await self._replay_spill()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """
+        Stops the worker and flushes everything still queued. Never blocks on
+        a full queue, even if the worker has crashed or been cancelled.
+        """
+        if self._task is None:
+            return
+        if not self._task.done():
+            put = asyncio.ensure_future(self._queue.put(_STOP))
+            await asyncio.wait({put, self._task}, return_when=asyncio.FIRST_COMPLETED)
+            if not put.done():
+                put.cancel()
+            await asyncio.wait({self._task})
+        if not self._task.cancelled() and self._task.exception() is not None:
+            print(self._task.exception())
+        self._task = None
+
+        # Whatever the worker didn't get to: entries behind the stop marker,
+        # or everything left by a worker that died
+        leftover = []
+        while not self._queue.empty():
+            item = self._queue.get_nowait()
+            if item is not _STOP:
+                leftover.append(item)
+        for i in range(0, len(leftover), self.batch_size):
+            await self._flush(leftover[i:i + self.batch_size])
+
+        self._executor.shutdown(wait=True)
+        self._executor = None
+
+    async def submit(self, conversation_id: Optional[str], prompt: Union[str, List[str]], response: str):
+        entry = AuditEntry(conversation_id, prompt, response, datetime.now(timezone.utc))
+        if self.overflow == OVERFLOW_BLOCK:
+            await self._queue.put(entry)
+            self.stats.enqueued += 1
+            return
+        try:
+            self._queue.put_nowait(entry)
+            self.stats.enqueued += 1
+        except asyncio.QueueFull:
+            if self.overflow == OVERFLOW_DROP:
+                self.stats.dropped += 1
+            else:
+                await asyncio.to_thread(self._spill, self.prepare_batch([entry]))
+                self.stats.spilled += 1
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            first = await self._queue.get()
+            if first is _STOP:
+                break
+            batch = [first]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            await self._flush(batch)
+
+    async def _flush(self, batch: List[AuditEntry]):
+        start = time.perf_counter()
+        records = None
+        try:
+            loop = asyncio.get_running_loop()
+            records = await loop.run_in_executor(self._executor, self.prepare_batch, batch)
+            masked = time.perf_counter()
+            await self.write_batch(records)
+            self.stats.written += len(batch)
+            if metrics.enabled:
+                AUDIT_MASK_SECONDS.observe(masked - start)
+                AUDIT_WRITE_SECONDS.observe(time.perf_counter() - masked)
+        except Exception as e:
+            print(e)
+            # Keep the audit trail: a failed write goes to disk for a later replay
+            if records is not None and self.spill_path:
+                await asyncio.to_thread(self._spill, records)
+                self.stats.spilled += len(batch)
+            else:
+                self.stats.failed += len(batch)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.stats.flushes += 1
+            self.stats.last_flush_seconds = elapsed
+            self.stats.total_flush_seconds += elapsed
+
+    def _spill(self, records: List[Dict[str, Any]]):
+        with open(self.process_spill_path, "a", encoding="utf-8") as f:
+            for r in records:
+                f.write(json.dumps({**r, "timestamp": r["timestamp"].isoformat()}) + "\n")
+
+    def _claim_spill_files(self) -> List[str]:
+        """
+        Atomically renames spill files owned by this process or by processes
+        that are gone, so sibling workers never replay the same file.
+        """
+        claimed = []
+        for path in glob.glob(f"{glob.escape(self.spill_path)}.*"):
+            suffix = path[len(self.spill_path) + 1:]
+            if not suffix.isdigit():
+                continue
+            pid = int(suffix)
+            if pid != os.getpid() and _pid_alive(pid):
+                continue
+            target = f"{path}.replay-{os.getpid()}-{time.time_ns()}"
+            try:
+                os.rename(path, target)
+            except FileNotFoundError:
+                continue  # claimed by another worker first
+            claimed.append(target)
+        # Also pick up claims abandoned by a replay that died midway
+        claimed.extend(
+            p for p in glob.glob(f"{glob.escape(self.spill_path)}.*.replay-*")
+            if p not in claimed and not _pid_alive(int(p.rsplit(".replay-", 1)[1].split("-")[0]))
+        )
+        return claimed
+
+    async def _replay_spill(self):
+        """
+        Writes records spilled earlier (already masked). Failures never abort
+        startup: records not yet written go back into this process's spill
+        file, so nothing is written twice or lost.
+        """
+        if not self.spill_path:
+            return
+        for path in await asyncio.to_thread(self._claim_spill_files):
+            with open(path, encoding="utf-8") as f:
+                records = [json.loads(line) for line in f if line.strip()]
+            for r in records:
+                r["timestamp"] = datetime.fromisoformat(r["timestamp"])
+            written = 0
+            try:
+                for i in range(0, len(records), self.batch_size):
+                    await self.write_batch(records[i:i + self.batch_size])
+                    written = min(i + self.batch_size, len(records))
+            except Exception as e:
+                print(e)
+                await asyncio.to_thread(self._spill, records[written:])
+            self.stats.replayed += written
+            os.remove(path)
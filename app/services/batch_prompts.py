@@ -0,0 +1,239 @@
+import asyncio
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import anyio
+from beanie import PydanticObjectId
+from beanie.odm.utils.encoder import Encoder
+from beanie.operators import In
+from fastapi import HTTPException
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from app.config import settings
+from app.metrics import AUDIT_MASK_SECONDS, AUDIT_WRITE_SECONDS, metrics
+from app.models import LAST_MESSAGE_PREVIEW_CHARS, Conversation, Message, StorageMode
+from app.schemas import BatchPromptItem
+from app.services.audit_writer import AuditEntry, insert_audit_logs
+from app.services.llm_services import (
+    audit_prompt_lines,
+    complete_llm,
+    context_builder,
+    conversation_cache,
+    prepare_audit_batch,
+)
+
+# Batch work yields to interactive prompts in the LLM scheduler
+BATCH_PRIORITY = -1
+
+
+@dataclass
+class _Completed:
+    index: int
+    conv: Conversation
+    messages: List[Message]
+    audit: AuditEntry
+
+
+class BatchPromptRunner:
+    """
+    Runs many (conversation, message) prompts with bounded parallelism and
+    yields one result per item as soon as its turn is persisted.
+
+    Items for the same conversation run in order, each seeing the turns
+    before it. Completed turns are buffered and written in bulk: one
+    `bulk_write` of `$push` updates (one per conversation) and one
+    `insert_many` of masked audit logs per flush. Failures are reported per
+    item and never abort the batch.
+    """
+
+    def __init__(self, items: List[BatchPromptItem], max_parallel: int, write_size: int, flush_interval: float):
+        self.items = items
+        self.max_parallel = max_parallel
+        self.write_size = write_size
+        self.flush_interval = flush_interval
+        self._buffer: List[_Completed] = []
+        self._results: asyncio.Queue = asyncio.Queue()
+        self._flush_lock = asyncio.Lock()
+
+    async def run(self) -> AsyncIterator[Dict[str, Any]]:
+        groups: Dict[str, List[int]] = {}
+        for index, item in enumerate(self.items):
+            groups.setdefault(item.conversation_id, []).append(index)
+
+        conversations = await self._load_conversations(list(groups))
+        semaphore = asyncio.Semaphore(self.max_parallel)
+        workers = []
+        for conversation_id, indexes in groups.items():
+            conv = conversations.get(conversation_id)
+            if conv is None:
+                for index in indexes:
+                    self._results.put_nowait(self._error(index, "Conversation not found"))
+                continue
+            workers.append(asyncio.create_task(self._run_conversation(conv, indexes, semaphore)))
+        flusher = asyncio.create_task(self._flush_periodically())
+
+        succeeded = failed = 0
+        try:
+            for _ in range(len(self.items)):
+                result = await self._results.get()
+                if result["status"] == "ok":
+                    succeeded += 1
+                else:
+                    failed += 1
+                yield result
+        finally:
+            # Client gone or batch done: stop the work, but keep turns already computed
+            for task in workers + [flusher]:
+                task.cancel()
+            with anyio.CancelScope(shield=True):
+                await asyncio.gather(*workers, flusher, return_exceptions=True)
+                await self._flush()
+        yield {"type": "done", "succeeded": succeeded, "failed": failed}
+
+    async def _load_conversations(self, ids: List[str]) -> Dict[str, Conversation]:
+        object_ids = {}
+        for conversation_id in ids:
+            try:
+                object_ids[PydanticObjectId(conversation_id)] = conversation_id
+            except Exception:
+                continue
+        if not object_ids:
+            return {}
+        found = await Conversation.find(In(Conversation.id, list(object_ids))).to_list()
+        return {object_ids[c.id]: c for c in found}
+
+    async def _run_conversation(self, conv: Conversation, indexes: List[int], semaphore: asyncio.Semaphore):
+        pending: List[Message] = []
+        for index in indexes:
+            item = self.items[index]
+            user_msg = Message(role=item.message.role, content=item.message.content)
+            try:
+                async with semaphore:
+                    context_messages = await context_builder.build(conv, pending=pending + [user_msg])
+                    reply = await complete_llm(
+                        context_messages, str(conv.id), priority=BATCH_PRIORITY, model=conv.model
+                    )
+            except HTTPException as e:
+                self._results.put_nowait(self._error(index, e.detail))
+                continue
+            except Exception as e:
+                print(e)
+                self._results.put_nowait(self._error(index, "Internal error."))
+                continue
+            turn = [user_msg, Message(role="assistant", content=reply)]
+            pending.extend(turn)
+            audit = AuditEntry(str(conv.id), audit_prompt_lines(context_messages), reply, datetime.now(timezone.utc))
+            self._buffer.append(_Completed(index, conv, turn, audit))
+            if len(self._buffer) >= self.write_size:
+                await self._flush()
+
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self._flush()
+
+    async def _flush(self):
+        async with self._flush_lock:
+            batch, self._buffer = self._buffer, []
+            if not batch:
+                return
+            failed = await self._write_turns(batch)
+            await self._write_audits([c.audit for c in batch if c.index not in failed])
+            for c in batch:
+                if c.index in failed:
+                    self._results.put_nowait(self._error(c.index, failed[c.index]))
+                else:
+                    self._results.put_nowait({
+                        "type": "result",
+                        "index": c.index,
+                        "conversation_id": str(c.conv.id),
+                        "status": "ok",
+                        "reply": c.messages[-1].content,
+                    })
+
+    async def _write_turns(self, batch: List[_Completed]) -> Dict[int, str]:
+        """
+        Appends every buffered turn. Returns the failed item indexes with a reason.
+        """
+        failed: Dict[int, str] = {}
+        by_conversation: Dict[PydanticObjectId, List[_Completed]] = {}
+        for c in batch:
+            by_conversation.setdefault(c.conv.id, []).append(c)
+
+        ops = []
+        op_items: List[List[_Completed]] = []
+        for conversation_id, completed in by_conversation.items():
+            # Bulk writes bypass the documents, so cached copies are dropped
+            conversation_cache.invalidate(conversation_id)
+            conv = completed[0].conv
+            if conv.storage == StorageMode.bucketed:
+                # Bucketed appends reserve sequence numbers first; no single-op bulk form
+                for c in completed:
+                    try:
+                        await conv.append_messages(*c.messages)
+                    except Exception as e:
+                        print(e)
+                        failed[c.index] = "Failed to save the turn."
+                continue
+            messages = [m for c in completed for m in c.messages]
+            last = messages[-1]
+            preview = Message(role=last.role, content=last.content[:LAST_MESSAGE_PREVIEW_CHARS], timestamp=last.timestamp)
+            ops.append(UpdateOne(
+                {"_id": conv.id, "storage": {"$in": [StorageMode.embedded.value, None]}},
+                {
+                    "$push": {"messages": {"$each": [Encoder().encode(m) for m in messages]}},
+                    "$inc": {"version": 1},
+                    "$set": {"updated_at": datetime.now(timezone.utc), "last_message": Encoder().encode(preview)},
+                },
+            ))
+            op_items.append(completed)
+
+        if ops:
+            try:
+                await Conversation.get_motor_collection().bulk_write(ops, ordered=False)
+            except BulkWriteError as e:
+                print(e)
+                for error in e.details.get("writeErrors", []):
+                    for c in op_items[error["index"]]:
+                        failed[c.index] = "Failed to save the turn."
+            except Exception as e:
+                print(e)
+                for c in (c for completed in op_items for c in completed):
+                    failed[c.index] = "Failed to save the turn."
+        return failed
+
+    async def _write_audits(self, entries: List[AuditEntry]):
+        if not entries:
+            return
+        try:
+            start = time.perf_counter()
+            records = await asyncio.to_thread(prepare_audit_batch, entries)
+            masked = time.perf_counter()
+            await insert_audit_logs(records)
+            if metrics.enabled:
+                AUDIT_MASK_SECONDS.observe(masked - start)
+                AUDIT_WRITE_SECONDS.observe(time.perf_counter() - masked)
+        except Exception as e:
+            print(e)
+
+    def _error(self, index: int, detail: str) -> Dict[str, Any]:
+        return {
+            "type": "result",
+            "index": index,
+            "conversation_id": self.items[index].conversation_id,
+            "status": "error",
+            "detail": detail,
+        }
+
+
+def batch_runner(items: List[BatchPromptItem], max_parallel: Optional[int] = None) -> BatchPromptRunner:
+    parallel = min(max_parallel or settings.BATCH_MAX_PARALLEL, settings.BATCH_MAX_PARALLEL)
+    return BatchPromptRunner(
+        items,
+        max_parallel=parallel,
+        write_size=settings.BATCH_WRITE_SIZE,
+        flush_interval=settings.BATCH_FLUSH_INTERVAL,
+    )
@@ -0,0 +1,159 @@
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Protocol, Sequence, Tuple
+
+from app.models import CompletionCacheEntry
+
+
+def cache_key(model: str, messages: Sequence[Dict[str, Any]]) -> str:
+    """
+    Hashes the model and the normalized context: only role and content
+    count, and surrounding whitespace in the content is ignored.
+    """
+    normalized = [[str(getattr(m["role"], "value", m["role"])), m["content"].strip()] for m in messages]
+    payload = json.dumps([model, normalized], ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    expirations: int = 0
+    errors: int = 0
+
+
+class CompletionCache(Protocol):
+    """
+    A cache tier: completion text by cache key.
+    """
+
+    async def get(self, key: str) -> Optional[str]:
+        ...
+
+    async def set(self, key: str, value: str) -> None:
+        ...
+
+
+class MemoryCompletionCache:
+    """
+    In-process LRU with a TTL, bounded by entry count and by total bytes.
+    """
+
+    def __init__(self, max_entries: int = 1000, max_bytes: int = 10 * 1024 * 1024, ttl: float = 3600):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.stats = CacheStats()
+        self.size_bytes = 0
+        self._entries: "OrderedDict[str, Tuple[float, str, int]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def get(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.stats.misses += 1
+            return None
+        expires_at, value, _ = entry
+        if expires_at <= time.monotonic():
+            self._remove(key)
+            self.stats.expirations += 1
+            self.stats.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.stats.hits += 1
+        return value
+
+    async def set(self, key: str, value: str) -> None:
+        size = len(key) + len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (time.monotonic() + self.ttl, value, size)
+        self.size_bytes += size
+        while len(self._entries) > self.max_entries or self.size_bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+            self.stats.evictions += 1
+
+    def clear(self):
+        self._entries.clear()
+        self.size_bytes = 0
+
+    def _remove(self, key: str):
+        _, _, size = self._entries.pop(key)
+        self.size_bytes -= size
+
+
+class MongoCompletionCache:
+    """
+    Tier shared by every app instance, stored in the `completion_cache`
+    collection and expired by a TTL index.
+    """
+
+    def __init__(self, ttl: float = 3600):
+        self.ttl = ttl
+        self.stats = CacheStats()
+
+    async def get(self, key: str) -> Optional[str]:
+        doc = await CompletionCacheEntry.get_motor_collection().find_one(
+            {"key": key, "expires_at": {"$gt": datetime.now(timezone.utc)}},
+            projection={"value": 1},
+        )
+        if doc is None:
+            self.stats.misses += 1
+            return None
+        self.stats.hits += 1
+        return doc["value"]
+
+    async def set(self, key: str, value: str) -> None:
+        expires_at = datetime.now(timezone.utc) + timedelta(seconds=self.ttl)
+        await CompletionCacheEntry.get_motor_collection().update_one(
+            {"key": key}, {"$set": {"value": value, "expires_at": expires_at}}, upsert=True
+        )
+
+
+class TieredCompletionCache:
+    """
+    Looks tiers up in order (fastest first) and back-fills the faster tiers
+    on a hit further down. Cache failures are counted and treated as misses,
+    so a broken shared tier never fails a prompt.
+    """
+
+    def __init__(self, tiers: List[CompletionCache]):
+        self.tiers = tiers
+        self.stats = CacheStats()
+
+    async def get(self, key: str) -> Optional[str]:
+        for i, tier in enumerate(self.tiers):
+            try:
+                value = await tier.get(key)
+            except Exception as e:
+                print(e)
+                self.stats.errors += 1
+                continue
+            if value is not None:
+                self.stats.hits += 1
+                for faster in self.tiers[:i]:
+                    await self._set(faster, key, value)
+                return value
+        self.stats.misses += 1
+        return None
+
+    async def set(self, key: str, value: str) -> None:
+        for tier in self.tiers:
+            await self._set(tier, key, value)
+
+    async def _set(self, tier: CompletionCache, key: str, value: str):
+        try:
+            await tier.set(key, value)
+        except Exception as e:
+            print(e)
+            self.stats.errors += 1
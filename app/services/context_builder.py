@@ -0,0 +1,182 @@
+import math
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Sequence
+
+from app.config import settings
+from app.models import Conversation, Message
+
+try:
+    import tiktoken
+except ImportError:  # optional: fall back to a character-based estimate
+    tiktoken = None
+
+# Context strategies
+STRATEGY_LAST_N = "last_n"
+STRATEGY_HEAD_TAIL = "head_tail"
+
+# Context window sizes of known models, matched by longest prefix of the model name
+MODEL_CONTEXT_WINDOWS = {
+    "gpt-4o": 128000,
+    "gpt-4o-mini": 128000,
+    "gpt-4-turbo": 128000,
+    "gpt-4.1": 1047576,
+    "gpt-4": 8192,
+    "gpt-3.5-turbo": 16385,
+    "o1": 200000,
+    "o3": 200000,
+}
+DEFAULT_CONTEXT_WINDOW = 8192
+
+SUMMARY_PREFIX = "Summary of the earlier conversation:\n"
+
+# Chat formatting overhead: every message is wrapped in a few tokens, and the
+# reply is primed with a few more
+TOKENS_PER_MESSAGE = 4
+TOKENS_PER_REPLY = 3
+CHARS_PER_TOKEN = 4
+
+
+@lru_cache(maxsize=None)
+def _encoding(model: str):
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("o200k_base")
+
+
+@lru_cache(maxsize=settings.CONTEXT_TOKEN_CACHE_SIZE)
+def count_tokens(text: str, model: str) -> int:
+    """
+    Counts the tokens of `text` with the model's tokenizer when tiktoken is
+    installed, otherwise estimates them. Results are cached, so history that
+    is resent every turn is only counted once.
+    """
+    if tiktoken is not None:
+        return len(_encoding(model).encode(text))
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def context_window(model: str) -> int:
+    matches = [name for name in MODEL_CONTEXT_WINDOWS if model.startswith(name)]
+    if not matches:
+        return DEFAULT_CONTEXT_WINDOW
+    return MODEL_CONTEXT_WINDOWS[max(matches, key=len)]
+
+
+def parse_token_budgets(value: str) -> Dict[str, int]:
+    """
+    Parses "model=tokens,model=tokens" into a dict.
+    """
+    budgets = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        model, _, tokens = item.partition("=")
+        if not tokens:
+            raise ValueError(f"Invalid token budget entry: {item}")
+        budgets[model.strip()] = int(tokens)
+    return budgets
+
+
+class ContextBuilder:
+    """
+    Fits conversation history into a token budget for the LLM call.
+
+    The pinned system prompt and the newest message are always sent. The rest
+    is filled from the newest message backwards until the budget (or
+    `max_messages`) runs out. The "head_tail" strategy first keeps the
+    opening `head_messages` messages, which often set up the task.
+    When the conversation has a running summary, it is sent (as a system
+    message) in place of the messages it covers.
+    History is read page by page from the end, so long conversations are
+    never loaded in full.
+    """
+
+    def __init__(
+        self,
+        model: str,
+        budget: int,
+        strategy: str = STRATEGY_LAST_N,
+        max_messages: int = 0,
+        head_messages: int = 2,
+        system_prompt: str = "",
+        page_size: int = 50,
+    ):
+        if strategy not in (STRATEGY_LAST_N, STRATEGY_HEAD_TAIL):
+            raise ValueError(f"Unknown context strategy: {strategy}")
+        self.model = model
+        self.budget = budget
+        self.strategy = strategy
+        self.max_messages = max_messages
+        self.head_messages = head_messages if strategy == STRATEGY_HEAD_TAIL else 0
+        self.system_prompt = system_prompt
+        self.page_size = page_size
+
+    @classmethod
+    def from_settings(cls, model: Optional[str] = None) -> "ContextBuilder":
+        model = model or settings.OPENAI_MODEL
+        budget = parse_token_budgets(settings.CONTEXT_TOKEN_BUDGETS).get(model)
+        if budget is None:
+            budget = context_window(model) - settings.CONTEXT_RESPONSE_TOKENS
+        return cls(
+            model=model,
+            budget=budget,
+            strategy=settings.CONTEXT_STRATEGY,
+            max_messages=settings.CONTEXT_MAX_MESSAGES,
+            head_messages=settings.CONTEXT_HEAD_MESSAGES,
+            system_prompt=settings.SYSTEM_PROMPT,
+            page_size=settings.MESSAGE_PAGE_SIZE,
+        )
+
+    def message_tokens(self, content: str) -> int:
+        return count_tokens(content, self.model) + TOKENS_PER_MESSAGE
+
+    async def build(self, conv: Conversation, pending: Sequence[Message] = ()) -> List[Dict[str, Any]]:
+        """
+        Returns the context for the next LLM call: the stored history of
+        `conv` followed by `pending` messages that are not stored yet.
+        """
+        remaining = self.budget - TOKENS_PER_REPLY
+        system = []
+        if self.system_prompt:
+            system = [{"role": "system", "content": self.system_prompt}]
+            remaining -= self.message_tokens(self.system_prompt)
+
+        floor = 0
+        if conv.summary:
+            summary = SUMMARY_PREFIX + conv.summary
+            system.append({"role": "system", "content": summary})
+            remaining -= self.message_tokens(summary)
+            floor = conv.summary_upto
+
+        total = conv.total_messages()
+        limit = self.max_messages or math.inf
+        head = []
+        if self.head_messages and not floor:
+            # Leave room for at least the newest message
+            head_count = int(min(self.head_messages, total, limit - 1))
+            for m in await conv.read_messages(0, head_count):
+                cost = self.message_tokens(m.content)
+                if cost > remaining:
+                    break
+                head.append(m)
+                remaining -= cost
+
+        # Newest first until the budget runs out, always keeping the newest message
+        tail: List[Message] = []
+        for m in reversed(pending):
+            tail.append(m)
+            remaining -= self.message_tokens(m.content)
+        floor = max(floor, len(head))
+        end = total
+        full = False
+        while end > floor and not full:
+            start = max(floor, end - self.page_size)
+            for m in reversed(await conv.read_messages(start, end)):
+                cost = self.message_tokens(m.content)
+                if len(head) + len(tail) >= limit or (tail and cost > remaining):
+                    full = True
+                    break
+                tail.append(m)
+                remaining -= cost
+            end = start
+
+        return system + [{"role": m.role, "content": m.content} for m in head + tail[::-1]]
@@ -0,0 +1,149 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+from beanie import PydanticObjectId
+
+from app.models import Conversation, Message
+
+# Rough per-document and per-message overhead (field names, BSON framing, timestamps)
+DOCUMENT_OVERHEAD_BYTES = 256
+MESSAGE_OVERHEAD_BYTES = 64
+
+
+def _message_bytes(message: Message) -> int:
+    return len(message.content.encode("utf-8")) + MESSAGE_OVERHEAD_BYTES
+
+
+def estimate_size(conv: Conversation) -> int:
+    return (
+        DOCUMENT_OVERHEAD_BYTES
+        + len(conv.title.encode("utf-8"))
+        + len((conv.summary or "").encode("utf-8"))
+        + sum(_message_bytes(m) for m in conv.messages)
+    )
+
+
+@dataclass
+class ConversationCacheStats:
+    hits: int = 0
+    misses: int = 0
+    # Cached but outdated (another request or worker wrote since); reloaded
+    stale: int = 0
+    evictions: int = 0
+    invalidations: int = 0
+    # Estimated document bytes served from memory instead of MongoDB
+    bytes_saved: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses + self.stale
+        return self.hits / lookups if lookups else 0.0
+
+
+class ConversationCache:
+    """
+    Read-through cache of conversation documents, bounded by entry count
+    and by (estimated) total bytes, evicting the least recently used.
+
+    Every lookup of a cached conversation first reads only its `version`
+    from MongoDB; the cached copy is served only if that still matches, so
+    writes from other requests or workers are never missed. Every writer
+    bumps `version`. After an append or field update, the writer's object
+    is stored back (write-through) when it is known to mirror the stored
+    document, otherwise the entry is dropped.
+
+    Callers always get their own copy and may append to it freely.
+    """
+
+    def __init__(self, max_entries: int = 1000, max_bytes: int = 64 * 1024 * 1024, enabled: bool = True):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.stats = ConversationCacheStats()
+        self.size_bytes = 0
+        self._entries: "OrderedDict[PydanticObjectId, Tuple[Conversation, int]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def get(self, conversation_id: PydanticObjectId) -> Optional[Conversation]:
+        if not self.enabled:
+            return await Conversation.get(conversation_id)
+
+        entry = self._entries.get(conversation_id)
+        if entry is not None:
+            cached, size = entry
+            current = await Conversation.get_motor_collection().find_one(
+                {"_id": conversation_id}, projection={"version": 1}
+            )
+            if current is None:
+                self.invalidate(conversation_id)
+                return None
+            if current.get("version", 0) == cached.version:
+                self._entries.move_to_end(conversation_id)
+                self.stats.hits += 1
+                self.stats.bytes_saved += size
+                return cached.snapshot()
+            self.stats.stale += 1
+        else:
+            self.stats.misses += 1
+
+        conv = await Conversation.get(conversation_id)
+        if conv is None:
+            self.invalidate(conversation_id)
+            return None
+        self.store(conv)
+        return conv
+
+    def store(self, conv: Conversation):
+        """
+        Caches a copy of `conv` after a load or a write. Objects that may have
+        missed another writer's changes are not cached, and an entry is
+        never replaced by an older version.
+        """
+        if not self.enabled:
+            return
+        if not conv.in_sync:
+            self.invalidate(conv.id)
+            return
+
+        entry = self._entries.get(conv.id)
+        if entry is not None:
+            cached, size = entry
+            if cached.version > conv.version:
+                return
+            if cached.version == conv.version:
+                self._entries.move_to_end(conv.id)
+                return
+            # Appends only add messages, so size the new ones instead of rescanning
+            if cached.storage == conv.storage and len(cached.messages) <= len(conv.messages):
+                size += sum(_message_bytes(m) for m in conv.messages[len(cached.messages):])
+                size += len((conv.summary or "").encode("utf-8")) - len((cached.summary or "").encode("utf-8"))
+                size += len(conv.title.encode("utf-8")) - len(cached.title.encode("utf-8"))
+            else:
+                size = estimate_size(conv)
+            self._remove(conv.id)
+        else:
+            size = estimate_size(conv)
+
+        if size > self.max_bytes:
+            return
+        self._entries[conv.id] = (conv.snapshot(), size)
+        self.size_bytes += size
+        while len(self._entries) > self.max_entries or self.size_bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+            self.stats.evictions += 1
+
+    def invalidate(self, conversation_id: PydanticObjectId):
+        if conversation_id in self._entries:
+            self._remove(conversation_id)
+            self.stats.invalidations += 1
+
+    def clear(self):
+        self._entries.clear()
+        self.size_bytes = 0
+
+    def _remove(self, conversation_id: PydanticObjectId):
+        _, size = self._entries.pop(conversation_id)
+        self.size_bytes -= size
@@ -0,0 +1,310 @@
+import asyncio
+import fcntl
+import hashlib
+import heapq
+import json
+import os
+import re
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable, List, Optional, Sequence, Tuple
+
+from beanie import PydanticObjectId
+
+from app.models import Conversation, Message
+
+try:
+    import numpy as np
+except ImportError:  # optional: only needed for the embedding index
+    np = None
+
+VECTORS_FILE = "vectors.f32"
+ROWS_FILE = "rows.bin"
+HEADER_FILE = "header.json"
+LOCK_FILE = ".lock"
+
+# Vectors scored per matrix product; also how often the latency budget is checked
+SEARCH_CHUNK_ROWS = 65536
+
+# Takes texts, returns one vector per text
+EmbedFn = Callable[[List[str]], Awaitable[List[Sequence[float]]]]
+
+_WORD = re.compile(r"\w+")
+
+
+def require_numpy():
+    if np is None:
+        raise RuntimeError("The embedding index needs numpy; install it or set SEARCH_EMBEDDINGS_ENABLED=false")
+
+
+def hashing_embedder(dim: int) -> EmbedFn:
+    """
+    Local, deterministic embeddings: signed feature hashing of lower-cased
+    words. Lexical rather than semantic, but needs no model or network, so
+    it suits tests and offline deployments.
+    """
+    async def embed(texts: List[str]) -> List[Sequence[float]]:
+        vectors = []
+        for text in texts:
+            vector = [0.0] * dim
+            for word in _WORD.findall(text.lower()):
+                h = int.from_bytes(hashlib.blake2b(word.encode(), digest_size=8).digest(), "little")
+                vector[h % dim] += 1.0 if h >> 63 else -1.0
+            vectors.append(vector)
+        return vectors
+    return embed
+
+
+@dataclass
+class SearchMatch:
+    conversation_id: PydanticObjectId
+    seq: int
+    score: float
+
+
+class EmbeddingIndex:
+    """
+    Append-only local index of message embeddings, searched by brute-force
+    cosine similarity.
+
+    `vectors.f32` holds unit-length float32 rows and `rows.bin` the matching
+    (conversation id, message seq) pairs; `header.json` records the
+    dimension, the embedding model and the number of committed rows, so a
+    crash mid-append leaves at most an ignored tail. Searches memory-map the
+    vector file and score it in chunks, in a worker thread, stopping early
+    (and reporting it) once the latency budget is spent. Appends take a
+    file lock, so workers sharing the directory can all write to it.
+    """
+
+    def __init__(self, path: str, model: str):
+        self.path = path
+        self.model = model
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def header(self) -> Optional[dict]:
+        try:
+            with open(self._file(HEADER_FILE), encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def count(self) -> int:
+        header = self.header()
+        return header["count"] if header else 0
+
+    def add(self, rows: List[Tuple[PydanticObjectId, int]], vectors: Sequence[Sequence[float]]):
+        """
+        Appends vectors for (conversation id, seq) rows. Blocking file I/O:
+        call it from a worker thread.
+        """
+        require_numpy()
+        if not rows:
+            return
+        matrix = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix /= np.where(norms == 0, 1, norms)
+        ids = np.zeros(len(rows), dtype=_row_dtype())
+        ids["conversation_id"] = [np.frombuffer(bytes(PydanticObjectId(c).binary), dtype=np.uint8) for c, _ in rows]
+        ids["seq"] = [seq for _, seq in rows]
+
+        os.makedirs(self.path, exist_ok=True)
+        with open(self._file(LOCK_FILE), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            header = self.header() or {"dim": matrix.shape[1], "model": self.model, "count": 0}
+            if header["dim"] != matrix.shape[1] or header["model"] != self.model:
+                raise ValueError(
+                    f"The index at {self.path} holds {header['model']} vectors of dimension {header['dim']}; "
+                    "rebuild it to change the embedding model"
+                )
+            count = header["count"]
+            # Drop whatever an interrupted append left past the committed rows
+            for name, row_bytes, data in (
+                (VECTORS_FILE, matrix.shape[1] * 4, matrix),
+                (ROWS_FILE, ids.dtype.itemsize, ids),
+            ):
+                with open(self._file(name), "ab") as f:
+                    f.truncate(count * row_bytes)
+                    f.write(data.tobytes())
+                    f.flush()
+                    os.fsync(f.fileno())
+            header["count"] = count + len(rows)
+            with open(self._file(HEADER_FILE + ".tmp"), "w", encoding="utf-8") as f:
+                json.dump(header, f)
+            os.replace(self._file(HEADER_FILE + ".tmp"), self._file(HEADER_FILE))
+
+    def search(self, vector: Sequence[float], limit: int, budget: float = 0.0) -> Tuple[List[SearchMatch], bool]:
+        """
+        Returns the `limit` rows most similar to `vector`, best first, and
+        whether the scan was cut short by `budget` seconds (0 = no budget).
+        Blocking: call it from a worker thread.
+        """
+        require_numpy()
+        header = self.header()
+        if not header or header["count"] == 0:
+            return [], False
+        count, dim = header["count"], header["dim"]
+        query = np.asarray(vector, dtype=np.float32)
+        if query.shape != (dim,):
+            raise ValueError(f"Query vector has dimension {query.shape[0]}, the index {dim}")
+        norm = np.linalg.norm(query)
+        if norm == 0:
+            return [], False
+        query /= norm
+
+        vectors = np.memmap(self._file(VECTORS_FILE), dtype=np.float32, mode="r", shape=(count, dim))
+        deadline = time.perf_counter() + budget if budget > 0 else None
+        best: List[Tuple[float, int]] = []  # min-heap of (score, row)
+        partial = False
+        for start in range(0, count, SEARCH_CHUNK_ROWS):
+            if deadline is not None and start and time.perf_counter() > deadline:
+                partial = True
+                break
+            scores = vectors[start:start + SEARCH_CHUNK_ROWS] @ query
+            k = min(limit, len(scores))
+            top = np.argpartition(scores, -k)[-k:]
+            for row in top:
+                item = (float(scores[row]), start + int(row))
+                if len(best) < limit:
+                    heapq.heappush(best, item)
+                elif item > best[0]:
+                    heapq.heapreplace(best, item)
+        del vectors
+
+        best.sort(reverse=True)
+        ids = np.memmap(self._file(ROWS_FILE), dtype=_row_dtype(), mode="r", shape=(count,))
+        matches = [
+            SearchMatch(PydanticObjectId(bytes(ids[row]["conversation_id"])), int(ids[row]["seq"]), score)
+            for score, row in best
+        ]
+        del ids
+        return matches, partial
+
+    def clear(self):
+        for name in (HEADER_FILE, VECTORS_FILE, ROWS_FILE):
+            try:
+                os.remove(self._file(name))
+            except FileNotFoundError:
+                pass
+
+
+def _row_dtype():
+    return np.dtype([("conversation_id", np.uint8, (12,)), ("seq", "<i8")])
+
+
+@dataclass
+class EmbeddingIndexerStats:
+    queued: int = 0
+    indexed: int = 0
+    dropped: int = 0  # queue full; rebuild the index to pick them up
+    errors: int = 0
+
+
+class EmbeddingIndexer:
+    """
+    Keeps the embedding index current as messages are appended: callers
+    enqueue new messages without waiting, and a background worker embeds
+    them in batches and appends them to the index. Indexing is best effort;
+    anything dropped or failed is picked up by `rebuild`.
+    """
+
+    def __init__(
+        self,
+        index: EmbeddingIndex,
+        embed: EmbedFn,
+        enabled: bool = False,
+        batch_size: int = 64,
+        max_queue: int = 10000,
+    ):
+        self.index = index
+        self.embed = embed
+        self.enabled = enabled
+        self.batch_size = batch_size
+        self.max_queue = max_queue
+        self.stats = EmbeddingIndexerStats()
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        if self.enabled and self._task is None:
+            require_numpy()
+            self._queue = asyncio.Queue(maxsize=self.max_queue)
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """
+        Indexes what is already queued, then stops the worker.
+        """
+        if self._task is None:
+            return
+        await self._queue.join()
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        self._queue = None
+
+    def add(self, conversation_id: PydanticObjectId, first_seq: int, messages: Sequence[Message]):
+        if self._queue is None:
+            return
+        for offset, message in enumerate(messages):
+            try:
+                self._queue.put_nowait((conversation_id, first_seq + offset, message.content))
+                self.stats.queued += 1
+            except asyncio.QueueFull:
+                self.stats.dropped += 1
+
+    async def _run(self):
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < self.batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            try:
+                await self.write([(c, s) for c, s, _ in batch], [text for _, _, text in batch])
+                self.stats.indexed += len(batch)
+            except Exception as e:
+                self.stats.errors += 1
+                print(e)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def write(self, rows: List[Tuple[PydanticObjectId, int]], texts: List[str]):
+        vectors = await self.embed(texts)
+        await asyncio.to_thread(self.index.add, rows, vectors)
+
+    async def search(self, text: str, limit: int, budget: float = 0.0) -> Tuple[List[SearchMatch], bool]:
+        vector = (await self.embed([text]))[0]
+        return await asyncio.to_thread(self.index.search, vector, limit, budget)
+
+    async def rebuild(self, page_size: int = 500) -> int:
+        """
+        Re-embeds every stored message into a fresh index. Returns the
+        number of messages indexed.
+        """
+        require_numpy()
+        self.index.clear()
+        indexed = 0
+        async for conv in Conversation.find({}):
+            total = conv.total_messages()
+            for start in range(0, total, page_size):
+                messages = await conv.read_messages(start, min(start + page_size, total))
+                for i in range(0, len(messages), self.batch_size):
+                    chunk = messages[i:i + self.batch_size]
+                    rows = [(conv.id, start + i + j) for j in range(len(chunk))]
+                    await self.write(rows, [m.content for m in chunk])
+                    indexed += len(chunk)
+        return indexed
+
+
+async def main():
+    from app.database import init_db
+    from app.services.llm_services import embedding_indexer
+
+    await init_db()
+    indexed = await embedding_indexer.rebuild()
+    print(f"Indexed {indexed} message(s) into {embedding_indexer.index.path}.")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
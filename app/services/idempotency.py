@@ -0,0 +1,76 @@
+import hashlib
+import json
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from fastapi import HTTPException, status
+from pymongo.errors import DuplicateKeyError
+
+from app.models import IdempotencyRecord
+from app.services.single_flight import SingleFlight
+
+
+def request_hash(payload: Any) -> str:
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+class IdempotencyStore:
+    """
+    Runs a request at most once per (scope, Idempotency-Key).
+
+    The first request claims the key with an insert (unique index), runs, and
+    stores its JSON response. Retries with the same key and body get that
+    response back. Reusing a key for a different body is rejected with 422.
+    While the original is still running, retries on the same instance wait
+    for it and retries elsewhere get 409. If the original fails, the claim
+    is released so the request can be retried.
+    """
+
+    def __init__(self, ttl: float = 86400):
+        self.ttl = ttl
+        self.replayed = 0
+        self._flights = SingleFlight()
+
+    async def run(
+        self,
+        scope: str,
+        key: str,
+        body_hash: str,
+        fn: Callable[[], Awaitable[Dict[str, Any]]],
+    ) -> Dict[str, Any]:
+        return await self._flights.do((scope, key), lambda: self._run_once(scope, key, body_hash, fn))
+
+    async def _run_once(self, scope, key, body_hash, fn) -> Dict[str, Any]:
+        collection = IdempotencyRecord.get_motor_collection()
+        expires_at = datetime.now(timezone.utc) + timedelta(seconds=self.ttl)
+        try:
+            await collection.insert_one({
+                "scope": scope, "key": key, "request_hash": body_hash,
+                "completed": False, "response": None, "expires_at": expires_at,
+            })
+        except DuplicateKeyError:
+            return self._replay(await collection.find_one({"scope": scope, "key": key}), body_hash)
+
+        try:
+            response = await fn()
+        except BaseException:
+            await collection.delete_one({"scope": scope, "key": key, "completed": False})
+            raise
+        await collection.update_one(
+            {"scope": scope, "key": key},
+            {"$set": {"completed": True, "response": response}},
+        )
+        return response
+
+    def _replay(self, record: Optional[Dict[str, Any]], body_hash: str) -> Dict[str, Any]:
+        if record is None:
+            # Released by a failed original between our insert and read
+            raise HTTPException(status.HTTP_409_CONFLICT, "Request with this Idempotency-Key failed; retry it")
+        if record["request_hash"] != body_hash:
+            raise HTTPException(
+                status.HTTP_422_UNPROCESSABLE_ENTITY, "Idempotency-Key was already used for a different request"
+            )
+        if not record["completed"]:
+            raise HTTPException(status.HTTP_409_CONFLICT, "Request with this Idempotency-Key is still in progress")
+        self.replayed += 1
+        return record["response"]
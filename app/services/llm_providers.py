@@ -0,0 +1,270 @@
+import asyncio
+import hashlib
+import time
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterable, List, Optional, Protocol, Tuple
+
+from openai import AsyncOpenAI
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
+
+DEFAULT_PROVIDER = "openai"
+# LLM_PROVIDERS value that selects the in-process fake instead of a server URL
+FAKE_PROVIDER_URL = "fake"
+
+
+class LLMProvider(Protocol):
+    """
+    A chat completion backend. `create` takes the arguments of OpenAI's
+    `chat.completions.create` and returns its result: a ChatCompletion, or
+    an async iterable of ChatCompletionChunk with a `close()` when streaming.
+    """
+
+    name: str
+
+    async def create(self, model: str, messages: List[Dict[str, Any]], stream: bool = False) -> Any:
+        ...
+
+    async def close(self) -> None:
+        ...
+
+
+class OpenAIProvider:
+    """
+    The OpenAI API or any server implementing it (vLLM, Ollama, llama.cpp,
+    LM Studio...). The client is looked up on every call, so the shared
+    default client can be replaced (e.g. by tests) after routing is set up.
+    """
+
+    def __init__(self, name: str, client: Callable[[], AsyncOpenAI], close: Optional[Callable[[], Awaitable]] = None):
+        self.name = name
+        self._client = client
+        self._close = close
+
+    async def create(self, model: str, messages: List[Dict[str, Any]], stream: bool = False) -> Any:
+        if stream:
+            return await self._client().chat.completions.create(model=model, messages=messages, stream=True)
+        return await self._client().chat.completions.create(model=model, messages=messages)
+
+    async def close(self) -> None:
+        if self._close is not None:
+            await self._close()
+
+
+class FakeProvider:
+    """
+    Deterministic in-process provider for tests and local development:
+    replies "[model] " followed by a digest of the last message, after
+    `latency` seconds, and reports usage like the real API.
+    """
+
+    def __init__(self, name: str = "fake", latency: float = 0.0):
+        self.name = name
+        self.latency = latency
+        self.calls = 0
+
+    def reply(self, model: str, messages: List[Dict[str, Any]]) -> str:
+        last = messages[-1]["content"] if messages else ""
+        return f"[{model}] reply {hashlib.sha256(last.encode()).hexdigest()[:12]}"
+
+    async def create(self, model: str, messages: List[Dict[str, Any]], stream: bool = False) -> Any:
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        content = self.reply(model, messages)
+        usage = {
+            "prompt_tokens": sum(len(m["content"]) for m in messages) // 4 + 1,
+            "completion_tokens": len(content.split()),
+        }
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        if stream:
+            return FakeStream(model, content.split(" "))
+        return ChatCompletion.model_validate({
+            "id": "chatcmpl-fake",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+            "usage": usage,
+        })
+
+    async def close(self) -> None:
+        pass
+
+
+class FakeStream:
+    def __init__(self, model: str, words: List[str]):
+        self.model = model
+        self.words = words
+        self.closed = False
+
+    async def __aiter__(self) -> AsyncIterator[ChatCompletionChunk]:
+        for i, word in enumerate(self.words):
+            if self.closed:
+                return
+            yield ChatCompletionChunk.model_validate({
+                "id": "chatcmpl-fake",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": self.model,
+                "choices": [{"index": 0, "delta": {"content": word if i == 0 else f" {word}"}, "finish_reason": None}],
+            })
+
+    async def close(self) -> None:
+        self.closed = True
+
+
+@dataclass(frozen=True)
+class Route:
+    provider: str
+    model: str
+
+    def __str__(self) -> str:
+        return f"{self.provider}/{self.model}"
+
+
+@dataclass
+class LLMRouterStats:
+    hedged: int = 0  # backup requests started because the primary was slow
+    hedge_wins: int = 0  # ...that answered first
+    fallbacks: int = 0  # backup requests started because the primary failed
+
+
+def parse_providers(value: str) -> Dict[str, str]:
+    """
+    Parses "name=base_url,name=fake" into a dict.
+    """
+    providers = {}
+    for item in value.split(","):
+        if not item.strip():
+            continue
+        name, _, url = item.partition("=")
+        if not name.strip() or not url.strip():
+            raise ValueError(f"Invalid provider entry: {item!r}")
+        providers[name.strip()] = url.strip()
+    return providers
+
+
+def parse_route(value: str, providers: Iterable[str], default_provider: str) -> Route:
+    """
+    Parses "provider/model". Model names may contain slashes themselves,
+    so the prefix only names a provider if one is configured under it.
+    """
+    provider, sep, model = value.partition("/")
+    if sep and provider in providers:
+        return Route(provider, model)
+    return Route(default_provider, value)
+
+
+def parse_routing_rules(value: str, providers: Iterable[str], default_provider: str) -> List[Tuple[int, Route]]:
+    """
+    Parses "max_tokens=provider/model,..." routing rules.
+    """
+    rules = []
+    for item in value.split(","):
+        if not item.strip():
+            continue
+        tokens, _, target = item.partition("=")
+        rules.append((int(tokens), parse_route(target.strip(), providers, default_provider)))
+    return rules
+
+
+class LLMRouter:
+    """
+    Picks a provider and model for each call, and optionally hedges it.
+
+    Routing, first match wins: the conversation's own `model` setting
+    ("provider/model", or a bare model name on the default provider); then
+    the first rule whose token threshold covers the context size; then the
+    default route.
+
+    With a `hedge` route, a call that has not answered after `hedge_delay`
+    seconds (or that fails sooner) is also sent there; the first answer
+    wins and the other call is cancelled, or closed if it was a stream.
+    """
+
+    def __init__(
+        self,
+        providers: Dict[str, LLMProvider],
+        default: Route,
+        rules: Optional[List[Tuple[int, Route]]] = None,
+        hedge: Optional[Route] = None,
+        hedge_delay: float = 2.0,
+    ):
+        for route in [default, hedge, *(r for _, r in rules or [])]:
+            if route is not None and route.provider not in providers:
+                raise ValueError(f"Unknown LLM provider: {route.provider}")
+        self.providers = providers
+        self.default = default
+        self.rules = sorted(rules or [], key=lambda rule: rule[0])
+        self.hedge = hedge
+        self.hedge_delay = hedge_delay
+        self.stats = LLMRouterStats()
+
+    def parse_route(self, value: str) -> Route:
+        return parse_route(value, self.providers, self.default.provider)
+
+    def route(self, tokens: int, conversation_model: Optional[str] = None) -> Route:
+        if conversation_model:
+            return self.parse_route(conversation_model)
+        for max_tokens, route in self.rules:
+            if tokens <= max_tokens:
+                return route
+        return self.default
+
+    async def complete(self, route: Route, messages: List[Dict[str, Any]]) -> Tuple[Any, Route]:
+        return await self._call(route, messages, stream=False)
+
+    async def open_stream(self, route: Route, messages: List[Dict[str, Any]]) -> Tuple[Any, Route]:
+        return await self._call(route, messages, stream=True)
+
+    async def close(self):
+        for provider in self.providers.values():
+            await provider.close()
+
+    async def _call(self, route: Route, messages: List[Dict[str, Any]], stream: bool) -> Tuple[Any, Route]:
+        def call(target: Route):
+            return self.providers[target.provider].create(target.model, messages, stream=stream)
+
+        if self.hedge is None or self.hedge == route:
+            return await call(route), route
+
+        primary = asyncio.create_task(call(route))
+        done, _ = await asyncio.wait({primary}, timeout=self.hedge_delay)
+        if done and primary.exception() is None:
+            return primary.result(), route
+
+        if done:
+            self.stats.fallbacks += 1
+        else:
+            self.stats.hedged += 1
+        backup = asyncio.create_task(call(self.hedge))
+        targets = {primary: route, backup: self.hedge}
+        pending = {backup} if done else {primary, backup}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                winners = [task for task in done if task.exception() is None]
+                if winners:
+                    # Both may have answered at once: keep one, close the other
+                    for extra in winners[1:]:
+                        await _discard(extra.result())
+                    if targets[winners[0]] == self.hedge and not primary.done():
+                        self.stats.hedge_wins += 1
+                    return winners[0].result(), targets[winners[0]]
+            raise primary.exception()
+        finally:
+            for task in pending:
+                task.cancel()
+                task.add_done_callback(_discard_in_background)
+
+
+async def _discard(result: Any):
+    # Losing streams must be closed to free their connection
+    close = getattr(result, "close", None)
+    if close is not None and asyncio.iscoroutinefunction(close):
+        await close()
+
+
+def _discard_in_background(task: asyncio.Task):
+    # A cancelled call may still have completed before the cancellation landed
+    if not task.cancelled() and task.exception() is None:
+        asyncio.ensure_future(_discard(task.result()))
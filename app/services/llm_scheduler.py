@@ -0,0 +1,240 @@
+import asyncio
+import random
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Deque, Dict, Optional, TypeVar
+
+import openai
+
+T = TypeVar("T")
+
+
+class SchedulerRejected(Exception):
+    """
+    The scheduler's queue is full, or a request waited longer than allowed.
+    """
+
+
+@dataclass
+class SchedulerStats:
+    submitted: int = 0
+    completed: int = 0
+    failed: int = 0
+    rejected: int = 0
+    timed_out: int = 0
+    retries: int = 0
+    waits: int = 0
+    queue_wait_seconds_total: float = 0.0
+    queue_wait_seconds_max: float = 0.0
+
+
+class TokenBucket:
+    """
+    Refills at `per_minute` tokens per minute up to `capacity` (one minute's
+    worth by default). A rate of 0 disables the bucket. Waiters are served
+    in arrival order.
+    """
+
+    def __init__(self, per_minute: float, capacity: Optional[float] = None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity if capacity is not None else per_minute
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, amount: float = 1):
+        if self.rate <= 0:
+            return
+        # Larger requests could never fit; let them through once the bucket is full
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+
+    def consume(self, amount: float):
+        """
+        Charges tokens after the fact (e.g. completion tokens reported by the
+        API). The bucket may go negative, which delays the next acquirers.
+        """
+        if self.rate <= 0:
+            return
+        self._refill()
+        self.tokens -= amount
+
+
+def is_retryable(exc: BaseException) -> bool:
+    if isinstance(exc, openai.APIConnectionError):  # includes timeouts
+        return True
+    if isinstance(exc, openai.APIStatusError):
+        return exc.status_code == 429 or exc.status_code >= 500
+    return False
+
+
+def _retry_after(exc: BaseException) -> float:
+    response = getattr(exc, "response", None)
+    try:
+        return float(response.headers.get("retry-after", 0)) if response is not None else 0.0
+    except ValueError:
+        return 0.0
+
+
+class LLMScheduler:
+    """
+    Sits in front of the LLM client.
+
+    At most `max_concurrency` upstream calls run at once. Waiting requests
+    are queued per priority (higher first) and, within a priority, served
+    round-robin across conversations so one busy conversation cannot starve
+    the rest. Once granted a slot, a request also takes one token from the
+    requests-per-minute bucket and its estimated tokens from the
+    tokens-per-minute bucket.
+
+    Calls failing with 429, 5xx or connection errors are retried up to
+    `retries` times with full-jitter exponential backoff (honouring
+    Retry-After). Requests are rejected with SchedulerRejected when
+    `max_queue` are already waiting or after `queue_timeout` seconds.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 16,
+        requests_per_minute: float = 0,
+        tokens_per_minute: float = 0,
+        max_queue: int = 1000,
+        queue_timeout: float = 30.0,
+        retries: int = 3,
+        backoff_base: float = 0.5,
+        backoff_max: float = 20.0,
+    ):
+        self.max_concurrency = max_concurrency
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.stats = SchedulerStats()
+        self.active = 0
+        self.waiting = 0
+        self._queues: Dict[int, "OrderedDict[str, Deque[asyncio.Future]]"] = {}
+
+    async def acquire(self, conversation_id: str, tokens: int = 0, priority: int = 0):
+        """
+        Waits for a slot and for rate-limit budget. Every successful acquire
+        must be paired with a release().
+        """
+        start = time.monotonic()
+        if self.active < self.max_concurrency and not self.waiting:
+            self.active += 1
+        else:
+            await self._wait_for_slot(conversation_id, priority)
+        try:
+            await self.requests.acquire(1)
+            await self.tokens.acquire(tokens)
+        except BaseException:
+            self.release()
+            raise
+        waited = time.monotonic() - start
+        self.stats.waits += 1
+        self.stats.queue_wait_seconds_total += waited
+        self.stats.queue_wait_seconds_max = max(self.stats.queue_wait_seconds_max, waited)
+
+    def release(self):
+        self.active -= 1
+        self._dispatch()
+
+    async def submit(
+        self,
+        call: Callable[[], Awaitable[T]],
+        conversation_id: str,
+        tokens: int = 0,
+        priority: int = 0,
+    ) -> T:
+        """
+        Runs `call` under the scheduler, retrying transient upstream errors.
+        """
+        self.stats.submitted += 1
+        await self.acquire(conversation_id, tokens, priority)
+        try:
+            result = await self.call_with_retries(call)
+        except BaseException:
+            self.stats.failed += 1
+            raise
+        finally:
+            self.release()
+        self.stats.completed += 1
+        return result
+
+    async def call_with_retries(self, call: Callable[[], Awaitable[T]]) -> T:
+        attempt = 0
+        while True:
+            try:
+                return await call()
+            except Exception as e:
+                if attempt >= self.retries or not is_retryable(e):
+                    raise
+                delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+                attempt += 1
+                self.stats.retries += 1
+                await asyncio.sleep(max(delay, _retry_after(e)))
+
+    async def _wait_for_slot(self, conversation_id: str, priority: int):
+        if self.waiting >= self.max_queue:
+            self.stats.rejected += 1
+            raise SchedulerRejected("LLM request queue is full")
+        waiter = asyncio.get_running_loop().create_future()
+        conversations = self._queues.setdefault(priority, OrderedDict())
+        conversations.setdefault(conversation_id, deque()).append(waiter)
+        self.waiting += 1
+        try:
+            done, _ = await asyncio.wait({waiter}, timeout=self.queue_timeout or None)
+        except asyncio.CancelledError:
+            if waiter.done():
+                self.release()
+            else:
+                waiter.cancel()
+                self.waiting -= 1
+            raise
+        if not done:
+            waiter.cancel()
+            self.waiting -= 1
+            self.stats.rejected += 1
+            self.stats.timed_out += 1
+            raise SchedulerRejected("Timed out waiting for an LLM slot")
+
+    def _dispatch(self):
+        while self.active < self.max_concurrency and self.waiting:
+            waiter = self._next_waiter()
+            if waiter is None:
+                return
+            if waiter.done():  # cancelled or timed out, already uncounted
+                continue
+            waiter.set_result(None)
+            self.waiting -= 1
+            self.active += 1
+
+    def _next_waiter(self) -> Optional[asyncio.Future]:
+        for priority in sorted(self._queues, reverse=True):
+            conversations = self._queues[priority]
+            if not conversations:
+                continue
+            # Round-robin: serve the conversation at the front, then move it to the back
+            conversation_id, waiters = next(iter(conversations.items()))
+            waiter = waiters.popleft()
+            if waiters:
+                conversations.move_to_end(conversation_id)
+            else:
+                del conversations[conversation_id]
+            return waiter
+        return None
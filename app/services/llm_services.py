@@ -1,54 +1,483 @@
+import anyio
+import httpx
+import time
+from datetime import datetime, timezone
 from fastapi import HTTPException
-from openai import OpenAI
-from typing import List, Dict, Any
+from openai import AsyncOpenAI, AsyncStream
+from typing import AsyncIterator, List, Dict, Any, Optional
 from app.config import settings
-from app.models import AuditLog
-import re
+from app.metrics import LLM_REQUEST_SECONDS, metrics, record_llm_usage
+from app.models import AuditLog, Message
+from app.services.audit_archive import AuditArchiver
+from app.services.audit_writer import AuditEntry, AuditWriter
+from app.services.completion_cache import (
+    MemoryCompletionCache,
+    MongoCompletionCache,
+    TieredCompletionCache,
+    cache_key,
+)
+from app.services.conversation_cache import ConversationCache
+from app.services.embedding_index import EmbeddingIndex, EmbeddingIndexer, hashing_embedder
+from app.services.context_builder import TOKENS_PER_REPLY, ContextBuilder
+from app.services.llm_providers import (
+    DEFAULT_PROVIDER,
+    FAKE_PROVIDER_URL,
+    FakeProvider,
+    LLMRouter,
+    OpenAIProvider,
+    Route,
+    parse_providers,
+    parse_route,
+    parse_routing_rules,
+)
+from app.services.llm_scheduler import LLMScheduler, SchedulerRejected
+from app.services.summarizer import Summarizer
+from app.services.masking import MaskingEngine
+
+# PII masking rules, compiled once into a single-pass engine
+masking_engine = MaskingEngine.from_rule_sets(settings.MASKING_RULE_SETS.split(","))
+
+# Fits conversation history into the model's token budget
+context_builder = ContextBuilder.from_settings()
+
+# Completions for identical contexts, used while COMPLETION_CACHE_ENABLED is set
+completion_cache = TieredCompletionCache(
+    [MemoryCompletionCache(
+        max_entries=settings.COMPLETION_CACHE_MAX_ENTRIES,
+        max_bytes=settings.COMPLETION_CACHE_MAX_BYTES,
+        ttl=settings.COMPLETION_CACHE_TTL,
+    )]
+    + ([MongoCompletionCache(ttl=settings.COMPLETION_CACHE_TTL)] if settings.COMPLETION_CACHE_SHARED else [])
+)
+
+# Recently used conversations, so back-to-back prompts skip reloading the full document
+conversation_cache = ConversationCache(
+    max_entries=settings.CONVERSATION_CACHE_MAX_ENTRIES,
+    max_bytes=settings.CONVERSATION_CACHE_MAX_BYTES,
+    enabled=settings.CONVERSATION_CACHE_ENABLED,
+)
 
-# Configure the OpenAI client
-openai = OpenAI(
-    api_key=settings.OPENAI_API_KEY
+# Caps concurrent upstream calls, paces them to the provider's rate limits,
+# and retries transient failures
+llm_scheduler = LLMScheduler(
+    max_concurrency=settings.LLM_MAX_CONCURRENCY,
+    requests_per_minute=settings.LLM_REQUESTS_PER_MINUTE,
+    tokens_per_minute=settings.LLM_TOKENS_PER_MINUTE,
+    max_queue=settings.LLM_MAX_QUEUE,
+    queue_timeout=settings.LLM_QUEUE_TIMEOUT,
+    retries=settings.LLM_RETRY_ATTEMPTS,
+    backoff_base=settings.LLM_RETRY_BACKOFF,
 )
 
-async def get_llm_response(context_messages: List[Dict[str, Any]], convo_id: str) -> str:
+# Shared async OpenAI client, created and closed by the app lifespan
+_client: Optional[AsyncOpenAI] = None
+
+
+def create_llm_client(base_url: Optional[str] = None) -> AsyncOpenAI:
+    """
+    Builds an AsyncOpenAI client on top of a pooled, keep-alive HTTP client.
+    `base_url` overrides OPENAI_BASE_URL (e.g. to target a local stub server).
+    """
+    timeout = httpx.Timeout(settings.LLM_TIMEOUT, connect=settings.LLM_CONNECT_TIMEOUT)
+    http_client = httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=settings.LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.LLM_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.LLM_KEEPALIVE_EXPIRY,
+        ),
+        timeout=timeout,
+    )
+    return AsyncOpenAI(
+        api_key=settings.OPENAI_API_KEY,
+        base_url=base_url or settings.OPENAI_BASE_URL,
+        timeout=timeout,
+        max_retries=settings.LLM_MAX_RETRIES,
+        http_client=http_client,
+    )
+
+
+def get_llm_client() -> AsyncOpenAI:
+    """
+    Returns the shared client, creating it lazily when used outside the app lifespan.
+    """
+    global _client
+    if _client is None:
+        _client = create_llm_client()
+    return _client
+
+
+def _compatible_provider(name: str, base_url: str) -> OpenAIProvider:
+    # Its own pooled client, created on first use like the default one
+    clients: List[AsyncOpenAI] = []
+
+    def client() -> AsyncOpenAI:
+        if not clients:
+            clients.append(create_llm_client(base_url=base_url))
+        return clients[0]
+
+    async def close():
+        while clients:
+            await clients.pop().close()
+
+    return OpenAIProvider(name, client, close)
+
+
+def build_llm_router() -> LLMRouter:
+    providers = {DEFAULT_PROVIDER: OpenAIProvider(DEFAULT_PROVIDER, get_llm_client)}
+    for name, url in parse_providers(settings.LLM_PROVIDERS).items():
+        providers[name] = FakeProvider(name) if url == FAKE_PROVIDER_URL else _compatible_provider(name, url)
+    default = Route(settings.LLM_DEFAULT_PROVIDER, settings.OPENAI_MODEL)
+    hedge = parse_route(settings.LLM_HEDGE_ROUTE, providers, default.provider) if settings.LLM_HEDGE_ROUTE else None
+    return LLMRouter(
+        providers,
+        default,
+        rules=parse_routing_rules(settings.LLM_ROUTES, providers, default.provider),
+        hedge=hedge,
+        hedge_delay=settings.LLM_HEDGE_DELAY,
+    )
+
+
+# Chooses the provider and model of each call, and hedges slow ones
+llm_router = build_llm_router()
+
+
+async def init_llm_client() -> None:
+    get_llm_client()
+
+
+async def close_llm_client() -> None:
+    global _client
+    await llm_router.close()
+    if _client is not None:
+        await _client.close()
+        _client = None
+
+
+async def get_llm_response(
+    context_messages: List[Dict[str, Any]], convo_id: str, use_cache: bool = True, model: Optional[str] = None
+) -> str:
     """
     Calls the LLM with the given conversation context.
     The `context_messages` is a list of dictionaries, each with
     { "role": "user" or "assistant", "content": "text" } as needed by OpenAI.
+    When the completion cache is enabled, identical contexts are answered
+    from it unless `use_cache` is False. Cache hits are audited too.
+    `model` is the conversation's own model setting, if any (see LLMRouter).
+    """
+    llm_reply = await complete_llm(context_messages, convo_id, use_cache=use_cache, model=model)
+    await record_audit(context_messages, llm_reply, convo_id)
+    return llm_reply
+
+
+async def complete_llm(
+    context_messages: List[Dict[str, Any]],
+    convo_id: str,
+    use_cache: bool = True,
+    priority: int = 0,
+    model: Optional[str] = None,
+) -> str:
+    """
+    `get_llm_response` without the audit record, for callers that write
+    audit logs themselves (e.g. in bulk).
     """
-    # Call the OpenAI API
+    tokens = estimate_prompt_tokens(context_messages)
+    route = llm_router.route(tokens, model)
+    key = None
+    if use_cache and settings.COMPLETION_CACHE_ENABLED:
+        key = cache_key(str(route), context_messages)
+        cached = await completion_cache.get(key)
+        if cached is not None:
+            return cached
+
+    # Call the routed provider through the scheduler
+    start = time.perf_counter()
+    outcome = "error"
     try:
-        response = openai.chat.completions.create(
-            model=settings.OPENAI_MODEL,
-            messages=[{"role": msg["role"], "content": msg["content"]} for msg in context_messages]
+        response, served_by = await llm_scheduler.submit(
+            lambda: llm_router.complete(
+                route, [{"role": msg["role"], "content": msg["content"]} for msg in context_messages]
+            ),
+            conversation_id=convo_id,
+            tokens=tokens,
+            priority=priority,
         )
-        print("DEBUG:", response)
+        charge_completion_tokens(response, served_by.model)
         llm_reply = response.choices[0].message.content
+        outcome = "ok"
+    except SchedulerRejected as e:
+        outcome = "rejected"
+        print(e)
+        raise HTTPException(status_code=503, detail="LLM service is busy, try again later.")
     except Exception as e:
         print(e)
         raise HTTPException(status_code=502, detail="LLM service error.")
-    
-    prompt_text = "\n".join([f'{m["role"]}: {m["content"]}' for m in context_messages if m["role"] == "user"])
+    finally:
+        if metrics.enabled:
+            LLM_REQUEST_SECONDS.observe(time.perf_counter() - start, route.model, "complete", outcome)
 
-    # For auditing, store an "anonymized" version. 
-    # Mask PII in both the user prompts and the LLM response.
-    masked_prompt_text = mask_sensitive_info(prompt_text)
-    masked_llm_reply = mask_sensitive_info(llm_reply)
+    if key is not None and llm_reply is not None:
+        await completion_cache.set(key, llm_reply)
+    return llm_reply
 
-    await AuditLog(
-        conversation_id=convo_id,
-        prompt=masked_prompt_text[-2000:],  # store up to 2k chars to avoid long fields
-        response=masked_llm_reply[:2000]
-    ).insert()
 
-    return llm_reply
+async def open_llm_stream(
+    context_messages: List[Dict[str, Any]], convo_id: str = "", model: Optional[str] = None
+) -> AsyncStream:
+    """
+    Starts a streamed completion for the given context.
+    Failures to open the stream surface as a 502 before any bytes are sent.
+    The scheduler slot is held until the stream is closed.
+    """
+    tokens = estimate_prompt_tokens(context_messages)
+    route = llm_router.route(tokens, model)
+    start = time.perf_counter()
+    try:
+        await llm_scheduler.acquire(convo_id, tokens)
+    except SchedulerRejected as e:
+        print(e)
+        if metrics.enabled:
+            LLM_REQUEST_SECONDS.observe(time.perf_counter() - start, route.model, "stream", "rejected")
+        raise HTTPException(status_code=503, detail="LLM service is busy, try again later.")
+    try:
+        stream, served_by = await llm_scheduler.call_with_retries(
+            lambda: llm_router.open_stream(
+                route, [{"role": msg["role"], "content": msg["content"]} for msg in context_messages]
+            )
+        )
+    except BaseException as e:
+        llm_scheduler.release()
+        if not isinstance(e, Exception):
+            raise
+        print(e)
+        if metrics.enabled:
+            LLM_REQUEST_SECONDS.observe(time.perf_counter() - start, route.model, "stream", "error")
+        raise HTTPException(status_code=502, detail="LLM service error.")
+    return ScheduledStream(stream, llm_scheduler.release, start, served_by.model)
+
+
+class ScheduledStream:
+    """
+    Wraps an upstream stream so closing it (once) also frees its scheduler
+    slot and records the call's latency, from acquiring the slot to close.
+    """
+
+    def __init__(self, stream: AsyncStream, release, started: float = 0.0, model: str = settings.OPENAI_MODEL):
+        self._stream = stream
+        self._release = release
+        self._started = started
+        self.model = model
+
+    def __aiter__(self):
+        return self._stream.__aiter__()
+
+    async def close(self):
+        try:
+            await self._stream.close()
+        finally:
+            if self._release is not None:
+                release, self._release = self._release, None
+                release()
+                if metrics.enabled:
+                    LLM_REQUEST_SECONDS.observe(
+                        time.perf_counter() - self._started, self.model, "stream", "ok"
+                    )
+
+
+def estimate_prompt_tokens(context_messages: List[Dict[str, Any]]) -> int:
+    return sum(context_builder.message_tokens(m["content"]) for m in context_messages) + TOKENS_PER_REPLY
+
+
+def charge_completion_tokens(response: Any, model: str = settings.OPENAI_MODEL) -> None:
+    # The prompt was charged up front; completion tokens are only known afterwards
+    usage = getattr(response, "usage", None)
+    if usage is not None and isinstance(getattr(usage, "completion_tokens", None), int):
+        llm_scheduler.tokens.consume(usage.completion_tokens)
+    if metrics.enabled:
+        record_llm_usage(model, usage)
+
+
+async def iter_llm_deltas(stream: AsyncStream) -> AsyncIterator[str]:
+    """
+    Yields the text deltas of a streamed completion as they arrive.
+    The upstream response is always closed, including when the consumer
+    stops early or is cancelled (e.g. the client disconnected).
+    """
+    try:
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+            elif metrics.enabled and getattr(chunk, "usage", None) is not None:
+                # Only sent by servers asked to (or that always) report usage on streams
+                record_llm_usage(getattr(stream, "model", settings.OPENAI_MODEL), chunk.usage)
+    finally:
+        with anyio.CancelScope(shield=True):
+            await stream.close()
+
+
+async def record_audit(context_messages: List[Dict[str, Any]], llm_reply: str, convo_id: str) -> None:
+    """
+    Records the anonymized audit record for one prompt/response turn.
+    While the background writer runs (inside the app lifespan) this only
+    enqueues the raw texts; otherwise the record is masked and written inline.
+    """
+    prompt_lines = audit_prompt_lines(context_messages)
+
+    if audit_writer.running:
+        await audit_writer.submit(convo_id, prompt_lines, llm_reply)
+        return
+
+    record = prepare_audit_batch([AuditEntry(convo_id, prompt_lines, llm_reply, datetime.now(timezone.utc))])[0]
+    await AuditLog(**record).insert()
+
+
+def audit_prompt_lines(context_messages: List[Dict[str, Any]]) -> List[str]:
+    """
+    Picks the trailing user messages that can end up in the stored prompt,
+    newest first until the raw budget is covered, and returns them oldest first.
+    The budget leaves room for masking to shrink the text (a masked email is
+    much shorter than the address) and for the straddle margin.
+    """
+    budget = 4 * settings.AUDIT_PROMPT_CHARS + 2 * masking_engine.max_match_length
+    lines = []
+    size = 0
+    for m in reversed(context_messages):
+        if m["role"] != "user":
+            continue
+        line = f'{m["role"]}: {m["content"]}'
+        lines.append(line)
+        size += len(line) + 1
+        if size >= budget:
+            break
+    lines.reverse()
+    return lines
+
+
+def mask_prompt_tail(lines: List[str], length: int) -> str:
+    """
+    Returns the last `length` characters of the masked, newline-joined prompt,
+    masking lines newest first and stopping once enough is covered.
+    No rule can match across the "\nuser: " separator, so masking line by
+    line gives the same result as masking the joined text.
+    """
+    masked_lines = []
+    size = 0
+    for line in reversed(lines):
+        masked = masking_engine.mask_tail(line, length - size)
+        masked_lines.append(masked)
+        size += len(masked) + 1
+        if size > length:
+            break
+    masked_lines.reverse()
+    return "\n".join(masked_lines)[-length:]
+
+
+def prepare_audit_batch(entries: List[AuditEntry]) -> List[Dict[str, Any]]:
+    """
+    Turns raw audit entries into AuditLog fields. Runs in the audit writer's
+    thread or process pool, so it must stay a picklable module-level function.
+    Only the stored parts are masked: the tail of the prompt and the head of
+    the reply.
+    """
+    records = []
+    for entry in entries:
+        # For auditing, store an "anonymized" version.
+        # Mask PII in both the user prompts and the LLM response.
+        prompt_lines = [entry.prompt] if isinstance(entry.prompt, str) else entry.prompt
+        records.append({
+            "conversation_id": entry.conversation_id,
+            "prompt": mask_prompt_tail(prompt_lines, settings.AUDIT_PROMPT_CHARS),
+            "response": masking_engine.mask_head(entry.response, settings.AUDIT_RESPONSE_CHARS),
+            "timestamp": entry.timestamp,
+        })
+    return records
+
+
+audit_writer = AuditWriter(
+    prepare_batch=prepare_audit_batch,
+    max_queue=settings.AUDIT_QUEUE_SIZE,
+    batch_size=settings.AUDIT_BATCH_SIZE,
+    flush_interval=settings.AUDIT_FLUSH_INTERVAL,
+    overflow=settings.AUDIT_OVERFLOW,
+    spill_path=settings.AUDIT_SPILL_PATH,
+    executor=settings.AUDIT_MASK_EXECUTOR,
+    workers=settings.AUDIT_MASK_WORKERS,
+)
+
+audit_archiver = AuditArchiver(
+    archive_dir=settings.AUDIT_ARCHIVE_DIR,
+    enabled=settings.AUDIT_ARCHIVE_ENABLED,
+    archive_after_days=settings.AUDIT_ARCHIVE_AFTER_DAYS,
+    retention_days=settings.AUDIT_RETENTION_DAYS,
+    interval=settings.AUDIT_ARCHIVE_INTERVAL,
+)
+
+
+async def embed_with_llm(texts: List[str]) -> List[List[float]]:
+    response = await get_llm_client().embeddings.create(model=settings.SEARCH_EMBEDDING_MODEL, input=texts)
+    return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+
+# Local embedding index behind semantic search, fed as messages are appended
+if settings.SEARCH_EMBEDDER == "hashing":
+    _embed, _embedding_model = hashing_embedder(settings.SEARCH_HASHING_DIM), f"hashing-{settings.SEARCH_HASHING_DIM}"
+else:
+    _embed, _embedding_model = embed_with_llm, settings.SEARCH_EMBEDDING_MODEL
+embedding_indexer = EmbeddingIndexer(
+    EmbeddingIndex(settings.SEARCH_INDEX_DIR, _embedding_model),
+    _embed,
+    enabled=settings.SEARCH_EMBEDDINGS_ENABLED,
+    batch_size=settings.SEARCH_INDEX_BATCH,
+    max_queue=settings.SEARCH_INDEX_QUEUE,
+)
+
+
+SUMMARY_INSTRUCTIONS = (
+    "You maintain a running summary of a conversation between a user and an assistant. "
+    "Update the summary with the new messages. Keep facts, decisions, names and open "
+    "questions; drop pleasantries. Reply with the updated summary only."
+)
+
+
+async def summarize_with_llm(previous_summary: str, messages: List[Message]) -> str:
+    """
+    Folds `messages` into `previous_summary` with one LLM call.
+    """
+    transcript = "\n".join(f"{m.role.value}: {m.content}" for m in messages)
+    route = llm_router.parse_route(settings.SUMMARY_MODEL) if settings.SUMMARY_MODEL else llm_router.default
+    model = route.model
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        # Not hedged: summaries run in the background, so latency does not matter
+        response = await llm_router.providers[route.provider].create(
+            model,
+            [
+                {"role": "system", "content": SUMMARY_INSTRUCTIONS},
+                {"role": "user", "content": f"Current summary:\n{previous_summary or '(none)'}\n\nNew messages:\n{transcript}"},
+            ],
+        )
+        outcome = "ok"
+    finally:
+        if metrics.enabled:
+            LLM_REQUEST_SECONDS.observe(time.perf_counter() - start, model, "summary", outcome)
+    if metrics.enabled:
+        record_llm_usage(model, getattr(response, "usage", None))
+    return response.choices[0].message.content
+
+
+summarizer = Summarizer(
+    summarize=summarize_with_llm,
+    trigger_messages=settings.SUMMARY_TRIGGER_MESSAGES,
+    keep_recent=settings.SUMMARY_KEEP_RECENT,
+    chunk_messages=settings.SUMMARY_CHUNK_MESSAGES,
+)
 
 
 def mask_sensitive_info(text: str) -> str:
     """
     Masks sensitive information (PII) in the input text.
     
-    This function targets common Singapore-specific PII:
+    With the default "sg" rule set this targets common Singapore-specific PII:
       - **NRIC/FIN Numbers:** Formats like S1234567D, T1234567A, etc.
       - **Phone Numbers:** Singapore phone numbers (optionally prefixed with +65).
       - **Email Addresses:** Standard email formats.
@@ -58,6 +487,7 @@ def mask_sensitive_info(text: str) -> str:
     
     Note:
       - The address masking uses simple regex patterns and may not cover every possible format.
+      - The rule sets in use come from MASKING_RULE_SETS; see app/services/masking.py.
     
     Parameters:
         text (str): The input text that may contain sensitive information.
@@ -65,23 +495,4 @@ def mask_sensitive_info(text: str) -> str:
     Returns:
         str: The text with sensitive information replaced by masked tags.
     """
-    text = re.sub(r'\b[STFG]\d{7}[A-Z]\b', '[MASKED_NRIC]', text, flags=re.IGNORECASE)
-    text = re.sub(r'\b(?:\+65[- ]?)?(?:6|8|9)\d{7}\b', '[MASKED_PHONE]', text)
-    text = re.sub(r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}\b', '[MASKED_EMAIL]', text)
-    text = re.sub(r'\b\d{6}\b', '[MASKED_POSTAL]', text)
-    # Mask addresses - naive approach:
-    # Pattern for block addresses (e.g., "Blk 123 Ang Mo Kio Ave 3")
-    address_pattern1 = re.compile(
-        r'\b(?:Blk|Block)\s*\d+\w*(?:[\s,]+[A-Za-z0-9]+)*\s+(?:Street|St\.|Road|Rd\.|Avenue|Ave\.|Drive|Dr\.|Lane|Ln\.)\b',
-        flags=re.IGNORECASE
-    )
-    text = address_pattern1.sub('[MASKED_ADDRESS]', text)
-    
-    # Pattern for street addresses (e.g., "123 Orchard Road")
-    address_pattern2 = re.compile(
-        r'\b\d+\s+[A-Za-z0-9\s,]*?(?:Street|St\.|Road|Rd\.|Avenue|Ave\.|Drive|Dr\.|Lane|Ln\.)\b',
-        flags=re.IGNORECASE
-    )
-    text = address_pattern2.sub('[MASKED_ADDRESS]', text)
-    
-    return text
+    return masking_engine.mask(text)
@@ -0,0 +1,159 @@
+import re
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+
+@dataclass(frozen=True)
+class MaskingRule:
+    """
+    One kind of PII. `pattern` is matched with `flags` scoped to the rule, and
+    every match is replaced by `replacement`. `max_length` is an upper bound
+    on the length of a match, used when masking only part of a text.
+    """
+    name: str
+    pattern: str
+    replacement: str
+    max_length: int
+    flags: str = ""
+
+
+@dataclass(frozen=True)
+class RuleSet:
+    name: str
+    rules: Sequence[MaskingRule]
+
+
+_ADDRESS_SUFFIX = r'(?:Street|St\.|Road|Rd\.|Avenue|Ave\.|Drive|Dr\.|Lane|Ln\.)\b'
+
+# Singapore-specific PII, in priority order. The address patterns are the
+# original ones with the unbounded, overlapping quantifiers bounded or made
+# unambiguous so that scanning stays linear in the input length:
+#   - block addresses allow up to 10 words between the block number and the street type
+#   - street addresses allow up to 100 characters between the house number and the street type
+SINGAPORE_RULES = RuleSet("sg", [
+    MaskingRule("nric", r'\b[STFG]\d{7}[A-Z]\b', '[MASKED_NRIC]', max_length=9, flags="i"),
+    MaskingRule("phone", r'\b(?:\+65[- ]?)?(?:6|8|9)\d{7}\b', '[MASKED_PHONE]', max_length=12),
+    MaskingRule(
+        "email",
+        r'\b[A-Za-z0-9._%+-]{1,64}@[A-Za-z0-9.-]{1,255}\.[A-Za-z]{2,63}\b',
+        '[MASKED_EMAIL]',
+        max_length=384,
+    ),
+    MaskingRule("postal", r'\b\d{6}\b', '[MASKED_POSTAL]', max_length=6),
+    MaskingRule(
+        "block_address",
+        r'\b(?:Blk|Block)\s{0,10}\d\w{0,10}(?:[\s,]{1,10}[A-Za-z0-9]{1,40}){0,10}\s{1,10}' + _ADDRESS_SUFFIX,
+        '[MASKED_ADDRESS]',
+        max_length=600,
+        flags="i",
+    ),
+    MaskingRule(
+        "street_address",
+        r'\b\d{1,10}\s[A-Za-z0-9\s,]{0,100}?' + _ADDRESS_SUFFIX,
+        '[MASKED_ADDRESS]',
+        max_length=120,
+        flags="i",
+    ),
+])
+
+_RULE_SETS: Dict[str, RuleSet] = {}
+
+
+def register_rule_set(rule_set: RuleSet):
+    _RULE_SETS[rule_set.name] = rule_set
+
+
+def get_rule_set(name: str) -> RuleSet:
+    try:
+        return _RULE_SETS[name]
+    except KeyError:
+        raise ValueError(f"Unknown masking rule set: {name}")
+
+
+register_rule_set(SINGAPORE_RULES)
+
+
+class MaskingEngine:
+    """
+    Masks every rule in a single left-to-right scan.
+
+    All rule patterns are compiled once into one alternation of named groups.
+    At each position the earliest-listed rule that matches wins, which gives
+    the same priority order as applying the rules one after another.
+    """
+
+    def __init__(self, rules: Iterable[MaskingRule]):
+        self.rules: List[MaskingRule] = list(rules)
+        self._replacements = {rule.name: rule.replacement for rule in self.rules}
+        self.max_match_length = max((rule.max_length for rule in self.rules), default=0)
+        self._pattern = re.compile("|".join(
+            f"(?P<{rule.name}>(?{rule.flags}:{rule.pattern}))" if rule.flags
+            else f"(?P<{rule.name}>{rule.pattern})"
+            for rule in self.rules
+        ))
+
+    @classmethod
+    def from_rule_sets(cls, names: Iterable[str]) -> "MaskingEngine":
+        return cls(rule for name in names for rule in get_rule_set(name).rules)
+
+    def mask(self, text: str) -> str:
+        return self._pattern.sub(self._replace, text)
+
+    def mask_tail(self, text: str, length: int) -> str:
+        """
+        Returns `mask(text)[-length:]` while masking only a window at the end
+        of `text`. The window carries a margin of twice the longest possible
+        match, so PII straddling the cut is still masked; it grows if masking
+        shrank the window below `length`.
+        """
+        if length <= 0:
+            return ""
+        margin = 2 * self.max_match_length
+        window = length + margin
+        while window < len(text):
+            start = len(text) - window
+            masked, safe_from = self._mask_window(text, start, len(text), safe_input=start + margin)
+            if len(masked) - safe_from >= length:
+                return masked[-length:]
+            window *= 2
+        return self.mask(text)[-length:]
+
+    def mask_head(self, text: str, length: int) -> str:
+        """
+        Returns `mask(text)[:length]` while masking only a window at the start of `text`.
+        """
+        margin = 2 * self.max_match_length
+        window = length + margin
+        while window < len(text):
+            masked, safe_until = self._mask_window(text, 0, window, safe_input=window - margin)
+            if safe_until >= length:
+                return masked[:length]
+            window *= 2
+        return self.mask(text)[:length]
+
+    def _mask_window(self, text: str, start: int, end: int, safe_input: int) -> Tuple[str, int]:
+        """
+        Masks text[start:end] and returns it with the output offset matching
+        input position `safe_input` (pushed past any match covering it).
+        """
+        out: List[str] = []
+        out_len = 0
+        pos = start
+        safe_output = None
+        for match in self._pattern.finditer(text, start, end):
+            if safe_output is None and match.start() >= safe_input:
+                safe_output = out_len + (safe_input - pos)
+            out.append(text[pos:match.start()])
+            replacement = self._replacements[match.lastgroup]
+            out.append(replacement)
+            out_len += match.start() - pos + len(replacement)
+            pos = match.end()
+            if safe_output is None and pos >= safe_input:
+                safe_output = out_len
+        if safe_output is None:
+            safe_output = out_len + (safe_input - pos)
+        out.append(text[pos:end])
+        return "".join(out), safe_output
+
+    def _replace(self, match: re.Match) -> str:
+        return self._replacements[match.lastgroup]
@@ -0,0 +1,81 @@
+import asyncio
+from datetime import datetime, timezone
+from typing import Optional
+
+from app.models import Conversation, MessageBucket, StorageMode, StoredMessage
+
+
+async def migrate_conversation(conv: Conversation, bucket_size: Optional[int] = None) -> bool:
+    """
+    Moves an embedded conversation's messages into bucketed storage.
+
+    Buckets are written first, then the conversation is switched over in one
+    update guarded by its version. If a concurrent append landed in between,
+    the written buckets are discarded and False is returned so the caller can
+    retry; the conversation is never left half-migrated.
+    """
+    if conv.storage == StorageMode.bucketed:
+        return True
+
+    bucket_size = bucket_size or conv.bucket_size
+    buckets = []
+    for start in range(0, len(conv.messages), bucket_size):
+        buckets.append(MessageBucket(
+            conversation_id=conv.id,
+            bucket=start // bucket_size,
+            messages=[
+                StoredMessage(role=m.role, content=m.content, timestamp=m.timestamp, seq=start + i)
+                for i, m in enumerate(conv.messages[start:start + bucket_size])
+            ]
+        ))
+    # Clear leftovers from an earlier interrupted run before writing
+    await MessageBucket.find(MessageBucket.conversation_id == conv.id).delete()
+    if buckets:
+        await MessageBucket.insert_many(buckets)
+
+    result = await Conversation.get_motor_collection().update_one(
+        {"_id": conv.id, "version": conv.version if conv.version else {"$in": [0, None]}},
+        {
+            "$set": {
+                "storage": StorageMode.bucketed.value,
+                "bucket_size": bucket_size,
+                "message_count": len(conv.messages),
+                "updated_at": datetime.now(timezone.utc),
+            },
+            "$unset": {"messages": ""},
+            "$inc": {"version": 1},
+        }
+    )
+    if result.modified_count == 0:
+        await MessageBucket.find(MessageBucket.conversation_id == conv.id).delete()
+        return False
+    return True
+
+
+async def migrate_all(bucket_size: Optional[int] = None, max_attempts: int = 3) -> int:
+    """
+    Migrates every embedded conversation to bucketed storage, one at a time.
+    Returns the number of conversations migrated.
+    """
+    migrated = 0
+    async for conv in Conversation.find({"storage": {"$ne": StorageMode.bucketed.value}}):
+        for _ in range(max_attempts):
+            if await migrate_conversation(conv, bucket_size):
+                migrated += 1
+                break
+            conv = await Conversation.get(conv.id)
+            if conv is None:
+                break
+    return migrated
+
+
+async def main():
+    from app.database import init_db
+
+    await init_db()
+    migrated = await migrate_all()
+    print(f"Migrated {migrated} conversation(s) to bucketed message storage.")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,134 @@
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from beanie import PydanticObjectId
+
+from app.models import Conversation, MessageBucket
+from app.services.embedding_index import EmbeddingIndexer
+
+# Message offsets returned per conversation
+MAX_OFFSETS = 20
+
+_WORD = re.compile(r"\w+")
+
+
+@dataclass
+class SearchHit:
+    conversation_id: PydanticObjectId
+    score: float
+    message_offsets: List[int] = field(default_factory=list)
+    title: Optional[str] = None
+
+
+def _terms_pattern(query: str) -> str:
+    return "|".join(re.escape(term) for term in _WORD.findall(query)) or "(?!)"
+
+
+def _offsets_filter(pattern: str) -> Dict[str, Any]:
+    # Offsets of messages containing any query term, computed inside MongoDB
+    # so message bodies never leave the server. $text matches stemmed words,
+    # so a conversation can match with no exact-term offsets.
+    return {
+        "$slice": [
+            {
+                "$filter": {
+                    "input": {"$range": [0, {"$size": {"$ifNull": ["$messages", []]}}]},
+                    "as": "i",
+                    "cond": {
+                        "$regexMatch": {
+                            "input": {"$arrayElemAt": ["$messages.content", "$$i"]},
+                            "regex": pattern,
+                            "options": "i",
+                        }
+                    },
+                }
+            },
+            MAX_OFFSETS,
+        ]
+    }
+
+
+async def text_search(query: str, limit: int) -> List[SearchHit]:
+    """
+    Ranks conversations by MongoDB text score over titles and message
+    content, searching embedded conversations and message buckets alike.
+    """
+    pattern = _terms_pattern(query)
+    hits: Dict[PydanticObjectId, SearchHit] = {}
+
+    conversations = Conversation.get_motor_collection().aggregate([
+        {"$match": {"$text": {"$search": query}}},
+        {"$sort": {"score": {"$meta": "textScore"}}},
+        {"$limit": limit},
+        {"$project": {
+            "title": 1,
+            "score": {"$meta": "textScore"},
+            "offsets": _offsets_filter(pattern),
+        }},
+    ])
+    async for doc in conversations:
+        hits[doc["_id"]] = SearchHit(doc["_id"], doc["score"], doc["offsets"], doc.get("title"))
+
+    # Bucketed conversations: a bucket's position i holds message seq bucket * bucket_size + i,
+    # but sizes are per conversation, so the stored seq is projected instead
+    offsets = _offsets_filter(pattern)
+    offsets["$slice"][0] = {"$map": {"input": offsets["$slice"][0], "as": "i",
+                                     "in": {"$arrayElemAt": ["$messages.seq", "$$i"]}}}
+    buckets = MessageBucket.get_motor_collection().aggregate([
+        {"$match": {"$text": {"$search": query}}},
+        {"$sort": {"score": {"$meta": "textScore"}}},
+        {"$limit": limit * 4},
+        {"$project": {"conversation_id": 1, "score": {"$meta": "textScore"}, "offsets": offsets}},
+    ])
+    async for doc in buckets:
+        hit = hits.get(doc["conversation_id"])
+        if hit is None:
+            hit = hits[doc["conversation_id"]] = SearchHit(doc["conversation_id"], 0.0)
+        hit.score += doc["score"]
+        hit.message_offsets = sorted(hit.message_offsets + doc["offsets"])[:MAX_OFFSETS]
+
+    return sorted(hits.values(), key=lambda h: h.score, reverse=True)[:limit]
+
+
+async def semantic_search(
+    indexer: EmbeddingIndexer, query: str, limit: int, budget: float
+) -> Tuple[List[SearchHit], bool]:
+    """
+    Ranks conversations by their best-matching messages in the embedding
+    index. Returns the hits and whether the budget cut the scan short.
+    """
+    # Several messages of one conversation usually rank together
+    matches, partial = await indexer.search(query, limit * MAX_OFFSETS, budget)
+    hits: Dict[PydanticObjectId, SearchHit] = {}
+    for match in matches:
+        if match.score <= 0:
+            break  # best first: nothing similar is left
+        hit = hits.get(match.conversation_id)
+        if hit is None:
+            if len(hits) == limit:
+                continue
+            hit = hits[match.conversation_id] = SearchHit(match.conversation_id, match.score)
+        if len(hit.message_offsets) < MAX_OFFSETS and match.seq not in hit.message_offsets:
+            hit.message_offsets.append(match.seq)
+    return list(hits.values()), partial
+
+
+async def attach_titles(hits: List[SearchHit]) -> List[SearchHit]:
+    """
+    Fills in titles and drops hits whose conversation was deleted since it
+    was indexed.
+    """
+    missing = [h.conversation_id for h in hits if h.title is None]
+    titles = {}
+    if missing:
+        cursor = Conversation.get_motor_collection().find({"_id": {"$in": missing}}, projection={"title": 1})
+        titles = {doc["_id"]: doc["title"] async for doc in cursor}
+    kept = []
+    for hit in hits:
+        if hit.title is None:
+            if hit.conversation_id not in titles:
+                continue
+            hit.title = titles[hit.conversation_id]
+        kept.append(hit)
+    return kept
@@ -0,0 +1,42 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class SingleFlight:
+    """
+    Deduplicates concurrent calls: callers with the same key share one
+    execution and its result (or exception).
+
+    The work runs in its own task, so it completes even if the caller that
+    started it goes away. A successful result stays shared for `window`
+    seconds after completion, which also absorbs quick double-submits.
+    """
+
+    def __init__(self, window: float = 0.0):
+        self.window = window
+        self.shared = 0
+        self._flights: Dict[Hashable, asyncio.Task] = {}
+
+    def __len__(self) -> int:
+        return len(self._flights)
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._flights.get(key)
+        if task is None:
+            task = asyncio.create_task(fn())
+            self._flights[key] = task
+            task.add_done_callback(lambda t: self._finished(key, t))
+        else:
+            self.shared += 1
+        return await asyncio.shield(task)
+
+    def _finished(self, key: Hashable, task: asyncio.Task):
+        if task.cancelled() or task.exception() is not None or self.window <= 0:
+            self._forget(key, task)
+        else:
+            asyncio.get_running_loop().call_later(self.window, self._forget, key, task)
+
+    def _forget(self, key: Hashable, task: asyncio.Task):
+        # A newer flight may have taken the key meanwhile
+        if self._flights.get(key) is task:
+            del self._flights[key]
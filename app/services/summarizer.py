@@ -0,0 +1,87 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from beanie import PydanticObjectId
+
+from app.models import Conversation, Message
+
+# Takes the previous summary (empty at first) and the messages to fold in,
+# returns the new summary
+SummarizeFn = Callable[[str, List[Message]], Awaitable[str]]
+
+
+class Summarizer:
+    """
+    Folds old conversation history into a running summary stored on the
+    Conversation (`summary` covers messages [0, `summary_upto`)).
+
+    Once more than `trigger_messages` messages are not covered yet, the
+    oldest of them are folded in, `chunk_messages` at a time and always
+    leaving the newest `keep_recent` untouched. Each call only sends the
+    previous summary plus the new messages, so nothing is re-summarized.
+    Work runs in background tasks, at most one per conversation.
+    """
+
+    def __init__(
+        self,
+        summarize: SummarizeFn,
+        trigger_messages: int = 40,
+        keep_recent: int = 10,
+        chunk_messages: int = 50,
+    ):
+        if keep_recent >= trigger_messages:
+            raise ValueError("keep_recent must be smaller than trigger_messages")
+        self.summarize = summarize
+        self.trigger_messages = trigger_messages
+        self.keep_recent = keep_recent
+        self.chunk_messages = chunk_messages
+        self._tasks: Dict[PydanticObjectId, asyncio.Task] = {}
+
+    def needs_summary(self, conv: Conversation) -> bool:
+        return conv.total_messages() - conv.summary_upto > self.trigger_messages
+
+    def schedule(self, conv: Conversation) -> Optional[asyncio.Task]:
+        """
+        Starts a background summarization for `conv` if it needs one and
+        none is running for it already.
+        """
+        if not self.needs_summary(conv) or conv.id in self._tasks:
+            return None
+        task = asyncio.create_task(self.run(conv.id))
+        self._tasks[conv.id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(conv.id, None))
+        return task
+
+    async def run(self, conversation_id: PydanticObjectId) -> int:
+        """
+        Folds chunks into the summary until the conversation is under the
+        trigger again. Returns the number of messages folded.
+        """
+        folded = 0
+        try:
+            while True:
+                conv = await Conversation.get(conversation_id)
+                if conv is None or not self.needs_summary(conv):
+                    return folded
+                start = conv.summary_upto
+                end = min(start + self.chunk_messages, conv.total_messages() - self.keep_recent)
+                summary = await self.summarize(conv.summary or "", await conv.read_messages(start, end))
+                # Only the run that read `start` may move the summary forward
+                result = await Conversation.get_motor_collection().update_one(
+                    {"_id": conversation_id, "summary_upto": start if start else {"$in": [0, None]}},
+                    {"$set": {"summary": summary, "summary_upto": end}, "$inc": {"version": 1}},
+                )
+                if result.modified_count == 0:
+                    return folded
+                folded += end - start
+        except Exception as e:
+            # Summaries are an optimisation: on failure the unsummarized history is still sent
+            print(e)
+            return folded
+
+    async def stop(self):
+        """
+        Waits for in-flight summaries so they are not cut off at shutdown.
+        """
+        if self._tasks:
+            await asyncio.gather(*self._tasks.values(), return_exceptions=True)
@@ -0,0 +1,63 @@
+"""
+Audit masking cost as conversation history grows.
+
+Compares the old path (join every user message, mask it all, keep the last
+2000 characters) with the current one (mask only the stored window).
+
+    python -m benchmarks.bench_audit_masking
+"""
+import time
+from datetime import datetime, timezone
+
+from app.services.audit_writer import AuditEntry
+from app.services.llm_services import audit_prompt_lines, mask_sensitive_info, prepare_audit_batch
+
+HISTORY_SIZES = [10, 100, 1000, 10000]
+REPEAT = 5
+REPLY = "Sure, I will send it to Blk 123 Ang Mo Kio Ave 3 Street. " * 20
+
+
+def make_history(turns):
+    messages = []
+    for i in range(turns):
+        messages.append({
+            "role": "user",
+            "content": f"Message {i}: reach me at user{i}@example.com or +65 9123{i % 10000:04d}, "
+                       f"I live at {i} Orchard Road, Singapore 238{i % 1000:03d}.",
+        })
+        messages.append({"role": "assistant", "content": f"Noted, reply {i}."})
+    return messages
+
+
+def legacy_audit(messages):
+    prompt_text = "\n".join(f'{m["role"]}: {m["content"]}' for m in messages if m["role"] == "user")
+    return mask_sensitive_info(prompt_text)[-2000:], mask_sensitive_info(REPLY)[:2000]
+
+
+def windowed_audit(messages):
+    entry = AuditEntry("bench", audit_prompt_lines(messages), REPLY, datetime.now(timezone.utc))
+    record = prepare_audit_batch([entry])[0]
+    return record["prompt"], record["response"]
+
+
+def best_of(fn, messages):
+    best = float("inf")
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        fn(messages)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    print(f"{'turns':>8} {'legacy ms':>12} {'windowed ms':>12} {'speedup':>9}")
+    for turns in HISTORY_SIZES:
+        messages = make_history(turns)
+        assert legacy_audit(messages) == windowed_audit(messages)
+        legacy = best_of(legacy_audit, messages)
+        windowed = best_of(windowed_audit, messages)
+        print(f"{turns:>8} {legacy * 1000:>12.2f} {windowed * 1000:>12.2f} {legacy / windowed:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
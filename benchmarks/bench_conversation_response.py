@@ -0,0 +1,134 @@
+"""
+Response serialization cost for GET /conversations/{id} and GET /conversations.
+
+Compares the old path (build ConversationResponse models, let FastAPI
+revalidate them against the response model and encode with the standard
+json module) with the current one (plain payload encoded by orjson).
+Only serialization is measured; database reads are the same for both.
+Listings project messages away inside MongoDB, so their cost depends on
+the page size rather than the history length: they are measured at one
+full page of 100 conversations for each history size.
+
+    python -m benchmarks.bench_conversation_response
+"""
+import asyncio
+import time
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from typing import List
+
+from bson import ObjectId
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_model_field
+
+from app.models import Message
+from app.responses import ORJSONResponse
+from app.routers.conversation import _build_conversation_response, _summary_payload
+from app.schemas import ConversationResponse, ConversationSummary
+
+HISTORY_SIZES = [10, 1000, 10000]
+PAGE = 100
+REPEAT = 5
+
+conversation_field = create_model_field("Response", ConversationResponse)
+summaries_field = create_model_field("Response", List[ConversationSummary])
+
+
+def make_conversation(turns):
+    now = datetime.now(timezone.utc)
+    messages = [
+        Message(role="user" if i % 2 == 0 else "assistant", content=f"Message {i}: " + "lorem ipsum " * 20)
+        for i in range(turns)
+    ]
+    conv = SimpleNamespace(
+        id=ObjectId(),
+        title="Benchmark",
+        created_at=now,
+        updated_at=now,
+        total_messages=lambda: len(messages),
+    )
+    return conv, messages
+
+
+def make_docs(turns):
+    now = datetime.now(timezone.utc)
+    last = {"role": "assistant", "content": "lorem ipsum " * 20, "timestamp": now}
+    return [
+        {"_id": ObjectId(), "title": f"Conversation {i}", "message_count": turns,
+         "last_message": last, "created_at": now, "updated_at": now}
+        for i in range(PAGE)
+    ]
+
+
+async def legacy_get(conv, messages):
+    model = ConversationResponse(
+        id=str(conv.id),
+        title=conv.title,
+        messages=[{"role": m.role, "content": m.content, "timestamp": m.timestamp} for m in messages],
+        message_count=conv.total_messages(),
+        message_offset=0,
+        created_at=conv.created_at,
+        updated_at=conv.updated_at,
+    )
+    content = await serialize_response(field=conversation_field, response_content=model)
+    return JSONResponse(content).body
+
+
+async def fast_get(conv, messages):
+    return ORJSONResponse(await _build_conversation_response(conv, messages, 0)).body
+
+
+async def fast_get_fields(conv, messages):
+    payload = await _build_conversation_response(conv, [], 0, {"id", "title", "updated_at"})
+    return ORJSONResponse(payload).body
+
+
+async def legacy_list(docs):
+    summaries = [
+        ConversationSummary(
+            id=str(doc["_id"]),
+            title=doc["title"],
+            message_count=doc["message_count"],
+            last_message=doc["last_message"],
+            created_at=doc["created_at"],
+            updated_at=doc["updated_at"],
+        )
+        for doc in docs
+    ]
+    content = await serialize_response(field=summaries_field, response_content=summaries)
+    return JSONResponse(content).body
+
+
+async def fast_list(docs):
+    return ORJSONResponse([_summary_payload(doc) for doc in docs]).body
+
+
+async def best_of(fn, *args):
+    best = float("inf")
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        await fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+async def main():
+    print(f"{'messages':>9} {'get old ms':>11} {'get new ms':>11} {'speedup':>8} "
+          f"{'fields ms':>10} {'list old ms':>12} {'list new ms':>12} {'speedup':>8}")
+    for turns in HISTORY_SIZES:
+        conv, messages = make_conversation(turns)
+        docs = make_docs(turns)
+        assert ConversationResponse.model_validate_json(await fast_get(conv, messages)) == \
+            ConversationResponse.model_validate_json(await legacy_get(conv, messages))
+        get_old = await best_of(legacy_get, conv, messages)
+        get_new = await best_of(fast_get, conv, messages)
+        fields = await best_of(fast_get_fields, conv, messages)
+        list_old = await best_of(legacy_list, docs)
+        list_new = await best_of(fast_list, docs)
+        print(f"{turns:>9} {get_old:>11.2f} {get_new:>11.2f} {get_old / get_new:>7.1f}x "
+              f"{fields:>10.3f} {list_old:>12.2f} {list_new:>12.2f} {list_old / list_new:>7.1f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,125 @@
+"""
+Local OpenAI-compatible server for load tests: answers
+/v1/chat/completions (plain and streamed) with a configurable latency and
+token rate, and reports usage like the real API.
+"""
+import asyncio
+import json
+import socket
+import threading
+import time
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+REPLY_WORD = "lorem"
+
+
+class FakeLLMServer:
+    """
+    Replies with `reply_tokens` tokens after `latency` seconds (time to first
+    token), then emits tokens at `tokens_per_second` (0 = all at once).
+    Runs uvicorn in a background thread; use it as a context manager.
+    """
+
+    def __init__(self, latency: float = 0.2, tokens_per_second: float = 50.0, reply_tokens: int = 40):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.reply_tokens = reply_tokens
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            self.port = sock.getsockname()[1]
+        app = Starlette(routes=[Route("/v1/chat/completions", self.chat_completions, methods=["POST"])])
+        self.server = uvicorn.Server(uvicorn.Config(app, port=self.port, log_level="warning"))
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}/v1"
+
+    def __enter__(self):
+        self.thread.start()
+        while not self.server.started:
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *exc):
+        self.server.should_exit = True
+        self.thread.join()
+
+    async def chat_completions(self, request: Request):
+        body = await request.json()
+        self.requests += 1
+        prompt_tokens = sum(len(m.get("content") or "") for m in body.get("messages", [])) // 4 + 1
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": self.reply_tokens,
+            "total_tokens": prompt_tokens + self.reply_tokens,
+        }
+        if body.get("stream"):
+            include_usage = bool((body.get("stream_options") or {}).get("include_usage"))
+            return StreamingResponse(
+                self._stream(body["model"], usage if include_usage else None), media_type="text/event-stream"
+            )
+
+        await self._track(self.latency + self._generation_time())
+        return JSONResponse({
+            "id": "chatcmpl-fake",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body["model"],
+            "choices": [{
+                "index": 0,
+                "finish_reason": "stop",
+                "message": {"role": "assistant", "content": " ".join([REPLY_WORD] * self.reply_tokens)},
+            }],
+            "usage": usage,
+        })
+
+    async def _stream(self, model, usage):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.latency)
+            for i in range(self.reply_tokens):
+                if i and self.tokens_per_second > 0:
+                    await asyncio.sleep(1 / self.tokens_per_second)
+                yield self._event(model, {"content": REPLY_WORD if i == 0 else f" {REPLY_WORD}"}, None)
+            yield self._event(model, {}, "stop")
+            if usage is not None:
+                yield "data: " + json.dumps({
+                    "id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": int(time.time()),
+                    "model": model, "choices": [], "usage": usage,
+                }) + "\n\n"
+            yield "data: [DONE]\n\n"
+        finally:
+            self.in_flight -= 1
+
+    async def _track(self, seconds: float):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            self.in_flight -= 1
+
+    def _generation_time(self) -> float:
+        if self.tokens_per_second <= 0:
+            return 0.0
+        return max(0, self.reply_tokens - 1) / self.tokens_per_second
+
+    @staticmethod
+    def _event(model, delta, finish_reason) -> str:
+        return "data: " + json.dumps({
+            "id": "chatcmpl-fake",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }) + "\n\n"
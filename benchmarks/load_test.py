@@ -0,0 +1,320 @@
+"""
+Load test for the API: runs the app in-process against a local fake
+OpenAI-compatible server (benchmarks/fake_llm.py) and either an in-memory
+MongoDB (mongomock-motor, the default) or a real one (--mongo-uri), and
+drives a weighted mix of create/list/get/prompt/stream/audit requests from
+`--concurrency` concurrent clients.
+
+Reports p50/p95/p99 latency and requests per second, overall and per
+operation. Results can be stored as a baseline in benchmarks/baselines/
+and later runs compared against it; the comparison exits with status 1
+when p95 latency or throughput regress by more than --tolerance.
+
+    python -m benchmarks.load_test --concurrency 32 --duration 20
+    python -m benchmarks.load_test --save-baseline default
+    python -m benchmarks.load_test --compare default
+
+Requests go through httpx's ASGI transport, so the client shares the
+app's event loop; numbers measure the app (plus a constant client cost)
+rather than network or server process overhead.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Tuple
+
+import httpx
+
+from benchmarks.fake_llm import FakeLLMServer
+
+BASELINE_DIR = os.path.join(os.path.dirname(__file__), "baselines")
+DEFAULT_MIX = "create=1,list=2,get=3,prompt=3,stream=1,audit=1"
+MONGO_MOCK_URI = "mongodb://localhost:27017/llmAppDb"
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=16, help="concurrent clients")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds of measured traffic")
+    parser.add_argument("--warmup", type=float, default=1.0, help="seconds of unmeasured traffic first")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="operation weights, e.g. " + DEFAULT_MIX)
+    parser.add_argument("--seed-conversations", type=int, default=50)
+    parser.add_argument("--seed-messages", type=int, default=20, help="messages per seeded conversation")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="fake LLM time to first token")
+    parser.add_argument("--llm-tokens-per-second", type=float, default=500.0, help="0 = instant")
+    parser.add_argument("--reply-tokens", type=int, default=40)
+    parser.add_argument("--mongo-uri", default=None, help="real MongoDB; default is in-memory mongomock-motor")
+    parser.add_argument("--random-seed", type=int, default=1)
+    parser.add_argument("--save-baseline", metavar="NAME", help="store the results as baselines/NAME.json")
+    parser.add_argument("--compare", metavar="NAME", help="compare against baselines/NAME.json")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed regression, as a fraction")
+    return parser.parse_args(argv)
+
+
+def parse_mix(mix: str) -> Dict[str, float]:
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise SystemExit(f"Unknown operation in --mix: {name} (known: {', '.join(OPERATIONS)})")
+        weights[name] = float(weight or 1)
+    return weights
+
+
+# --- Operations: each sends one request and returns its status code ---
+
+async def op_create(client, rng, state):
+    resp = await client.post("/conversations/", json={"title": f"Load {rng.random():.6f}"})
+    if resp.status_code == 201:
+        state["conversations"].append(resp.json()["id"])
+    return resp.status_code
+
+
+async def op_list(client, rng, state):
+    return (await client.get("/conversations/", params={"limit": 20})).status_code
+
+
+async def op_get(client, rng, state):
+    return (await client.get(f"/conversations/{rng.choice(state['conversations'])}")).status_code
+
+
+async def op_prompt(client, rng, state):
+    state["prompts"] += 1
+    resp = await client.post(
+        f"/conversations/{rng.choice(state['conversations'])}/prompt",
+        json={"role": "user", "content": f"Question {state['prompts']}: what changed since yesterday?"},
+    )
+    return resp.status_code
+
+
+async def op_stream(client, rng, state):
+    state["prompts"] += 1
+    resp = await client.post(
+        f"/conversations/{rng.choice(state['conversations'])}/prompt/stream",
+        json={"role": "user", "content": f"Question {state['prompts']}: summarize it for me."},
+    )
+    # Failures after the first byte are reported in-band
+    if resp.status_code == 200 and '"type": "error"' in resp.text:
+        return 599
+    return resp.status_code
+
+
+async def op_audit(client, rng, state):
+    return (await client.get("/audits/", params={"limit": 20})).status_code
+
+
+OPERATIONS = {
+    "create": op_create,
+    "list": op_list,
+    "get": op_get,
+    "prompt": op_prompt,
+    "stream": op_stream,
+    "audit": op_audit,
+}
+
+
+# --- Running ---
+
+def configure_environment(args, llm: FakeLLMServer):
+    """
+    Points the app at the fake LLM and the chosen MongoDB. Must run before
+    the app is imported, since settings are read at import time.
+    """
+    os.environ["OPENAI_API_KEY"] = "load-test"
+    os.environ["OPENAI_BASE_URL"] = llm.base_url
+    os.environ["MONGO_URI"] = args.mongo_uri or MONGO_MOCK_URI
+    if args.mongo_uri is None:
+        try:
+            import motor.motor_asyncio
+            from mongomock_motor import AsyncMongoMockClient
+        except ImportError:
+            raise SystemExit("The in-memory database needs mongomock-motor; install it or pass --mongo-uri")
+        motor.motor_asyncio.AsyncIOMotorClient = AsyncMongoMockClient
+
+
+async def seed(args, rng) -> List[str]:
+    from app.models import AuditLog, Conversation, Message
+
+    now = datetime.now(timezone.utc)
+    ids = []
+    for i in range(args.seed_conversations):
+        messages = [
+            Message(role="user" if j % 2 == 0 else "assistant", content=f"Seeded message {j} " + "lorem " * 30)
+            for j in range(args.seed_messages)
+        ]
+        conv = Conversation(
+            title=f"Seed {i}", messages=messages, message_count=len(messages),
+            last_message=messages[-1] if messages else None, updated_at=now - timedelta(seconds=i),
+        )
+        await conv.insert()
+        ids.append(str(conv.id))
+    audits = [
+        AuditLog(conversation_id=rng.choice(ids), prompt="user: seeded prompt", response="seeded reply",
+                 timestamp=now - timedelta(seconds=i))
+        for i in range(args.seed_conversations * 2)
+    ]
+    if audits:
+        await AuditLog.insert_many(audits)
+    return ids
+
+
+async def drive(client, args, weights, state, seconds: float, samples: Dict[str, List[Tuple[float, int]]]):
+    names, cumulative = list(weights), list(weights.values())
+    deadline = time.perf_counter() + seconds
+
+    async def worker(worker_id: int):
+        rng = random.Random(args.random_seed * 1000 + worker_id)
+        while time.perf_counter() < deadline:
+            name = rng.choices(names, cumulative)[0]
+            start = time.perf_counter()
+            try:
+                status = await OPERATIONS[name](client, rng, state)
+            except Exception:
+                status = 0
+            samples.setdefault(name, []).append((time.perf_counter() - start, status))
+
+    await asyncio.gather(*(worker(i) for i in range(args.concurrency)))
+
+
+async def run(args) -> Dict[str, Any]:
+    weights = parse_mix(args.mix)
+    if args.seed_conversations < 1:
+        raise SystemExit("--seed-conversations must be at least 1")
+    with FakeLLMServer(args.llm_latency, args.llm_tokens_per_second, args.reply_tokens) as llm:
+        configure_environment(args, llm)
+        from app.main import app
+
+        async with app.router.lifespan_context(app):
+            rng = random.Random(args.random_seed)
+            state = {"conversations": await seed(args, rng), "prompts": 0}
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://load-test", timeout=120) as client:
+                if args.warmup > 0:
+                    await drive(client, args, weights, state, args.warmup, {})
+                samples: Dict[str, List[Tuple[float, int]]] = {}
+                start = time.perf_counter()
+                await drive(client, args, weights, state, args.duration, samples)
+                elapsed = time.perf_counter() - start
+        llm_requests = llm.requests
+
+    return {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "git_commit": git_commit(),
+        "config": {
+            "concurrency": args.concurrency,
+            "duration": args.duration,
+            "mix": args.mix,
+            "seed_conversations": args.seed_conversations,
+            "seed_messages": args.seed_messages,
+            "llm_latency": args.llm_latency,
+            "llm_tokens_per_second": args.llm_tokens_per_second,
+            "reply_tokens": args.reply_tokens,
+            "mongo": "real" if args.mongo_uri else "mongomock",
+        },
+        "llm_requests": llm_requests,
+        "total": summarize([s for op in samples.values() for s in op], elapsed),
+        "operations": {name: summarize(samples[name], elapsed) for name in weights if name in samples},
+    }
+
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(p / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(samples: List[Tuple[float, int]], elapsed: float) -> Dict[str, float]:
+    latencies = sorted(latency for latency, _ in samples)
+    return {
+        "requests": len(samples),
+        "errors": sum(1 for _, status in samples if status == 0 or status >= 400),
+        "rps": round(len(samples) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(__file__),
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+# --- Reporting ---
+
+def print_report(result: Dict[str, Any]):
+    print(f"{'operation':<10} {'requests':>9} {'errors':>7} {'rps':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    rows = list(result["operations"].items()) + [("total", result["total"])]
+    for name, s in rows:
+        print(f"{name:<10} {s['requests']:>9} {s['errors']:>7} {s['rps']:>9.1f} "
+              f"{s['p50_ms']:>9.2f} {s['p95_ms']:>9.2f} {s['p99_ms']:>9.2f}")
+
+
+def baseline_path(name: str) -> str:
+    return os.path.join(BASELINE_DIR, f"{name}.json")
+
+
+def compare(result: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """
+    Returns one line per regression: p95 latency up, or throughput down,
+    by more than `tolerance`.
+    """
+    if baseline["config"] != result["config"]:
+        print("Warning: the baseline was recorded with a different configuration:", baseline["config"])
+    regressions = []
+    rows = [("total", result["total"], baseline["total"])] + [
+        (name, s, baseline["operations"][name])
+        for name, s in result["operations"].items() if name in baseline["operations"]
+    ]
+    print(f"\nAgainst baseline {baseline.get('git_commit')} ({baseline.get('created_at')}):")
+    print(f"{'operation':<10} {'p95 ms':>17} {'change':>8} {'rps':>17} {'change':>8}")
+    for name, now, then in rows:
+        p95_change = now["p95_ms"] / then["p95_ms"] - 1 if then["p95_ms"] else 0.0
+        rps_change = now["rps"] / then["rps"] - 1 if then["rps"] else 0.0
+        print(f"{name:<10} {then['p95_ms']:>8.2f}->{now['p95_ms']:>7.2f} {p95_change:>+7.0%} "
+              f"{then['rps']:>8.1f}->{now['rps']:>7.1f} {rps_change:>+7.0%}")
+        if p95_change > tolerance:
+            regressions.append(f"{name}: p95 {then['p95_ms']:.2f} -> {now['p95_ms']:.2f} ms")
+        if rps_change < -tolerance:
+            regressions.append(f"{name}: {then['rps']:.1f} -> {now['rps']:.1f} requests/s")
+    return regressions
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    result = asyncio.run(run(args))
+    print_report(result)
+
+    if args.save_baseline:
+        os.makedirs(BASELINE_DIR, exist_ok=True)
+        with open(baseline_path(args.save_baseline), "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+            f.write("\n")
+        print(f"\nSaved baseline {baseline_path(args.save_baseline)}")
+
+    if args.compare:
+        with open(baseline_path(args.compare), encoding="utf-8") as f:
+            regressions = compare(result, json.load(f), args.tolerance)
+        if regressions:
+            print("\nRegressions beyond {:.0%}:".format(args.tolerance))
+            for line in regressions:
+                print("  " + line)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
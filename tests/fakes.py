@@ -0,0 +1,41 @@
+"""
+Fake OpenAI completion and streaming objects shared by the test modules.
+"""
+
+
+class FakeCompletionMessage:
+    def __init__(self, content):
+        self.content = content
+
+class FakeCompletionChoice:
+    def __init__(self, content):
+        self.message = FakeCompletionMessage(content)
+
+class FakeCompletion:
+    def __init__(self, content, usage=None):
+        self.choices = [FakeCompletionChoice(content)]
+        self.usage = usage
+
+class FakeDelta:
+    def __init__(self, content):
+        self.content = content
+
+class FakeChunkChoice:
+    def __init__(self, content):
+        self.delta = FakeDelta(content)
+
+class FakeChunk:
+    def __init__(self, content):
+        self.choices = [FakeChunkChoice(content)]
+
+class FakeStream:
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.closed = False
+
+    async def __aiter__(self):
+        for token in self.tokens:
+            yield FakeChunk(token)
+
+    async def close(self):
+        self.closed = True
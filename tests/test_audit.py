@@ -0,0 +1,78 @@
+import json
+from datetime import datetime, timedelta, timezone
+from uuid import uuid4
+
+import httpx
+import pytest
+
+from app.main import app
+from app.models import AuditLog
+
+
+async def _insert_audits(conversation_id, count, start):
+    await AuditLog.insert_many([
+        AuditLog(
+            conversation_id=conversation_id,
+            prompt=f"prompt {i}",
+            response=f"response {i}",
+            timestamp=start + timedelta(minutes=i)
+        )
+        for i in range(count)
+    ])
+
+
+@pytest.mark.asyncio
+async def test_list_audits_filters_and_pagination():
+    """
+    Test filtering audit logs by conversation and time range, and paging
+    through them with the X-Next-Cursor header.
+    """
+    conv_id = str(uuid4())
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+    async with app.router.lifespan_context(app):
+        await _insert_audits(conv_id, 5, start)
+        await _insert_audits(str(uuid4()), 3, start)
+
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            prompts = []
+            cursor = None
+            while True:
+                params = {"conversation_id": conv_id, "limit": 2}
+                if cursor:
+                    params["cursor"] = cursor
+                resp = await client.get("/audits/", params=params)
+                assert resp.status_code == 200
+                prompts.extend(a["prompt"] for a in resp.json())
+                cursor = resp.headers.get("X-Next-Cursor")
+                if not cursor:
+                    break
+            assert prompts == [f"prompt {i}" for i in range(4, -1, -1)]
+
+            resp = await client.get("/audits/", params={
+                "conversation_id": conv_id,
+                "since": (start + timedelta(minutes=1)).isoformat(),
+                "until": (start + timedelta(minutes=3)).isoformat(),
+            })
+            assert [a["prompt"] for a in resp.json()] == ["prompt 2", "prompt 1"]
+
+
+@pytest.mark.asyncio
+async def test_export_audits_streams_ndjson():
+    """
+    Test that the export endpoint streams every matching log, oldest first.
+    """
+    conv_id = str(uuid4())
+    start = datetime(2024, 2, 1, tzinfo=timezone.utc)
+
+    async with app.router.lifespan_context(app):
+        await _insert_audits(conv_id, 4, start)
+
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            resp = await client.get("/audits/export", params={"conversation_id": conv_id})
+            assert resp.status_code == 200
+            assert resp.headers["content-type"] == "application/x-ndjson"
+            records = [json.loads(line) for line in resp.text.splitlines()]
+            assert [r["prompt"] for r in records] == [f"prompt {i}" for i in range(4)]
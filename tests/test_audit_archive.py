@@ -0,0 +1,128 @@
+import json
+import os
+from datetime import datetime, timedelta, timezone
+from uuid import uuid4
+
+import httpx
+import pytest
+
+from app.main import app
+from app.models import AuditLog, AuditRollup
+from app.services import llm_services
+from app.services.audit_archive import TTL_INDEX_NAME, AuditArchiver
+
+NOW = datetime(2024, 3, 1, 12, tzinfo=timezone.utc)
+DAY_1 = datetime(2024, 1, 10, tzinfo=timezone.utc)
+DAY_2 = datetime(2024, 1, 11, tzinfo=timezone.utc)
+
+
+async def _insert(conversation_id, start, count):
+    await AuditLog.insert_many([
+        AuditLog(
+            conversation_id=conversation_id,
+            prompt=f"prompt {i}",
+            response=f"response {i}",
+            timestamp=start + timedelta(hours=i)
+        )
+        for i in range(count)
+    ])
+
+
+def _prompts(lines):
+    return [json.loads(line)["prompt"] for line in lines]
+
+
+@pytest.mark.asyncio
+async def test_archives_old_days_into_rollups_and_segments(tmp_path):
+    """
+    Test that records older than the cutoff leave MongoDB for per-day
+    segments and rollups, and can still be read by conversation and date.
+    """
+    archiver = AuditArchiver(str(tmp_path), archive_after_days=30)
+    a, b = str(uuid4()), str(uuid4())
+    async with app.router.lifespan_context(app):
+        await _insert(a, DAY_1, 3)
+        await _insert(b, DAY_1 + timedelta(hours=1), 2)
+        await _insert(a, DAY_2, 2)
+        await _insert(None, DAY_2, 1)
+        await _insert(a, NOW - timedelta(days=1), 2)
+
+        assert await archiver.run_once(now=NOW) == 8
+        assert await AuditLog.count() == 2
+        assert sorted(os.listdir(tmp_path)) == [
+            ".lock",
+            "audit-2024-01-10.0.idx.json", "audit-2024-01-10.0.jsonl.gz",
+            "audit-2024-01-11.0.idx.json", "audit-2024-01-11.0.jsonl.gz",
+        ]
+
+        rollup = await AuditRollup.find_one({"conversation_id": a, "day": DAY_1})
+        assert (rollup.records, rollup.prompt_bytes, rollup.response_bytes) == (3, 24, 30)
+        assert rollup.prompt_tokens > 0
+        assert (await AuditRollup.find_one({"conversation_id": None, "day": DAY_2})).records == 1
+        assert await AuditRollup.count() == 4
+
+        assert _prompts(archiver.read(conversation_id=a)) == ["prompt 0", "prompt 1", "prompt 2", "prompt 0", "prompt 1"]
+        assert _prompts(archiver.read(conversation_id=b)) == ["prompt 0", "prompt 1"]
+        assert _prompts(archiver.read(a, since=DAY_1 + timedelta(hours=1), until=DAY_2)) == ["prompt 1", "prompt 2"]
+        assert len(list(archiver.read(since=DAY_2))) == 3
+
+        # Nothing left to archive
+        assert await archiver.run_once(now=NOW) == 0
+        assert archiver.stats.records_archived == 8
+
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            original = llm_services.audit_archiver
+            llm_services.audit_archiver = archiver
+            try:
+                resp = await client.get("/audits/archive", params={"conversation_id": b})
+            finally:
+                llm_services.audit_archiver = original
+            assert resp.status_code == 200
+            assert _prompts(resp.text.splitlines()) == ["prompt 0", "prompt 1"]
+
+            resp = await client.get("/audits/rollups", params={"conversation_id": a})
+            assert [(r["day"][:10], r["records"]) for r in resp.json()] == [("2024-01-11", 2), ("2024-01-10", 3)]
+
+
+@pytest.mark.asyncio
+async def test_interrupted_run_does_not_archive_twice(tmp_path):
+    """
+    Test that records written to a segment but never deleted (the process
+    stopped) are deleted by the next run instead of archived again, and
+    that records added to an archived day later go into a new segment.
+    """
+    archiver = AuditArchiver(str(tmp_path), archive_after_days=30)
+    conv_id = str(uuid4())
+    async with app.router.lifespan_context(app):
+        await _insert(conv_id, DAY_1, 3)
+        await archiver._write_segment(DAY_1, 0)
+        assert await AuditLog.count() == 3
+
+        assert await archiver.run_once(now=NOW) == 0
+        assert await AuditLog.count() == 0
+        assert (await AuditRollup.find_one({"conversation_id": conv_id})).records == 3
+
+        await _insert(conv_id, DAY_1 + timedelta(hours=5), 1)
+        assert await archiver.run_once(now=NOW) == 1
+        assert [i["segment"] for i in archiver.day_indexes(DAY_1)] == [
+            "audit-2024-01-10.0.jsonl.gz", "audit-2024-01-10.1.jsonl.gz"
+        ]
+        assert (await AuditRollup.find_one({"conversation_id": conv_id})).records == 4
+        assert len(list(archiver.read(conv_id))) == 4
+
+
+@pytest.mark.asyncio
+async def test_ttl_index_follows_retention(tmp_path):
+    async with app.router.lifespan_context(app):
+        collection = AuditLog.get_motor_collection()
+        await AuditArchiver(str(tmp_path), retention_days=90).ensure_ttl_index()
+        assert (await collection.index_information())[TTL_INDEX_NAME]["expireAfterSeconds"] == 90 * 86400
+
+        await AuditArchiver(str(tmp_path), retention_days=0).ensure_ttl_index()
+        assert TTL_INDEX_NAME not in await collection.index_information()
+
+
+def test_retention_must_outlive_archiving(tmp_path):
+    with pytest.raises(ValueError):
+        AuditArchiver(str(tmp_path), enabled=True, archive_after_days=30, retention_days=30)
@@ -0,0 +1,208 @@
+import asyncio
+import os
+import threading
+from datetime import datetime, timezone
+
+import pytest
+
+from app.services.audit_writer import AuditEntry, AuditWriter
+from app.services.llm_services import audit_prompt_lines, mask_sensitive_info, prepare_audit_batch
+
+
+class CapturingWriter:
+    """
+    Stands in for the database: records every batch written.
+    """
+
+    def __init__(self, fail=False):
+        self.batches = []
+        self.fail = fail
+
+    async def __call__(self, records):
+        if self.fail:
+            raise ConnectionError("database unavailable")
+        self.batches.append(list(records))
+
+    @property
+    def records(self):
+        return [r for batch in self.batches for r in batch]
+
+
+class HeldPrepare:
+    """
+    prepare_batch that blocks the worker on any batch containing a "hold"
+    prompt until released, so tests can fill the queue deterministically.
+    """
+
+    def __init__(self):
+        self.entered = threading.Event()
+        self.released = threading.Event()
+
+    def __call__(self, entries):
+        if any(e.prompt == "hold" for e in entries):
+            self.entered.set()
+            self.released.wait(5)
+        return prepare_audit_batch(entries)
+
+    async def wait_until_held(self):
+        while not self.entered.is_set():
+            await asyncio.sleep(0.01)
+
+
+@pytest.mark.asyncio
+async def test_writer_batches_masks_and_flushes_on_stop():
+    """
+    Test that queued entries are masked off the request path, written in
+    batches, and that stop() flushes whatever is still queued.
+    """
+    sink = CapturingWriter()
+    writer = AuditWriter(prepare_batch=prepare_audit_batch, write_batch=sink, batch_size=4, flush_interval=60)
+    await writer.start()
+    for i in range(10):
+        await writer.submit(f"conv-{i}", f"user: mail me at user{i}@example.com", "ok")
+    await writer.stop()
+
+    assert [r["conversation_id"] for r in sink.records] == [f"conv-{i}" for i in range(10)]
+    assert all("[MASKED_EMAIL]" in r["prompt"] and "@example.com" not in r["prompt"] for r in sink.records)
+    assert all(len(batch) <= 4 for batch in sink.batches)
+    assert writer.stats.written == 10
+    assert writer.stats.flushes == len(sink.batches)
+    assert writer.queue_depth == 0
+
+
+@pytest.mark.asyncio
+async def test_writer_drop_policy_counts_overflow():
+    """
+    Test that the drop policy discards entries once the queue is full, and
+    that stop() still flushes the queued ones.
+    """
+    sink = CapturingWriter()
+    prepare = HeldPrepare()
+    writer = AuditWriter(prepare_batch=prepare, write_batch=sink, max_queue=2, batch_size=1, overflow="drop")
+    await writer.start()
+    await writer.submit("conv", "hold", "reply")
+    await prepare.wait_until_held()
+    for i in range(4):
+        await writer.submit("conv", f"prompt {i}", "reply")
+
+    assert writer.queue_depth == 2
+    assert writer.stats.enqueued == 3
+    assert writer.stats.dropped == 2
+
+    prepare.released.set()
+    await writer.stop()
+    assert [r["prompt"] for r in sink.records] == ["hold", "prompt 0", "prompt 1"]
+
+
+@pytest.mark.asyncio
+async def test_stop_flushes_full_queue_when_worker_died():
+    """
+    Test that stop() neither hangs nor loses entries when the worker is gone
+    and the queue is full.
+    """
+    sink = CapturingWriter()
+    writer = AuditWriter(prepare_batch=prepare_audit_batch, write_batch=sink, max_queue=2, overflow="drop")
+    await writer.start()
+    writer._task.cancel()
+    await asyncio.sleep(0)
+    await writer.submit("conv", "first", "reply")
+    await writer.submit("conv", "second", "reply")
+
+    await asyncio.wait_for(writer.stop(), timeout=5)
+    assert [r["prompt"] for r in sink.records] == ["first", "second"]
+
+
+@pytest.mark.asyncio
+async def test_writer_spill_policy_replays_on_start(tmp_path):
+    """
+    Test that overflowing entries are spilled to disk already masked and
+    written when the writer next starts.
+    """
+    spill_path = str(tmp_path / "spill.jsonl")
+    prepare = HeldPrepare()
+    writer = AuditWriter(
+        prepare_batch=prepare, write_batch=CapturingWriter(), max_queue=1, batch_size=1,
+        overflow="spill", spill_path=spill_path
+    )
+    await writer.start()
+    await writer.submit("conv", "hold", "reply")
+    await prepare.wait_until_held()
+    await writer.submit("conv", "queued", "reply")
+    await writer.submit("conv", "my NRIC is S1234567D", "reply")
+
+    assert writer.stats.spilled == 1
+    spill_file = f"{spill_path}.{os.getpid()}"
+    with open(spill_file) as f:
+        assert "S1234567D" not in f.read()
+    prepare.released.set()
+    await writer.stop()
+
+    sink = CapturingWriter()
+    restarted = AuditWriter(prepare_batch=prepare_audit_batch, write_batch=sink, spill_path=spill_path)
+    await restarted.start()
+    await restarted.stop()
+
+    assert [r["prompt"] for r in sink.records] == ["my NRIC is [MASKED_NRIC]"]
+    assert restarted.stats.replayed == 1
+    assert os.listdir(tmp_path) == []
+
+
+@pytest.mark.asyncio
+async def test_failed_writes_are_spilled_and_replay_tolerates_failure(tmp_path):
+    """
+    Test that a batch whose write fails is spilled instead of lost, and that
+    a failing replay neither aborts start() nor duplicates records.
+    """
+    spill_path = str(tmp_path / "spill.jsonl")
+    writer = AuditWriter(
+        prepare_batch=prepare_audit_batch, write_batch=CapturingWriter(fail=True), spill_path=spill_path
+    )
+    await writer.start()
+    await writer.submit("conv", "kept", "reply")
+    await writer.stop()
+    assert writer.stats.spilled == 1
+    assert writer.stats.failed == 0
+
+    # Database still down: start() survives and the record stays on disk
+    still_down = AuditWriter(
+        prepare_batch=prepare_audit_batch, write_batch=CapturingWriter(fail=True), spill_path=spill_path
+    )
+    await still_down.start()
+    await still_down.stop()
+    assert os.listdir(tmp_path) == [f"spill.jsonl.{os.getpid()}"]
+
+    sink = CapturingWriter()
+    recovered = AuditWriter(prepare_batch=prepare_audit_batch, write_batch=sink, spill_path=spill_path)
+    await recovered.start()
+    await recovered.stop()
+    assert [r["prompt"] for r in sink.records] == ["kept"]
+
+
+def _history(turns, pad):
+    messages = []
+    for i in range(turns):
+        messages.append({"role": "user", "content": f"{pad * i} mail u{i}@example.com or call 9123456{i % 10}"})
+        messages.append({"role": "assistant", "content": f"noted S123456{i % 10}D"})
+    return messages
+
+
+@pytest.mark.parametrize("messages", [
+    [],
+    _history(3, "x"),
+    _history(400, "word "),
+    [{"role": "user", "content": "Blk 1 Bishan Street " * 5000}],
+    _history(50, "y" * 97) + [{"role": "user", "content": "z" * 1990 + " me@example.com " + "z" * 5}],
+], ids=["empty", "short", "long", "huge_message", "pii_on_cut"])
+def test_audit_prompt_matches_full_mask_then_truncate(messages):
+    """
+    Test that masking only the stored window stores exactly what masking the
+    whole history and then truncating it used to store.
+    """
+    prompt_text = "\n".join(f'{m["role"]}: {m["content"]}' for m in messages if m["role"] == "user")
+    reply = "reply to S7654321A at 10 Anson Road " * 200
+    record = prepare_audit_batch([
+        AuditEntry("conv", audit_prompt_lines(messages), reply, datetime.now(timezone.utc))
+    ])[0]
+
+    assert record["prompt"] == mask_sensitive_info(prompt_text)[-2000:]
+    assert record["response"] == mask_sensitive_info(reply)[:2000]
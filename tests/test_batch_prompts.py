@@ -0,0 +1,111 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+from unittest.mock import patch
+
+from app.main import app
+from app.models import AuditLog, Conversation, StorageMode
+from app.services import batch_prompts
+from tests.fakes import FakeCompletion
+
+
+class EchoLLM:
+    """
+    Completion stub that echoes the last user message, fails on "boom" and
+    records how many calls were in flight at once.
+    """
+
+    def __init__(self):
+        self.running = 0
+        self.peak = 0
+
+    async def __call__(self, *args, messages, **kwargs):
+        self.running += 1
+        self.peak = max(self.peak, self.running)
+        try:
+            await asyncio.sleep(0.01)
+            last = messages[-1]["content"]
+            if last == "boom":
+                raise RuntimeError("upstream failure")
+            return FakeCompletion(f"echo: {last}")
+        finally:
+            self.running -= 1
+
+
+async def _post_batch(client, items, **params):
+    resp = await client.post("/conversations/batch/prompts", json={"items": items, **params})
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("application/x-ndjson")
+    return [json.loads(line) for line in resp.text.splitlines()]
+
+
+@pytest.mark.asyncio
+async def test_batch_reports_per_item_results_and_persists_in_order(monkeypatch):
+    """
+    Test that a batch answers every item, reports failures per item without
+    aborting, keeps turns of one conversation in order, and writes audits.
+    """
+    monkeypatch.setattr(batch_prompts.settings, "BATCH_WRITE_SIZE", 2)
+    llm = EchoLLM()
+    with patch("openai.resources.chat.completions.AsyncCompletions.create", new=llm):
+        async with app.router.lifespan_context(app):
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                first = (await client.post("/conversations/", json={"title": "A"})).json()["id"]
+                bucketed = Conversation(title="B", storage=StorageMode.bucketed, bucket_size=2)
+                await bucketed.insert()
+                second = str(bucketed.id)
+
+                items = [
+                    {"conversation_id": first, "message": {"role": "user", "content": "one"}},
+                    {"conversation_id": second, "message": {"role": "user", "content": "hello"}},
+                    {"conversation_id": first, "message": {"role": "user", "content": "boom"}},
+                    {"conversation_id": "not-an-id", "message": {"role": "user", "content": "lost"}},
+                    {"conversation_id": first, "message": {"role": "user", "content": "two"}},
+                    {"conversation_id": second, "message": {"role": "user", "content": "again"}},
+                ]
+                lines = await _post_batch(client, items, max_parallel=2)
+
+                stored_first = (await client.get(f"/conversations/{first}")).json()
+                stored_second = (await client.get(f"/conversations/{second}")).json()
+                audits = await AuditLog.find_all().to_list()
+                preview = (await Conversation.get(first)).last_message
+
+    assert lines[-1] == {"type": "done", "succeeded": 4, "failed": 2}
+    results = {r["index"]: r for r in lines[:-1]}
+    assert sorted(results) == list(range(len(items)))
+    assert results[0]["reply"] == "echo: one"
+    assert results[2]["status"] == "error" and results[2]["detail"] == "LLM service error."
+    assert results[3]["status"] == "error" and results[3]["detail"] == "Conversation not found"
+    assert results[5]["conversation_id"] == second
+
+    assert [m["content"] for m in stored_first["messages"]] == ["one", "echo: one", "two", "echo: two"]
+    assert preview.content == "echo: two"
+    assert [m["content"] for m in stored_second["messages"]] == ["hello", "echo: hello", "again", "echo: again"]
+    assert sorted(a.response for a in audits) == ["echo: again", "echo: hello", "echo: one", "echo: two"]
+
+
+@pytest.mark.asyncio
+async def test_batch_bounds_parallelism():
+    """
+    Test that no more than max_parallel upstream calls run at once.
+    """
+    llm = EchoLLM()
+    with patch("openai.resources.chat.completions.AsyncCompletions.create", new=llm):
+        async with app.router.lifespan_context(app):
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                ids = [
+                    (await client.post("/conversations/", json={"title": f"C{i}"})).json()["id"]
+                    for i in range(6)
+                ]
+                items = [{"conversation_id": i, "message": {"role": "user", "content": "hi"}} for i in ids]
+                lines = await _post_batch(client, items, max_parallel=3)
+
+                empty = await client.post("/conversations/batch/prompts", json={"items": []})
+
+    assert lines[-1] == {"type": "done", "succeeded": 6, "failed": 0}
+    assert llm.peak == 3
+    assert empty.status_code == 422
@@ -0,0 +1,110 @@
+import httpx
+import pytest
+from unittest.mock import AsyncMock, patch
+
+from app.config import settings
+from app.main import app
+from app.models import AuditLog, RoleEnum
+from app.services import llm_services
+from app.services.completion_cache import (
+    MemoryCompletionCache,
+    MongoCompletionCache,
+    TieredCompletionCache,
+    cache_key,
+)
+from tests.fakes import FakeCompletion
+
+
+def test_cache_key_normalizes_messages():
+    base = [{"role": "user", "content": "Hi"}]
+    assert cache_key("gpt-4o-mini", base) == cache_key("gpt-4o-mini", [{"role": RoleEnum.user, "content": " Hi\n"}])
+    assert cache_key("gpt-4o-mini", base) != cache_key("gpt-4o", base)
+    assert cache_key("gpt-4o-mini", base) != cache_key("gpt-4o-mini", [{"role": "assistant", "content": "Hi"}])
+
+
+@pytest.mark.asyncio
+async def test_memory_cache_lru_size_and_ttl_eviction():
+    """
+    Test that the in-process tier evicts least recently used entries by
+    count and by bytes, and expires entries after the TTL.
+    """
+    cache = MemoryCompletionCache(max_entries=2, max_bytes=1000, ttl=60)
+    await cache.set("a", "1")
+    await cache.set("b", "2")
+    assert await cache.get("a") == "1"  # "b" is now least recently used
+    await cache.set("c", "3")
+    assert await cache.get("b") is None
+    assert len(cache) == 2
+    assert cache.stats.evictions == 1
+
+    await cache.set("big", "x" * 996)
+    assert len(cache) == 1 and cache.size_bytes <= 1000
+    await cache.set("too-big", "x" * 2000)
+    assert await cache.get("too-big") is None
+
+    expiring = MemoryCompletionCache(ttl=0)
+    await expiring.set("k", "v")
+    assert await expiring.get("k") is None
+    assert expiring.stats.expirations == 1
+    assert (cache.stats.hits, expiring.stats.misses) == (1, 1)
+
+
+@pytest.mark.asyncio
+async def test_shared_tier_backfills_memory_and_failures_are_misses():
+    async with app.router.lifespan_context(app):
+        shared = MongoCompletionCache(ttl=60)
+        await shared.set("key", "shared answer")
+
+        memory = MemoryCompletionCache()
+        tiered = TieredCompletionCache([memory, shared])
+        assert await tiered.get("key") == "shared answer"
+        assert await memory.get("key") == "shared answer"
+        assert await tiered.get("missing") is None
+        assert (tiered.stats.hits, tiered.stats.misses) == (1, 1)
+
+    class BrokenTier:
+        async def get(self, key):
+            raise ConnectionError("down")
+
+        async def set(self, key, value):
+            raise ConnectionError("down")
+
+    broken = TieredCompletionCache([BrokenTier()])
+    await broken.set("key", "value")
+    assert await broken.get("key") is None
+    assert broken.stats.errors == 2
+
+
+@pytest.mark.asyncio
+async def test_identical_prompts_are_served_from_cache_and_audited(monkeypatch):
+    """
+    Test that a second identical context skips the upstream call but is still
+    audited, and that Cache-Control: no-cache bypasses the cache.
+    """
+    monkeypatch.setattr(settings, "COMPLETION_CACHE_ENABLED", True)
+    monkeypatch.setattr(llm_services, "completion_cache", TieredCompletionCache([MemoryCompletionCache()]))
+
+    with patch("openai.resources.chat.completions.AsyncCompletions.create", new_callable=AsyncMock) as mock_create:
+        mock_create.return_value = FakeCompletion("Opening hours are 9 to 5.")
+        async with app.router.lifespan_context(app):
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                conv_ids = [
+                    (await client.post("/conversations/", json={"title": f"FAQ {i}"})).json()["id"]
+                    for i in range(3)
+                ]
+                prompt = {"role": "user", "content": "When are you open?"}
+                replies = [
+                    await client.post(f"/conversations/{conv_ids[0]}/prompt", json=prompt),
+                    await client.post(f"/conversations/{conv_ids[1]}/prompt", json=prompt),
+                    await client.post(
+                        f"/conversations/{conv_ids[2]}/prompt", json=prompt, headers={"Cache-Control": "no-cache"}
+                    ),
+                ]
+            await llm_services.audit_writer.stop()
+            audits = await AuditLog.find({"conversation_id": {"$in": conv_ids}}).to_list()
+
+    assert all(r.json()["messages"][-1]["content"] == "Opening hours are 9 to 5." for r in replies)
+    assert mock_create.await_count == 2
+    assert llm_services.completion_cache.stats.hits == 1
+    assert sorted(a.conversation_id for a in audits) == sorted(conv_ids)
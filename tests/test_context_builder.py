@@ -0,0 +1,137 @@
+import pytest
+from fastapi.testclient import TestClient
+from unittest.mock import AsyncMock, patch
+
+from app.main import app
+from app.models import Conversation, Message, StorageMode
+from app.services import llm_services
+from app.services.context_builder import (
+    TOKENS_PER_MESSAGE,
+    TOKENS_PER_REPLY,
+    ContextBuilder,
+    context_window,
+    count_tokens,
+    parse_token_budgets,
+)
+from tests.fakes import FakeCompletion
+
+MODEL = "gpt-4o-mini"
+
+
+def _messages(n):
+    return [
+        Message(role="user" if i % 2 == 0 else "assistant", content=f"message {i:03d} " + "x" * 40)
+        for i in range(n)
+    ]
+
+
+def _budget_for(count, content="message 000 " + "x" * 40):
+    # Room for exactly `count` messages like the ones from _messages
+    return TOKENS_PER_REPLY + count * (count_tokens(content, MODEL) + TOKENS_PER_MESSAGE)
+
+
+async def _conversation(n, storage=StorageMode.embedded):
+    conv = Conversation(title="Context", storage=storage, bucket_size=4)
+    await conv.insert()
+    await conv.append_messages(*_messages(n))
+    return conv
+
+
+def _contents(context):
+    return [m["content"][:11] for m in context]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("storage", [StorageMode.embedded, StorageMode.bucketed])
+async def test_last_n_keeps_newest_messages_within_budget(storage):
+    """
+    Test that the last-N strategy keeps as many of the newest messages as fit
+    the budget, oldest first, paging back through bucketed history.
+    """
+    async with app.router.lifespan_context(app):
+        conv = await _conversation(20, storage)
+        builder = ContextBuilder(MODEL, budget=_budget_for(5), page_size=3)
+
+        context = await builder.build(conv)
+        assert _contents(context) == [f"message {i:03d}" for i in range(15, 20)]
+
+        builder.max_messages = 2
+        assert _contents(await builder.build(conv)) == ["message 018", "message 019"]
+
+
+@pytest.mark.asyncio
+async def test_head_tail_and_pinned_system_prompt():
+    """
+    Test that head+tail keeps the opening messages plus the newest ones, and
+    that the pinned system prompt always comes first.
+    """
+    async with app.router.lifespan_context(app):
+        conv = await _conversation(20)
+        system_prompt = "You are a helpful assistant."
+        builder = ContextBuilder(
+            MODEL,
+            budget=_budget_for(5) + count_tokens(system_prompt, MODEL) + TOKENS_PER_MESSAGE,
+            strategy="head_tail",
+            head_messages=2,
+            system_prompt=system_prompt,
+        )
+
+        context = await builder.build(conv, pending=[Message(role="user", content="message new")])
+        assert context[0] == {"role": "system", "content": system_prompt}
+        assert _contents(context[1:]) == ["message 000", "message 001", "message 018", "message 019", "message new"]
+
+
+@pytest.mark.asyncio
+async def test_newest_message_is_sent_even_over_budget():
+    async with app.router.lifespan_context(app):
+        conv = await _conversation(3)
+        context = await ContextBuilder(MODEL, budget=1).build(conv)
+        assert _contents(context) == ["message 002"]
+
+
+@pytest.mark.asyncio
+async def test_token_counts_are_cached_across_turns():
+    """
+    Test that resending the same history hits the token count cache instead
+    of recounting every message.
+    """
+    async with app.router.lifespan_context(app):
+        conv = await _conversation(10)
+        builder = ContextBuilder(MODEL, budget=100000)
+        await builder.build(conv)
+        before = count_tokens.cache_info()
+        await builder.build(conv)
+        after = count_tokens.cache_info()
+        assert after.hits - before.hits == 10
+        assert after.misses == before.misses
+
+
+def test_budget_configuration():
+    assert parse_token_budgets("gpt-4o=20000, gpt-4o-mini=8000") == {"gpt-4o": 20000, "gpt-4o-mini": 8000}
+    with pytest.raises(ValueError):
+        parse_token_budgets("gpt-4o")
+    assert context_window("gpt-4o-mini-2024-07-18") == 128000
+    assert context_window("gpt-4-0613") == 8192
+    with pytest.raises(ValueError):
+        ContextBuilder(MODEL, budget=100, strategy="everything")
+
+
+def test_send_prompt_sends_budgeted_context():
+    """
+    Test that the prompt endpoint sends only the history that fits the budget.
+    """
+    expected = ["prompt 2", "reply", "prompt 3"]
+    budget = TOKENS_PER_REPLY + sum(count_tokens(c, MODEL) + TOKENS_PER_MESSAGE for c in expected)
+    with TestClient(app) as client, \
+            patch.object(llm_services.context_builder, "model", MODEL), \
+            patch.object(llm_services.context_builder, "budget", budget), \
+            patch.object(llm_services.context_builder, "head_messages", 0), \
+            patch("openai.resources.chat.completions.AsyncCompletions.create", new_callable=AsyncMock) as mock_create:
+        mock_create.return_value = FakeCompletion("reply")
+        conv_id = client.post("/conversations/", json={"title": "Budgeted"}).json()["id"]
+        for i in range(4):
+            resp = client.post(f"/conversations/{conv_id}/prompt", json={"role": "user", "content": f"prompt {i}"})
+            assert resp.status_code == 200
+
+        sent = mock_create.call_args.kwargs["messages"]
+        assert [m["content"] for m in sent] == expected
@@ -0,0 +1,128 @@
+import pytest
+from fastapi.testclient import TestClient
+from unittest.mock import AsyncMock, patch
+
+from app.main import app
+from app.models import Conversation, Message
+from app.routers import conversation
+from app.services.conversation_cache import ConversationCache, estimate_size
+from tests.fakes import FakeCompletion
+
+
+def _messages(n, start=0):
+    return [Message(role="user", content=f"msg {i}") for i in range(start, start + n)]
+
+
+@pytest.mark.asyncio
+async def test_hits_until_another_writer_bumps_the_version():
+    """
+    Test that repeated loads are served from memory, and that a write made
+    through another copy (as another worker would) is never missed.
+    """
+    cache = ConversationCache()
+    async with app.router.lifespan_context(app):
+        conv = Conversation(title="Hot")
+        await conv.insert()
+        await conv.append_messages(*_messages(3))
+
+        first = await cache.get(conv.id)
+        second = await cache.get(conv.id)
+        assert [m.content for m in second.messages] == ["msg 0", "msg 1", "msg 2"]
+        assert (cache.stats.misses, cache.stats.hits) == (1, 1)
+        assert cache.stats.bytes_saved == estimate_size(first)
+
+        # Copies are independent: appending to one does not leak into the cache
+        second.messages.append(Message(role="user", content="local only"))
+        assert len((await cache.get(conv.id)).messages) == 3
+
+        other_worker = await Conversation.get(conv.id)
+        await other_worker.append_messages(*_messages(1, start=3))
+        fresh = await cache.get(conv.id)
+        assert fresh.total_messages() == 4
+        assert cache.stats.stale == 1
+
+
+@pytest.mark.asyncio
+async def test_write_through_only_for_objects_in_sync():
+    """
+    Test that an append stores the writer's object back into the cache,
+    unless the writer missed someone else's write in between.
+    """
+    cache = ConversationCache()
+    async with app.router.lifespan_context(app):
+        conv = Conversation(title="Writes")
+        await conv.insert()
+
+        mine = await cache.get(conv.id)
+        await mine.append_messages(*_messages(2))
+        cache.store(mine)
+        assert (await cache.get(conv.id)).total_messages() == 2
+        assert cache.stats.hits == 1
+
+        stale = await cache.get(conv.id)
+        other_worker = await Conversation.get(conv.id)
+        await other_worker.append_messages(*_messages(1, start=2))
+        await stale.append_messages(*_messages(1, start=3))
+        assert not stale.in_sync
+        cache.store(stale)
+        assert len(cache) == 0
+
+        reloaded = await cache.get(conv.id)
+        assert [m.content for m in reloaded.messages] == ["msg 0", "msg 1", "msg 2", "msg 3"]
+
+        await reloaded.set_fields({"title": "Renamed"})
+        cache.store(reloaded)
+        assert (await cache.get(conv.id)).title == "Renamed"
+
+        await reloaded.delete()
+        assert await cache.get(conv.id) is None
+        assert len(cache) == 0
+
+
+@pytest.mark.asyncio
+async def test_lru_bounds_by_entries_and_bytes():
+    async with app.router.lifespan_context(app):
+        convs = []
+        for i in range(3):
+            conv = Conversation(title=f"C{i}")
+            await conv.insert()
+            await conv.append_messages(Message(role="user", content="x" * 1000))
+            convs.append(conv)
+
+        by_count = ConversationCache(max_entries=2)
+        for conv in convs:
+            await by_count.get(conv.id)
+        await by_count.get(convs[1].id)
+        await by_count.get(convs[2].id)
+        assert len(by_count) == 2 and by_count.stats.evictions == 1
+        assert by_count.stats.hits == 2
+
+        by_bytes = ConversationCache(max_bytes=2 * estimate_size(convs[0]) + 10)
+        for conv in convs:
+            await by_bytes.get(conv.id)
+        assert len(by_bytes) == 2 and by_bytes.size_bytes <= by_bytes.max_bytes
+
+
+def test_prompts_reuse_the_cached_conversation(monkeypatch):
+    """
+    Test that a new conversation and back-to-back prompts on it never load
+    the full document, and that a deleted conversation is not served.
+    """
+    cache = ConversationCache()
+    monkeypatch.setattr(conversation, "conversation_cache", cache)
+    with patch("openai.resources.chat.completions.AsyncCompletions.create", new_callable=AsyncMock) as mock_create:
+        mock_create.return_value = FakeCompletion("Sure")
+        with TestClient(app) as client:
+            conv_id = client.post("/conversations/", json={"title": "Chat"}).json()["id"]
+            for i in range(3):
+                resp = client.post(f"/conversations/{conv_id}/prompt", json={"role": "user", "content": f"Q{i}"})
+                assert resp.status_code == 200
+            assert resp.json()["message_count"] == 6
+            assert client.get(f"/conversations/{conv_id}").json()["message_count"] == 6
+
+            assert client.delete(f"/conversations/{conv_id}").status_code == 204
+            assert client.get(f"/conversations/{conv_id}").status_code == 404
+
+    # Three prompts, the GET and the DELETE; only the final lookup misses
+    assert cache.stats.hits == 5
+    assert cache.stats.misses == 1
@@ -0,0 +1,122 @@
+import asyncio
+import socket
+import threading
+import time
+
+import httpx
+import pytest
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+from app.config import settings
+from app.main import app
+from app.services import llm_services
+
+STUB_LATENCY = 0.3
+CONCURRENT_PROMPTS = 8
+
+
+class StubLLMServer:
+    """
+    Local OpenAI-compatible HTTP server: answers /v1/chat/completions after a
+    fixed delay and records how many requests were in flight at the same time.
+    """
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.in_flight = 0
+        self.max_in_flight = 0
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            self.port = sock.getsockname()[1]
+        stub_app = Starlette(routes=[Route("/v1/chat/completions", self.chat_completions, methods=["POST"])])
+        self.server = uvicorn.Server(uvicorn.Config(stub_app, port=self.port, log_level="warning"))
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}/v1"
+
+    async def chat_completions(self, request: Request) -> JSONResponse:
+        body = await request.json()
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.latency)
+        finally:
+            self.in_flight -= 1
+        return JSONResponse({
+            "id": "chatcmpl-stub",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body["model"],
+            "choices": [{
+                "index": 0,
+                "finish_reason": "stop",
+                "message": {"role": "assistant", "content": "stub reply"},
+            }],
+        })
+
+    def __enter__(self):
+        self.thread.start()
+        while not self.server.started:
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *exc):
+        self.server.should_exit = True
+        self.thread.join()
+
+
+async def _run_concurrent_prompts(stub: StubLLMServer, monkeypatch):
+    monkeypatch.setattr(settings, "OPENAI_API_KEY", "stub-key")
+    llm_services._client = llm_services.create_llm_client(base_url=stub.base_url)
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            conv_ids = []
+            for i in range(CONCURRENT_PROMPTS):
+                resp = await client.post("/conversations/", json={"title": f"Load {i}"})
+                conv_ids.append(resp.json()["id"])
+
+            start = time.perf_counter()
+            responses = await asyncio.gather(*[
+                client.post(f"/conversations/{conv_id}/prompt", json={"role": "user", "content": "Hi"})
+                for conv_id in conv_ids
+            ])
+            elapsed = time.perf_counter() - start
+
+    assert all(r.status_code == 200 for r in responses)
+    assert all(r.json()["messages"][-1]["content"] == "stub reply" for r in responses)
+    return elapsed
+
+
+@pytest.mark.asyncio
+async def test_concurrent_prompts_overlap(monkeypatch):
+    """
+    N concurrent /prompt calls against a slow stub LLM should overlap instead of
+    queueing behind each other, so total time stays close to a single call.
+    """
+    with StubLLMServer(STUB_LATENCY) as stub:
+        elapsed = await _run_concurrent_prompts(stub, monkeypatch)
+
+    assert stub.max_in_flight == CONCURRENT_PROMPTS
+    # Serialized calls would take CONCURRENT_PROMPTS * STUB_LATENCY seconds.
+    assert elapsed < STUB_LATENCY * CONCURRENT_PROMPTS / 2
+
+
+@pytest.mark.asyncio
+async def test_connection_pool_caps_upstream_concurrency(monkeypatch):
+    """
+    The shared pool's LLM_MAX_CONNECTIONS bounds how many upstream calls run at once.
+    """
+    monkeypatch.setattr(settings, "LLM_MAX_CONNECTIONS", 2)
+    with StubLLMServer(STUB_LATENCY) as stub:
+        elapsed = await _run_concurrent_prompts(stub, monkeypatch)
+
+    assert stub.max_in_flight == 2
+    assert elapsed >= STUB_LATENCY * CONCURRENT_PROMPTS / 2
@@ -0,0 +1,112 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+from unittest.mock import patch
+
+from app.main import app
+from app.services import llm_services
+from app.services.llm_providers import FakeProvider, LLMRouter, Route, parse_routing_rules
+
+
+class FailingProvider(FakeProvider):
+    async def create(self, model, messages, stream=False):
+        self.calls += 1
+        raise RuntimeError("provider down")
+
+
+def _router(hedge_delay=0.05, primary_latency=0.0, backup_latency=0.0, primary=None):
+    providers = {
+        "primary": primary or FakeProvider("primary", latency=primary_latency),
+        "backup": FakeProvider("backup", latency=backup_latency),
+    }
+    return LLMRouter(providers, Route("primary", "big"), hedge=Route("backup", "small"), hedge_delay=hedge_delay)
+
+
+def _text(response):
+    return response.choices[0].message.content
+
+
+def test_routes_by_conversation_setting_then_context_size():
+    providers = {"openai": FakeProvider("openai"), "local": FakeProvider("local")}
+    rules = parse_routing_rules("8000=openai/gpt-4o-mini,1000=local/llama3.1", providers, "openai")
+    router = LLMRouter(providers, Route("openai", "gpt-4o"), rules=rules)
+
+    assert router.route(500) == Route("local", "llama3.1")
+    assert router.route(5000) == Route("openai", "gpt-4o-mini")
+    assert router.route(50000) == Route("openai", "gpt-4o")
+    assert router.route(500, "openai/gpt-4.1") == Route("openai", "gpt-4.1")
+    # Not a provider prefix: the whole value is a model on the default provider
+    assert router.route(500, "meta-llama/Llama-3-8B") == Route("openai", "meta-llama/Llama-3-8B")
+
+    with pytest.raises(ValueError):
+        LLMRouter(providers, Route("missing", "x"))
+
+
+@pytest.mark.asyncio
+async def test_fast_primary_is_not_hedged():
+    router = _router(hedge_delay=0.5)
+    response, served_by = await router.complete(Route("primary", "big"), [{"role": "user", "content": "hi"}])
+    assert served_by == Route("primary", "big")
+    assert _text(response).startswith("[big] ")
+    assert router.providers["backup"].calls == 0
+    assert router.stats.hedged == 0
+
+
+@pytest.mark.asyncio
+async def test_slow_primary_is_hedged_and_first_answer_wins():
+    router = _router(primary_latency=5.0)
+    response, served_by = await asyncio.wait_for(
+        router.complete(Route("primary", "big"), [{"role": "user", "content": "hi"}]), timeout=1
+    )
+    assert served_by == Route("backup", "small")
+    assert _text(response).startswith("[small] ")
+    assert (router.stats.hedged, router.stats.hedge_wins) == (1, 1)
+
+    # The primary keeps its lead when it answers before the backup does
+    router = _router(primary_latency=0.1, backup_latency=5.0)
+    _, served_by = await asyncio.wait_for(
+        router.complete(Route("primary", "big"), [{"role": "user", "content": "hi"}]), timeout=1
+    )
+    assert served_by == Route("primary", "big")
+    assert (router.stats.hedged, router.stats.hedge_wins) == (1, 0)
+
+
+@pytest.mark.asyncio
+async def test_failed_primary_falls_back_without_waiting():
+    router = _router(hedge_delay=5.0, primary=FailingProvider("primary"))
+    stream, served_by = await asyncio.wait_for(
+        router.open_stream(Route("primary", "big"), [{"role": "user", "content": "hi"}]), timeout=1
+    )
+    assert served_by == Route("backup", "small")
+    assert [chunk.choices[0].delta.content async for chunk in stream][0] == "[small]"
+    assert router.stats.fallbacks == 1
+
+    both_down = _router(primary=FailingProvider("primary"))
+    both_down.providers["backup"] = FailingProvider("backup")
+    with pytest.raises(RuntimeError):
+        await both_down.complete(Route("primary", "big"), [{"role": "user", "content": "hi"}])
+
+
+def test_conversation_model_setting_routes_prompts():
+    """
+    Test that a conversation created with a model is answered by that
+    provider, and that clearing the setting returns it to the default route.
+    """
+    fake = FakeProvider("fake")
+    router = LLMRouter(
+        {"openai": FakeProvider("openai"), "fake": fake}, Route("openai", "gpt-4o-mini")
+    )
+    with patch.object(llm_services, "llm_router", router), TestClient(app) as client:
+        conv = client.post("/conversations/", json={"title": "Local", "model": "fake/tiny"}).json()
+        assert conv["model"] == "fake/tiny"
+
+        resp = client.post(f"/conversations/{conv['id']}/prompt", json={"role": "user", "content": "Hello"})
+        assert resp.status_code == 200
+        assert resp.json()["messages"][-1]["content"] == fake.reply("tiny", [{"content": "Hello"}])
+
+        resp = client.put(f"/conversations/{conv['id']}", json={"model": ""})
+        assert resp.json()["model"] is None
+        resp = client.post(f"/conversations/{conv['id']}/prompt/stream", json={"role": "user", "content": "Again"})
+        assert '"[gpt-4o-mini]' in resp.text
+        assert fake.calls == 1
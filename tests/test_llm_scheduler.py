@@ -0,0 +1,146 @@
+import asyncio
+import time
+
+import httpx
+import openai
+import pytest
+from fastapi.testclient import TestClient
+from unittest.mock import AsyncMock, patch
+
+from app.main import app
+from app.services import llm_services
+from app.services.llm_scheduler import LLMScheduler, SchedulerRejected, TokenBucket
+from tests.fakes import FakeStream
+
+
+def _api_error(cls, status_code):
+    response = httpx.Response(status_code, request=httpx.Request("POST", "http://llm.test/v1/chat/completions"))
+    return cls("upstream error", response=response, body=None)
+
+
+@pytest.mark.asyncio
+async def test_concurrency_cap():
+    scheduler = LLMScheduler(max_concurrency=2)
+    running = 0
+    peak = 0
+
+    async def call():
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.02)
+        running -= 1
+        return "ok"
+
+    results = await asyncio.gather(*[scheduler.submit(call, f"conv-{i}") for i in range(6)])
+    assert results == ["ok"] * 6
+    assert peak == 2
+    assert scheduler.active == 0
+    assert scheduler.stats.completed == 6
+    assert scheduler.stats.queue_wait_seconds_max > 0
+
+
+@pytest.mark.asyncio
+async def test_round_robin_across_conversations_and_priority():
+    """
+    Test that a conversation with many queued calls cannot starve a quieter
+    one, and that a higher priority is served first.
+    """
+    scheduler = LLMScheduler(max_concurrency=1)
+    await scheduler.acquire("holder")
+    order = []
+
+    async def request(conv, priority=0):
+        await scheduler.acquire(conv, priority=priority)
+        order.append(conv)
+        scheduler.release()
+
+    tasks = [asyncio.create_task(request("busy")) for _ in range(3)]
+    await asyncio.sleep(0)
+    tasks.append(asyncio.create_task(request("quiet")))
+    await asyncio.sleep(0)
+    tasks.append(asyncio.create_task(request("urgent", priority=1)))
+    await asyncio.sleep(0)
+
+    scheduler.release()
+    await asyncio.gather(*tasks)
+    assert order == ["urgent", "busy", "quiet", "busy", "busy"]
+
+
+@pytest.mark.asyncio
+async def test_rejects_when_queue_full_or_wait_too_long():
+    scheduler = LLMScheduler(max_concurrency=1, max_queue=1, queue_timeout=0.05)
+    await scheduler.acquire("holder")
+    waiter = asyncio.create_task(scheduler.acquire("a"))
+    await asyncio.sleep(0)
+
+    with pytest.raises(SchedulerRejected):
+        await scheduler.acquire("b")
+    with pytest.raises(SchedulerRejected):
+        await waiter
+    assert scheduler.stats.rejected == 2
+    assert scheduler.stats.timed_out == 1
+
+    # A cancelled or timed-out waiter never takes the slot
+    scheduler.release()
+    assert scheduler.active == 0 and scheduler.waiting == 0
+
+
+@pytest.mark.asyncio
+async def test_retries_transient_errors_only():
+    scheduler = LLMScheduler(retries=3, backoff_base=0.001)
+    attempts = 0
+
+    async def flaky():
+        nonlocal attempts
+        attempts += 1
+        if attempts == 1:
+            raise _api_error(openai.RateLimitError, 429)
+        if attempts == 2:
+            raise _api_error(openai.InternalServerError, 503)
+        return "ok"
+
+    assert await scheduler.submit(flaky, "conv") == "ok"
+    assert scheduler.stats.retries == 2
+
+    bad_request = AsyncMock(side_effect=_api_error(openai.BadRequestError, 400))
+    with pytest.raises(openai.BadRequestError):
+        await scheduler.submit(bad_request, "conv")
+    assert bad_request.await_count == 1
+    assert scheduler.stats.failed == 1
+    assert scheduler.active == 0
+
+
+@pytest.mark.asyncio
+async def test_token_bucket_paces_requests():
+    bucket = TokenBucket(per_minute=1200, capacity=1)  # 20 per second
+    start = time.monotonic()
+    for _ in range(3):
+        await bucket.acquire(1)
+    assert time.monotonic() - start >= 0.09
+
+    unlimited = TokenBucket(per_minute=0)
+    await unlimited.acquire(10 ** 9)
+
+
+def test_prompt_returns_503_when_scheduler_is_saturated(monkeypatch):
+    monkeypatch.setattr(llm_services, "llm_scheduler", LLMScheduler(max_concurrency=0, max_queue=0))
+    with patch("openai.resources.chat.completions.AsyncCompletions.create", new_callable=AsyncMock):
+        with TestClient(app) as client:
+            conv_id = client.post("/conversations/", json={"title": "Busy"}).json()["id"]
+            resp = client.post(f"/conversations/{conv_id}/prompt", json={"role": "user", "content": "Hi"})
+            assert resp.status_code == 503
+
+
+def test_stream_holds_slot_until_closed(monkeypatch):
+    scheduler = LLMScheduler(max_concurrency=1)
+    monkeypatch.setattr(llm_services, "llm_scheduler", scheduler)
+    with patch("openai.resources.chat.completions.AsyncCompletions.create", new_callable=AsyncMock) as mock_create:
+        mock_create.side_effect = lambda *a, **kw: FakeStream(["Hel", "lo"])
+        with TestClient(app) as client:
+            conv_id = client.post("/conversations/", json={"title": "Stream"}).json()["id"]
+            for _ in range(2):
+                resp = client.post(f"/conversations/{conv_id}/prompt/stream", json={"role": "user", "content": "Hi"})
+                assert resp.status_code == 200
+                assert scheduler.active == 0
+    assert scheduler.stats.waits == 2
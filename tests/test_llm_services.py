@@ -1,8 +1,9 @@
 import pytest
 import re
 from fastapi import HTTPException
-from app.services.llm_services import get_llm_response, mask_sensitive_info, openai
+from app.services.llm_services import get_llm_client, get_llm_response, iter_llm_deltas, mask_sensitive_info
 from app.models import AuditLog
+from tests.fakes import FakeStream
 
 
 def test_mask_sensitive_info():
@@ -49,9 +50,9 @@ async def test_get_llm_response_success(monkeypatch):
     with masked sensitive information.
     """
     # --- Patch the OpenAI completions call ---
-    def fake_create(*args, **kwargs):
+    async def fake_create(*args, **kwargs):
         return FakeResponse()
-    monkeypatch.setattr(openai.chat.completions, "create", fake_create)
+    monkeypatch.setattr(get_llm_client().chat.completions, "create", fake_create)
 
     # --- Patch AuditLog.insert to capture the inserted values ---
     captured_audit = {}
@@ -93,10 +94,10 @@ async def test_get_llm_response_failure(monkeypatch):
     """
     Test that if the OpenAI call fails, get_llm_response raises an HTTPException with status code 502.
     """
-    # Patch openai.chat.completions.create to raise an Exception.
-    def fake_create_failure(*args, **kwargs):
+    # Patch the client's chat.completions.create to raise an Exception.
+    async def fake_create_failure(*args, **kwargs):
         raise Exception("Fake error")
-    monkeypatch.setattr(openai.chat.completions, "create", fake_create_failure)
+    monkeypatch.setattr(get_llm_client().chat.completions, "create", fake_create_failure)
 
     context_messages = [{"role": "user", "content": "Test message"}]
     convo_id = "test-failure"
@@ -105,4 +106,16 @@ async def test_get_llm_response_failure(monkeypatch):
         await get_llm_response(context_messages, convo_id)
 
     assert exc_info.value.status_code == 502
-    assert "LLM service error" in exc_info.value.detail
\ No newline at end of file
+    assert "LLM service error" in exc_info.value.detail
+
+@pytest.mark.asyncio
+async def test_iter_llm_deltas_closes_upstream_on_early_exit():
+    """
+    Test that the upstream stream is closed when the consumer stops early,
+    as happens when a streaming client disconnects.
+    """
+    stream = FakeStream(["a", "b", "c"])
+    deltas = iter_llm_deltas(stream)
+    assert await deltas.__anext__() == "a"
+    await deltas.aclose()
+    assert stream.closed
@@ -0,0 +1,116 @@
+import re
+import time
+
+import pytest
+
+from app.services.llm_services import mask_sensitive_info
+from app.services.masking import MaskingEngine, MaskingRule, RuleSet, get_rule_set, register_rule_set
+
+
+def legacy_mask_sensitive_info(text: str) -> str:
+    """
+    The original six-pass implementation, kept as the reference output.
+    """
+    text = re.sub(r'\b[STFG]\d{7}[A-Z]\b', '[MASKED_NRIC]', text, flags=re.IGNORECASE)
+    text = re.sub(r'\b(?:\+65[- ]?)?(?:6|8|9)\d{7}\b', '[MASKED_PHONE]', text)
+    text = re.sub(r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}\b', '[MASKED_EMAIL]', text)
+    text = re.sub(r'\b\d{6}\b', '[MASKED_POSTAL]', text)
+    text = re.sub(
+        r'\b(?:Blk|Block)\s*\d+\w*(?:[\s,]+[A-Za-z0-9]+)*\s+(?:Street|St\.|Road|Rd\.|Avenue|Ave\.|Drive|Dr\.|Lane|Ln\.)\b',
+        '[MASKED_ADDRESS]', text, flags=re.IGNORECASE
+    )
+    text = re.sub(
+        r'\b\d+\s+[A-Za-z0-9\s,]*?(?:Street|St\.|Road|Rd\.|Avenue|Ave\.|Drive|Dr\.|Lane|Ln\.)\b',
+        '[MASKED_ADDRESS]', text, flags=re.IGNORECASE
+    )
+    return text
+
+
+CORPUS = [
+    "Contact me at user@example.com, call me at +65 91234567. "
+    "My NRIC is S1234567D and postal code is 123456. "
+    "Visit my office at Blk 123 Ang Mo Kio Ave 3 or 123 Orchard Road.",
+    "No PII here, just a question about the weather.",
+    "my fin is g7654321x and my number is 6123 4567",
+    "Call +65-81234567 or 98765432, or email first.last+tag@mail.example.co.sg",
+    "Ship to Block 5A, Jurong West Street 41, Singapore 640005.",
+    "I live at 10 Anson Road, #12-01, Singapore 079903",
+    "Meet at 1 Raffles Place Lane tomorrow at 9.",
+    "blk 88 tampines st. 81 #05-12",
+    "Order 123456789 was delivered to 45 Bukit Timah Rd. yesterday",
+    "T0123456A T0123456 0123456A",
+    "He said 12 people came down the street, 3 of them from 5 Holland Dr.",
+    "Emails: a@b.co, bad@nodomain, x.y@z.com.",
+    "Postal codes 018956, 0189567 and 01895.",
+    "multi\nline 21 Lower Kent Ridge Road\nS9876543Z\n",
+    "1 2 3 4 5 6 7 8 9 10",
+    "",
+]
+
+
+@pytest.mark.parametrize("text", CORPUS)
+def test_engine_matches_legacy_output(text):
+    assert mask_sensitive_info(text) == legacy_mask_sensitive_info(text)
+
+
+ADVERSARIAL_INPUTS = {
+    "digit_words": lambda n: "1 " * n,
+    "block_prefixes": lambda n: "Blk 1 " * n,
+    "long_whitespace": lambda n: "1" + " " * (2 * n) + "x",
+    "email_like": lambda n: "a." * n + "@" + "b." * n,
+    "digit_run": lambda n: "9" * (2 * n),
+}
+
+
+def _seconds(text):
+    start = time.perf_counter()
+    mask_sensitive_info(text)
+    return time.perf_counter() - start
+
+
+@pytest.mark.parametrize("name", ADVERSARIAL_INPUTS)
+def test_masking_is_linear_on_worst_case_inputs(name):
+    """
+    Quadrupling the input should roughly quadruple the work. The original
+    patterns grow quadratically here (about 16x, and tens of seconds at these sizes).
+    """
+    make = ADVERSARIAL_INPUTS[name]
+    _seconds(make(1000))  # warm up
+    small = min(_seconds(make(5000)) for _ in range(3))
+    large = min(_seconds(make(20000)) for _ in range(3))
+    assert large < 2  # generous for loaded CI machines; the legacy code took tens of seconds
+    assert large < max(small, 1e-3) * 8
+
+
+def test_rule_sets_are_pluggable():
+    """
+    Test that extra rule sets plug into the same single-pass engine, after
+    the rules listed before them.
+    """
+    register_rule_set(RuleSet("test_ids", [
+        MaskingRule("employee_id", r'\bEMP-\d{4}\b', '[MASKED_EMPLOYEE]', max_length=8),
+    ]))
+    engine = MaskingEngine.from_rule_sets(["sg", "test_ids"])
+
+    assert engine.mask("EMP-1234 wrote from a@b.com") == "[MASKED_EMPLOYEE] wrote from [MASKED_EMAIL]"
+    assert engine.max_match_length >= get_rule_set("sg").rules[0].max_length
+    with pytest.raises(ValueError):
+        get_rule_set("missing")
+
+
+STRADDLE_TEXT = (
+    "intro " * 300 + "mail jane.doe@example.com now, NRIC S1234567D, "
+    "Blk 123 Ang Mo Kio Ave 3 Street and 10 Anson Road " + "tail " * 300
+)
+
+
+def test_partial_masking_matches_full_masking():
+    """
+    Test that masking only the stored head or tail gives exactly the slice
+    of the fully masked text, for every cut including ones inside PII.
+    """
+    engine = MaskingEngine.from_rule_sets(["sg"])
+    masked = engine.mask(STRADDLE_TEXT)
+    for length in range(0, len(masked) + 10, 3):
+        assert engine.mask_tail(STRADDLE_TEXT, length) == (masked[-length:] if length else "")
+        assert engine.mask_head(STRADDLE_TEXT, length) == masked[:length]
@@ -0,0 +1,109 @@
+import httpx
+import pytest
+
+from app.main import app
+from app.models import Conversation, Message, MessageBucket, StorageMode
+from app.services.message_migration import migrate_conversation
+
+
+def _messages(n, start=0):
+    return [
+        Message(role="user" if i % 2 == 0 else "assistant", content=f"msg {i}")
+        for i in range(start, start + n)
+    ]
+
+
+@pytest.mark.asyncio
+async def test_bucketed_append_and_range_reads():
+    """
+    Test that bucketed conversations spread messages over fixed-size buckets
+    and that range and last-K reads only return the requested window.
+    """
+    async with app.router.lifespan_context(app):
+        conv = Conversation(title="Bucketed", storage=StorageMode.bucketed, bucket_size=3)
+        await conv.insert()
+        for i in range(0, 8, 2):
+            await conv.append_messages(*_messages(2, start=i))
+
+        stored = await Conversation.get(conv.id)
+        assert stored.messages == []
+        assert stored.total_messages() == 8
+        assert await MessageBucket.find(MessageBucket.conversation_id == conv.id).count() == 3
+
+        assert [m.content for m in await stored.read_messages(2, 5)] == ["msg 2", "msg 3", "msg 4"]
+        assert [m.content for m in await stored.last_messages(2)] == ["msg 6", "msg 7"]
+        assert len(await stored.read_messages()) == 8
+
+        await stored.delete()
+        await stored.delete_messages()
+        assert await MessageBucket.find(MessageBucket.conversation_id == conv.id).count() == 0
+
+
+@pytest.mark.asyncio
+async def test_migrate_embedded_conversation():
+    """
+    Test that migration moves embedded messages into buckets without
+    changing what readers see.
+    """
+    async with app.router.lifespan_context(app):
+        conv = Conversation(title="Embedded")
+        await conv.insert()
+        await conv.append_messages(*_messages(5))
+
+        assert await migrate_conversation(conv, bucket_size=2)
+
+        migrated = await Conversation.get(conv.id)
+        assert migrated.storage == StorageMode.bucketed
+        assert migrated.messages == []
+        assert [m.content for m in await migrated.read_messages()] == [f"msg {i}" for i in range(5)]
+
+        # Appends after migration continue the sequence
+        await migrated.append_messages(*_messages(1, start=5))
+        assert [m.content for m in await migrated.last_messages(2)] == ["msg 4", "msg 5"]
+
+
+@pytest.mark.asyncio
+async def test_append_from_stale_embedded_copy_after_migration():
+    """
+    Test that an append prepared before a migration lands in the buckets
+    instead of the hidden embedded array.
+    """
+    async with app.router.lifespan_context(app):
+        conv = Conversation(title="Stale")
+        await conv.insert()
+        await conv.append_messages(Message(role="user", content="a"))
+
+        stale = await Conversation.get(conv.id)
+        assert await migrate_conversation(await Conversation.get(conv.id), bucket_size=2)
+
+        assert await stale.append_messages(Message(role="assistant", content="b"))
+        assert stale.storage == StorageMode.bucketed
+
+        stored = await Conversation.get(conv.id)
+        assert stored.messages == []
+        assert [m.content for m in await stored.read_messages()] == ["a", "b"]
+
+
+@pytest.mark.asyncio
+async def test_get_conversation_message_window():
+    """
+    Test that GET /conversations/{id} returns a paginated message window.
+    """
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            conv_id = (await client.post("/conversations/", json={"title": "Window"})).json()["id"]
+            conv = await Conversation.get(conv_id)
+            await conv.append_messages(*_messages(7))
+
+            latest = (await client.get(f"/conversations/{conv_id}", params={"limit": 3})).json()
+            assert latest["message_count"] == 7
+            assert latest["message_offset"] == 4
+            assert [m["content"] for m in latest["messages"]] == ["msg 4", "msg 5", "msg 6"]
+
+            older = (await client.get(
+                f"/conversations/{conv_id}",
+                params={"limit": 3, "before": latest["message_offset"]}
+            )).json()
+            assert older["message_offset"] == 1
+            assert [m["content"] for m in older["messages"]] == ["msg 1", "msg 2", "msg 3"]
@@ -0,0 +1,109 @@
+import re
+from types import SimpleNamespace
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from unittest.mock import AsyncMock, patch
+
+from app import main
+from app.metrics import MetricsMiddleware, MetricsRegistry, PrometheusExporter, metrics
+from app.routers import conversation
+from app.routers import metrics as metrics_router
+from tests.fakes import FakeCompletion
+
+
+def _sample(text, name, **labels):
+    """
+    Returns the value of one sample in Prometheus text output, or None.
+    """
+    for line in text.splitlines():
+        if line.startswith("#"):
+            continue
+        match = re.match(r"([a-zA-Z_:][\w:]*)(?:\{(.*)\})? (\S+)$", line)
+        found = dict(re.findall(r'(\w+)="((?:[^"\\]|\\.)*)"', match.group(2) or ""))
+        if match.group(1) == name and found == {k: str(v) for k, v in labels.items()}:
+            return float(match.group(3))
+    return None
+
+
+def test_histogram_counter_and_stats_rendering():
+    registry = MetricsRegistry(prefix="test")
+    latency = registry.histogram("op_seconds", "Op latency", ("op",), buckets=(0.1, 1.0))
+    calls = registry.counter("calls_total", "Calls", ("path",))
+    for value in (0.05, 0.5, 5.0):
+        latency.observe(value, "read")
+    calls.inc(2, 'a "quoted"\npath')
+    registry.register_value("depth", "Queue depth", lambda: 7)
+
+    text = PrometheusExporter.render(registry)
+    assert "# TYPE test_op_seconds histogram" in text
+    assert _sample(text, "test_op_seconds_bucket", op="read", le="0.1") == 1
+    assert _sample(text, "test_op_seconds_bucket", op="read", le="1.0") == 2
+    assert _sample(text, "test_op_seconds_bucket", op="read", le="+Inf") == 3
+    assert _sample(text, "test_op_seconds_count", op="read") == 3
+    assert _sample(text, "test_op_seconds_sum", op="read") == pytest.approx(5.55)
+    assert 'test_calls_total{path="a \\"quoted\\"\\npath"} 2' in text
+    assert _sample(text, "test_depth") == 7
+
+
+def test_register_stats_maps_fields_to_counters_and_gauges():
+    from app.services.llm_scheduler import SchedulerStats
+
+    stats = SchedulerStats(completed=3, queue_wait_seconds_total=1.5, queue_wait_seconds_max=0.75)
+    registry = MetricsRegistry(prefix="test")
+    registry.register_stats("scheduler", lambda: stats, "Scheduler")
+    text = PrometheusExporter.render(registry)
+    assert "# TYPE test_scheduler_completed_total counter" in text
+    assert _sample(text, "test_scheduler_completed_total") == 3
+    assert _sample(text, "test_scheduler_queue_wait_seconds_total") == 1.5
+    assert "# TYPE test_scheduler_queue_wait_seconds_max gauge" in text
+
+
+@pytest.mark.asyncio
+async def test_metrics_endpoint_reports_requests_llm_calls_and_audits(monkeypatch):
+    """
+    Test an app wired the way main.py does it when METRICS_ENABLED is set:
+    route latency, LLM latency and tokens, audit timings and service stats.
+    """
+    monkeypatch.setattr(metrics, "enabled", True)
+    monkeypatch.setattr(metrics, "_collectors", [])
+    main.register_stats_metrics()
+
+    instrumented = FastAPI(lifespan=main.lifespan)
+    instrumented.include_router(conversation.router)
+    instrumented.include_router(metrics_router.router)
+    instrumented.add_middleware(MetricsMiddleware)
+
+    usage = SimpleNamespace(prompt_tokens=12, completion_tokens=3)
+    route = "/conversations/{conversation_id}/prompt"
+    with patch("openai.resources.chat.completions.AsyncCompletions.create", new_callable=AsyncMock) as mock_create:
+        mock_create.return_value = FakeCompletion("Hi there", usage=usage)
+        async with instrumented.router.lifespan_context(instrumented):
+            transport = httpx.ASGITransport(app=instrumented)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                conv_id = (await client.post("/conversations/", json={"title": "Metrics"})).json()["id"]
+                before = PrometheusExporter.render(metrics)
+                resp = await client.post(f"/conversations/{conv_id}/prompt", json={"role": "user", "content": "Hi"})
+                assert resp.status_code == 200
+                scrape = await client.get("/metrics")
+        final = PrometheusExporter.render(metrics)
+
+    assert scrape.status_code == 200
+    assert scrape.headers["content-type"].startswith("text/plain; version=0.0.4")
+    text = scrape.text
+
+    def delta(text, name, **labels):
+        return (_sample(text, name, **labels) or 0) - (_sample(before, name, **labels) or 0)
+
+    assert delta(text, "app_http_request_duration_seconds_count", method="POST", route=route, status=200) == 1
+    assert delta(text, "app_llm_request_duration_seconds_count",
+                 model=main.settings.OPENAI_MODEL, mode="complete", outcome="ok") == 1
+    assert delta(text, "app_llm_tokens_total", model=main.settings.OPENAI_MODEL, kind="prompt") == 12
+    assert delta(text, "app_llm_tokens_total", model=main.settings.OPENAI_MODEL, kind="completion") == 3
+    assert delta(text, "app_llm_scheduler_completed_total") == 1
+    assert _sample(text, "app_conversation_cache_hits_total") is not None
+    assert _sample(text, "app_prompt_dedup_shared_total") is not None
+    # The audit writer flushes at shutdown at the latest
+    assert delta(final, "app_audit_mask_duration_seconds_count") >= 1
+    assert delta(final, "app_audit_write_duration_seconds_count") >= 1
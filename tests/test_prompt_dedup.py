@@ -0,0 +1,110 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import httpx
+import pytest
+from unittest.mock import AsyncMock, patch
+
+from app.main import app
+from app.models import IdempotencyRecord
+from app.routers import conversation
+from app.services.idempotency import request_hash
+from tests.fakes import FakeCompletion
+
+
+class SlowLLM:
+    """
+    Completion stub that holds every call until released.
+    """
+
+    def __init__(self):
+        self.release = asyncio.Event()
+        self.calls = 0
+
+    async def __call__(self, *args, **kwargs):
+        self.calls += 1
+        await self.release.wait()
+        return FakeCompletion(f"reply {self.calls}")
+
+
+async def _client_session():
+    transport = httpx.ASGITransport(app=app)
+    return httpx.AsyncClient(transport=transport, base_url="http://test")
+
+
+@pytest.mark.asyncio
+async def test_concurrent_identical_prompts_share_one_call():
+    """
+    Test that a double-submitted prompt makes one upstream call and appends
+    one turn, while a different prompt is not coalesced.
+    """
+    llm = SlowLLM()
+    with patch("openai.resources.chat.completions.AsyncCompletions.create", new=llm):
+        async with app.router.lifespan_context(app):
+            async with await _client_session() as client:
+                conv_id = (await client.post("/conversations/", json={"title": "Dedup"})).json()["id"]
+                prompt = {"role": "user", "content": "Hello?"}
+                first = asyncio.create_task(client.post(f"/conversations/{conv_id}/prompt", json=prompt))
+                second = asyncio.create_task(client.post(f"/conversations/{conv_id}/prompt", json=prompt))
+                while llm.calls == 0:
+                    await asyncio.sleep(0.01)
+                await asyncio.sleep(0.05)
+                llm.release.set()
+                responses = await asyncio.gather(first, second)
+
+                other = await client.post(
+                    f"/conversations/{conv_id}/prompt", json={"role": "user", "content": "Something else"}
+                )
+                stored = (await client.get(f"/conversations/{conv_id}")).json()
+
+    assert [r.status_code for r in responses] == [200, 200]
+    assert responses[0].json() == responses[1].json()
+    assert other.status_code == 200
+    assert llm.calls == 2
+    assert [m["content"] for m in stored["messages"]] == ["Hello?", "reply 1", "Something else", "reply 2"]
+
+
+@pytest.mark.asyncio
+async def test_idempotency_key_replays_stored_result(monkeypatch):
+    """
+    Test that a retry with the same Idempotency-Key returns the first result
+    without reprocessing, that a failed attempt can be retried, and that
+    reusing a key for another body or while in progress elsewhere is refused.
+    """
+    monkeypatch.setattr(conversation.prompt_flights, "window", 0)
+    with patch("openai.resources.chat.completions.AsyncCompletions.create", new_callable=AsyncMock) as mock_create:
+        async with app.router.lifespan_context(app):
+            async with await _client_session() as client:
+                conv_id = (await client.post("/conversations/", json={"title": "Idempotent"})).json()["id"]
+                url = f"/conversations/{conv_id}/prompt"
+                prompt = {"role": "user", "content": "Book it"}
+
+                mock_create.side_effect = Exception("upstream down")
+                failed = await client.post(url, json=prompt, headers={"Idempotency-Key": "k1"})
+                assert failed.status_code == 502
+
+                mock_create.side_effect = None
+                mock_create.return_value = FakeCompletion("Booked")
+                first = await client.post(url, json=prompt, headers={"Idempotency-Key": "k1"})
+                retry = await client.post(url, json=prompt, headers={"Idempotency-Key": "k1"})
+                assert first.status_code == retry.status_code == 200
+                assert retry.json() == first.json()
+                assert mock_create.await_count == 2
+
+                reused = await client.post(
+                    url, json={"role": "user", "content": "Cancel it"}, headers={"Idempotency-Key": "k1"}
+                )
+                assert reused.status_code == 422
+
+                await IdempotencyRecord.get_motor_collection().insert_one({
+                    "scope": f"prompt:{conv_id}", "key": "k2", "request_hash": request_hash(prompt),
+                    "completed": False, "response": None,
+                    "expires_at": datetime.now(timezone.utc) + timedelta(hours=1),
+                })
+                busy = await client.post(url, json=prompt, headers={"Idempotency-Key": "k2"})
+                assert busy.status_code == 409
+
+                stored = (await client.get(f"/conversations/{conv_id}")).json()
+
+    # The failed attempt left its user message; the key's retries appended nothing more
+    assert [m["content"] for m in stored["messages"]] == ["Book it", "Book it", "Booked"]
@@ -0,0 +1,115 @@
+import time
+
+import pytest
+from beanie import PydanticObjectId
+from fastapi.testclient import TestClient
+from unittest.mock import AsyncMock, patch
+
+from app.main import app
+from app.services import embedding_index, llm_services
+from app.services.embedding_index import EmbeddingIndex, EmbeddingIndexer, EmbeddingIndexerStats, hashing_embedder
+from tests.fakes import FakeCompletion
+
+np = pytest.importorskip("numpy")
+
+
+def _indexer(tmp_path, dim=256):
+    return EmbeddingIndexer(EmbeddingIndex(str(tmp_path), f"hashing-{dim}"), hashing_embedder(dim), enabled=True)
+
+
+@pytest.mark.asyncio
+async def test_index_ranks_closest_messages_first(tmp_path):
+    indexer = _indexer(tmp_path)
+    a, b = PydanticObjectId(), PydanticObjectId()
+    await indexer.write(
+        [(a, 0), (a, 1), (b, 0)],
+        ["the quick brown fox", "completely unrelated words here", "a lazy brown dog sleeps"],
+    )
+    assert indexer.index.count() == 3
+
+    matches, partial = await indexer.search("quick brown fox", 2)
+    assert not partial
+    assert [(m.conversation_id, m.seq) for m in matches] == [(a, 0), (b, 0)]
+    assert matches[0].score == pytest.approx(3 / 12 ** 0.5)
+
+    # A different embedding model cannot be mixed into the same index
+    with pytest.raises(ValueError):
+        await _indexer(tmp_path, dim=64).write([(a, 2)], ["more"])
+
+
+def test_search_stops_at_budget_with_partial_results(tmp_path):
+    index = EmbeddingIndex(str(tmp_path), "test")
+    vectors = np.random.default_rng(0).standard_normal((2000, 8))
+    index.add([(PydanticObjectId(), i) for i in range(2000)], vectors)
+
+    with patch.object(embedding_index, "SEARCH_CHUNK_ROWS", 500), \
+            patch.object(embedding_index.time, "perf_counter", side_effect=[0.0, 0.0, 10.0]):
+        matches, partial = index.search(vectors[0], 5, budget=1.0)
+    assert partial
+    assert len(matches) == 5
+    assert matches[0].seq == 0
+
+    matches, partial = index.search(vectors[1999], 5)
+    assert not partial
+    assert matches[0].seq == 1999
+
+
+def test_prompts_are_indexed_and_searchable(tmp_path):
+    """
+    Test that messages appended by send_prompt reach the embedding index in
+    the background and come back from semantic search with their offsets.
+    """
+    indexer = llm_services.embedding_indexer
+    with patch.object(indexer, "index", EmbeddingIndex(str(tmp_path), "hashing-256")), \
+            patch.object(indexer, "embed", hashing_embedder(256)), \
+            patch.object(indexer, "enabled", True), \
+            patch.object(indexer, "stats", EmbeddingIndexerStats()), \
+            patch("openai.resources.chat.completions.AsyncCompletions.create", new_callable=AsyncMock) as mock_create:
+        mock_create.return_value = FakeCompletion("Paris, of course")
+        with TestClient(app) as client:
+            conv = client.post("/conversations/", json={"title": "Travel"}).json()
+            other = client.post("/conversations/", json={"title": "Cooking"}).json()
+            client.post(f"/conversations/{conv['id']}/prompt", json={"role": "user", "content": "capital of France"})
+            client.post(f"/conversations/{other['id']}/prompt", json={"role": "user", "content": "bake sourdough bread"})
+
+            deadline = time.monotonic() + 5
+            while indexer.stats.indexed < 4 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            assert indexer.stats.indexed == 4
+
+            resp = client.get("/search/", params={"q": "sourdough bread", "mode": "semantic", "limit": 1})
+            assert resp.status_code == 200
+            assert "X-Search-Partial" not in resp.headers
+            [result] = resp.json()
+            assert result["conversation_id"] == other["id"]
+            assert result["title"] == "Cooking"
+            assert result["message_offsets"] == [0]
+            assert result["score"] == pytest.approx(2 / 6 ** 0.5)
+
+            # Deleted conversations drop out of the results
+            params = {"q": "France or bread", "mode": "semantic"}
+            assert {r["conversation_id"] for r in client.get("/search/", params=params).json()} == {
+                conv["id"], other["id"]
+            }
+            client.delete(f"/conversations/{other['id']}")
+            assert [r["conversation_id"] for r in client.get("/search/", params=params).json()] == [conv["id"]]
+
+
+def test_disabled_semantic_search_is_rejected():
+    with TestClient(app) as client:
+        resp = client.get("/search/", params={"q": "anything", "mode": "semantic"})
+        assert resp.status_code == 400
+
+
+def test_text_search_ranks_conversations_with_offsets():
+    with TestClient(app) as client:
+        conv = client.post("/conversations/", json={"title": "Gardening"}).json()
+        with patch("openai.resources.chat.completions.AsyncCompletions.create", new_callable=AsyncMock) as mock_create:
+            mock_create.return_value = FakeCompletion("Water them weekly")
+            client.post(f"/conversations/{conv['id']}/prompt", json={"role": "user", "content": "How to grow tomatoes"})
+
+        resp = client.get("/search/", params={"q": "tomatoes"})
+        assert resp.status_code == 200
+        results = resp.json()
+        assert results[0]["conversation_id"] == conv["id"]
+        assert results[0]["message_offsets"] == [0]
@@ -0,0 +1,125 @@
+import asyncio
+
+import httpx
+import pytest
+from unittest.mock import AsyncMock, patch
+
+from app.config import settings
+from app.main import app
+from app.models import Conversation, Message
+from app.services import llm_services
+from app.services.context_builder import SUMMARY_PREFIX, ContextBuilder
+from app.services.summarizer import Summarizer
+from tests.fakes import FakeCompletion
+
+
+class StubSummaryLLM:
+    """
+    Deterministic stand-in for the summarization call: the summary is the
+    previous one plus the folded message contents. Records every call.
+    """
+
+    def __init__(self):
+        self.calls = []
+
+    async def __call__(self, previous_summary, messages):
+        contents = [m.content for m in messages]
+        self.calls.append((previous_summary, contents))
+        await asyncio.sleep(0)
+        return "|".join(filter(None, [previous_summary, ",".join(contents)]))
+
+
+async def _conversation(n):
+    conv = Conversation(title="Summarized")
+    await conv.insert()
+    await conv.append_messages(*[Message(role="user", content=f"m{i}") for i in range(n)])
+    return conv
+
+
+@pytest.mark.asyncio
+async def test_summary_is_folded_incrementally():
+    """
+    Test that old messages are folded in chunks, the newest ones are kept
+    verbatim, and later runs only send the previous summary plus new messages.
+    """
+    async with app.router.lifespan_context(app):
+        conv = await _conversation(25)
+        stub = StubSummaryLLM()
+        summarizer = Summarizer(stub, trigger_messages=10, keep_recent=4, chunk_messages=8)
+
+        assert await summarizer.run(conv.id) == 16
+        assert stub.calls == [
+            ("", [f"m{i}" for i in range(8)]),
+            (",".join(f"m{i}" for i in range(8)), [f"m{i}" for i in range(8, 16)]),
+        ]
+        stored = await Conversation.get(conv.id)
+        assert stored.summary_upto == 16
+
+        await stored.append_messages(*[Message(role="user", content=f"m{i}") for i in range(25, 35)])
+        assert summarizer.schedule(stored) is not None
+        await summarizer.stop()
+
+        stored = await Conversation.get(conv.id)
+        assert stored.summary_upto == 31
+        # Every message was sent to the summarizer exactly once
+        folded = [c for _, contents in stub.calls for c in contents]
+        assert folded == [f"m{i}" for i in range(31)]
+        assert stub.calls[2][0] == stub.calls[1][0] + "|" + ",".join(stub.calls[1][1])
+        assert stored.summary.endswith("m30")
+
+
+@pytest.mark.asyncio
+async def test_concurrent_runs_do_not_fold_twice():
+    async with app.router.lifespan_context(app):
+        conv = await _conversation(20)
+        stub = StubSummaryLLM()
+        summarizer = Summarizer(stub, trigger_messages=10, keep_recent=5, chunk_messages=100)
+
+        results = await asyncio.gather(summarizer.run(conv.id), summarizer.run(conv.id))
+        assert sorted(results) == [0, 15]
+        stored = await Conversation.get(conv.id)
+        assert stored.summary_upto == 15
+        assert stored.summary == ",".join(f"m{i}" for i in range(15))
+
+
+@pytest.mark.asyncio
+async def test_context_sends_summary_plus_recent_messages():
+    async with app.router.lifespan_context(app):
+        conv = await _conversation(20)
+        await Summarizer(StubSummaryLLM(), trigger_messages=10, keep_recent=3).run(conv.id)
+        conv = await Conversation.get(conv.id)
+
+        context = await ContextBuilder("gpt-4o-mini", budget=100000, strategy="head_tail").build(conv)
+        assert context[0] == {"role": "system", "content": SUMMARY_PREFIX + ",".join(f"m{i}" for i in range(17))}
+        assert [m["content"] for m in context[1:]] == ["m17", "m18", "m19"]
+
+
+@pytest.mark.asyncio
+async def test_prompts_trigger_background_summary(monkeypatch):
+    """
+    Test that with SUMMARY_ENABLED the prompt endpoint schedules the
+    summarizer and later prompts send the summary instead of old turns.
+    """
+    stub = StubSummaryLLM()
+    monkeypatch.setattr(settings, "SUMMARY_ENABLED", True)
+    monkeypatch.setattr(llm_services.summarizer, "summarize", stub)
+    monkeypatch.setattr(llm_services.summarizer, "trigger_messages", 4)
+    monkeypatch.setattr(llm_services.summarizer, "keep_recent", 2)
+
+    with patch("openai.resources.chat.completions.AsyncCompletions.create", new_callable=AsyncMock) as mock_create:
+        mock_create.return_value = FakeCompletion("reply")
+        async with app.router.lifespan_context(app):
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                conv_id = (await client.post("/conversations/", json={"title": "Long"})).json()["id"]
+                for i in range(3):
+                    resp = await client.post(f"/conversations/{conv_id}/prompt", json={"role": "user", "content": f"p{i}"})
+                    assert resp.status_code == 200
+                await llm_services.summarizer.stop()
+                assert stub.calls == [("", ["p0", "reply", "p1", "reply"])]
+
+                await client.post(f"/conversations/{conv_id}/prompt", json={"role": "user", "content": "p3"})
+
+    sent = mock_create.call_args.kwargs["messages"]
+    assert sent[0]["role"] == "system" and sent[0]["content"].endswith("p0,reply,p1,reply")
+    assert [m["content"] for m in sent[1:]] == ["p2", "reply", "p3"]